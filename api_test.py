@@ -3,40 +3,119 @@ This file is for backend testing, and defines the main FastAPI app and routes.
 It acts as the 'controller' layer, handling requests and responses for testing.
 """
 
-from fastapi import FastAPI, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from database import SessionLocal, engine, Base
-from datetime import date, timedelta
-import models, crud, schemas
-
-# Create database tables at startup if they don't exist
-Base.metadata.create_all(bind=engine)
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
+from fastapi import FastAPI, Depends, HTTPException, Path, Query, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, async_engine, engine
+from migrations import run_migrations
+from report_jobs import get_report_job, report_jobs, submit_report_job
+import crud, async_crud, schemas, export, metrics, query_debug, reference_data, sales_analytics, search
+
+# Create database tables and indexes at startup if they don't exist
+run_migrations(engine)
+
+# Close the async connection pool (and stop the report jobs) when the server stops
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    report_jobs.shutdown()
+    await async_engine.dispose()
 
 # Create FastAPI app instance
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# SQL count, DB time and latency per request (Server-Timing header + /metrics)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# N+1 and slow-query detection for development/staging (QUERY_DEBUG=true)
+if query_debug.QUERY_DEBUG:
+    app.add_middleware(query_debug.QueryDebugMiddleware)
 
 # Dependency: Get DB session for each request
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+# Keyset pagination: the next page is requested with ?after_id=<X-Next-After-Id>
+def set_next_page_header(response: Response, next_after_id):
+    if next_after_id is not None:
+        response.headers["X-Next-After-Id"] = str(next_after_id)
 
 # ---------- Root test route ----------
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "BeSpoked Bikes App is running!"}
 
+# ---------- METRICS ----------
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    """
+    Per-route histograms of latency, DB time, render time and SQL statement count
+    in the Prometheus text format.
+    """
+    return metrics.render_metrics()
+
+@app.get("/debug/queries")
+async def read_query_report():
+    """
+    Statements per route and fingerprint, likely N+1 patterns first, then by total time.
+    Only collected when QUERY_DEBUG=true.
+    """
+    if not query_debug.QUERY_DEBUG:
+        raise HTTPException(status_code=404, detail="Set QUERY_DEBUG=true to collect query reports.")
+    return query_debug.query_report.rows()
+
+# ---------- TYPEAHEAD ----------
+
+@app.get("/typeahead/{entity}")
+async def typeahead(
+    entity: str = Path(..., pattern="^(products|salespersons|customers)$"),
+    q: str = Query("", max_length=100, description="Start of any word of the name, or an id"),
+    limit: int = Query(reference_data.TYPEAHEAD_LIMIT, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Up to limit {id, name} matches from the cached reference data, for search boxes
+    that replace dropdowns listing the whole table.
+    """
+    results = await async_crud.search_reference_data(db, entity, q, limit)
+    return [{"id": item_id, "name": name} for item_id, name in results]
+
+# ---------- SEARCH ----------
+
+@app.get("/search")
+async def search_records(
+    q: str = Query(..., min_length=1, max_length=100, description="Words to find in names, phone numbers, manufacturers or styles"),
+    entity: str | None = Query(None, pattern="^(products|salespersons|customers)$", description="Only search this entity"),
+    limit: int = Query(search.SEARCH_LIMIT, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Customers, salespersons and products matching every word of q anywhere in their
+    names, phone numbers, manufacturer or style, best matches first.
+    Words shorter than 3 characters alone match the start of names and phone numbers.
+    """
+    return await async_crud.search_entities(db, q, [entity] if entity else None, limit)
+
 # ---------- PRODUCTS ----------
 
 @app.get("/products/", response_model=list[schemas.Product])
-def read_products(db: Session = Depends(get_db)):
-    return crud.get_products(db)
+async def read_products(
+    response: Response,
+    after_id: int = Query(0, ge=0, description="Return rows with id greater than this"),
+    limit: int = Query(crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    products, next_after_id = await async_crud.get_products_page(db, after_id, limit)
+    set_next_page_header(response, next_after_id)
+    return products
 
 @app.post("/products/", response_model=schemas.Product)
-def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
+async def create_product(product: schemas.ProductCreate, db: AsyncSession = Depends(get_db)):
     """
     Creates a new product if it does not already exist.
     Normalizes all string fields (strip + lowercase) for clean storage and duplicate prevention.
@@ -47,14 +126,14 @@ def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)
     product.style = product.style.strip().lower()
 
     # Check for existing product
-    db_product = db.query(models.Product).filter(models.Product.name == product.name).first()
+    db_product = await async_crud.get_product_by_name(db, product.name)
     if db_product:
         raise HTTPException(status_code=400, detail="Product already exists.")
 
-    return crud.create_product(db, product)
+    return await async_crud.create_product(db, product)
 
 @app.put("/products/{product_id}", response_model=schemas.Product)
-def update_product(product_id: int, product: schemas.ProductCreate, db: Session = Depends(get_db)):
+async def update_product(product_id: int, product: schemas.ProductCreate, db: AsyncSession = Depends(get_db)):
     """
     Updates an existing product.
     Normalizes string fields (name, manufacturer, style).
@@ -64,28 +143,34 @@ def update_product(product_id: int, product: schemas.ProductCreate, db: Session
     product.manufacturer = product.manufacturer.strip().lower()
     product.style = product.style.strip().lower()
 
-    db_product = crud.update_product(db, product_id, product)
+    db_product = await async_crud.update_product(db, product_id, product)
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found.")
     return db_product
 
 @app.delete("/products/{product_id}")
-def delete_product(product_id: int, db: Session = Depends(get_db)):
-    db_product = crud.get_product(db, product_id)
+async def delete_product(product_id: int, db: AsyncSession = Depends(get_db)):
+    db_product = await async_crud.get_product(db, product_id)
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found.")
-    db.delete(db_product)
-    db.commit()
+    await async_crud.delete_product(db, db_product)
     return {"detail": "Product deleted successfully."}
 
 # ---------- SALESPERSONS ----------
 
 @app.get("/salespersons/", response_model=list[schemas.Salesperson])
-def read_salespersons(db: Session = Depends(get_db)):
-    return crud.get_salespersons(db)
+async def read_salespersons(
+    response: Response,
+    after_id: int = Query(0, ge=0, description="Return rows with id greater than this"),
+    limit: int = Query(crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    salespersons, next_after_id = await async_crud.get_salespersons_page(db, after_id, limit)
+    set_next_page_header(response, next_after_id)
+    return salespersons
 
 @app.post("/salespersons/", response_model=schemas.Salesperson)
-def create_salesperson(salesperson: schemas.SalespersonCreate, db: Session = Depends(get_db)):
+async def create_salesperson(salesperson: schemas.SalespersonCreate, db: AsyncSession = Depends(get_db)):
     """
     Creates a new salesperson if they do not already exist.
     Normalizes all string fields: first_name, last_name, address, manager (strip + lowercase), phone (strip only).
@@ -98,18 +183,16 @@ def create_salesperson(salesperson: schemas.SalespersonCreate, db: Session = Dep
     salesperson.phone = salesperson.phone.strip()
 
     # Check for existing salesperson
-    db_salesperson = db.query(models.Salesperson).filter(
-        models.Salesperson.first_name == salesperson.first_name,
-        models.Salesperson.last_name == salesperson.last_name,
-        models.Salesperson.phone == salesperson.phone
-    ).first()
+    db_salesperson = await async_crud.find_salesperson(
+        db, salesperson.first_name, salesperson.last_name, salesperson.phone
+    )
     if db_salesperson:
         raise HTTPException(status_code=400, detail="Salesperson already exists.")
 
-    return crud.create_salesperson(db, salesperson)
+    return await async_crud.create_salesperson(db, salesperson)
 
 @app.put("/salespersons/{salesperson_id}", response_model=schemas.Salesperson)
-def update_salesperson(salesperson_id: int, salesperson: schemas.SalespersonCreate, db: Session = Depends(get_db)):
+async def update_salesperson(salesperson_id: int, salesperson: schemas.SalespersonCreate, db: AsyncSession = Depends(get_db)):
     """
     Updates an existing salesperson.
     Normalizes string fields (first_name, last_name, manager) with strip + lowercase.
@@ -122,28 +205,34 @@ def update_salesperson(salesperson_id: int, salesperson: schemas.SalespersonCrea
     salesperson.manager = salesperson.manager.strip().lower()
     salesperson.phone = salesperson.phone.strip()
 
-    db_salesperson = crud.update_salesperson(db, salesperson_id, salesperson)
+    db_salesperson = await async_crud.update_salesperson(db, salesperson_id, salesperson)
     if not db_salesperson:
         raise HTTPException(status_code=404, detail="Salesperson not found.")
     return db_salesperson
 
 @app.delete("/salespersons/{salesperson_id}")
-def delete_salesperson(salesperson_id: int, db: Session = Depends(get_db)):
-    db_salesperson = crud.get_salesperson(db, salesperson_id)
+async def delete_salesperson(salesperson_id: int, db: AsyncSession = Depends(get_db)):
+    db_salesperson = await async_crud.get_salesperson(db, salesperson_id)
     if not db_salesperson:
         raise HTTPException(status_code=404, detail="Salesperson not found.")
-    db.delete(db_salesperson)
-    db.commit()
+    await async_crud.delete_salesperson(db, db_salesperson)
     return {"detail": "Salesperson deleted successfully."}
 
 # ---------- CUSTOMERS ----------
 
 @app.get("/customers/", response_model=list[schemas.Customer])
-def read_customers(db: Session = Depends(get_db)):
-    return crud.get_customers(db)
+async def read_customers(
+    response: Response,
+    after_id: int = Query(0, ge=0, description="Return rows with id greater than this"),
+    limit: int = Query(crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    customers, next_after_id = await async_crud.get_customers_page(db, after_id, limit)
+    set_next_page_header(response, next_after_id)
+    return customers
 
 @app.post("/customers/", response_model=schemas.Customer)
-def create_customer(customer: schemas.CustomerCreate, db: Session = Depends(get_db)):
+async def create_customer(customer: schemas.CustomerCreate, db: AsyncSession = Depends(get_db)):
     """
     Creates a new customer.
     Normalizes first_name and last_name (strip + lowercase), address and phone (strip only).
@@ -155,10 +244,10 @@ def create_customer(customer: schemas.CustomerCreate, db: Session = Depends(get_
     customer.address = customer.address.strip().lower()
     customer.phone = customer.phone.strip()
 
-    return crud.create_customer(db, customer)
+    return await async_crud.create_customer(db, customer)
 
 @app.put("/customers/{customer_id}", response_model=schemas.Customer)
-def update_customer(customer_id: int, customer: schemas.CustomerCreate, db: Session = Depends(get_db)):
+async def update_customer(customer_id: int, customer: schemas.CustomerCreate, db: AsyncSession = Depends(get_db)):
     """
     Updates an existing customer.
     Normalizes first_name and last_name (strip + lowercase), address and phone (strip only).
@@ -168,153 +257,238 @@ def update_customer(customer_id: int, customer: schemas.CustomerCreate, db: Sess
     customer.address = customer.address.strip().lower()
     customer.phone = customer.phone.strip()
 
-    db_customer = crud.update_customer(db, customer_id, customer)
+    db_customer = await async_crud.update_customer(db, customer_id, customer)
     if not db_customer:
         raise HTTPException(status_code=404, detail="Customer not found.")
     return db_customer
 
 @app.delete("/customers/{customer_id}")
-def delete_customer(customer_id: int, db: Session = Depends(get_db)):
-    db_customer = crud.get_customer(db, customer_id)
+async def delete_customer(customer_id: int, db: AsyncSession = Depends(get_db)):
+    db_customer = await async_crud.get_customer(db, customer_id)
     if not db_customer:
         raise HTTPException(status_code=404, detail="Customer not found.")
-    db.delete(db_customer)
-    db.commit()
+    await async_crud.delete_customer(db, db_customer)
     return {"detail": "Customer deleted successfully."}
 
 # ---------- SALES ----------
 
 @app.get("/sales/", response_model=list[schemas.Sale])
-def read_sales(db: Session = Depends(get_db)):
-    return crud.get_sales(db)
+async def read_sales(
+    response: Response,
+    after_id: int = Query(0, ge=0, description="Return rows with id greater than this"),
+    limit: int = Query(crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    sales, next_after_id = await async_crud.get_sales_page(db, after_id, limit)
+    set_next_page_header(response, next_after_id)
+    return sales
 
 @app.post("/sales/", response_model=schemas.Sale)
-def create_sale(sale: schemas.SaleCreate, db: Session = Depends(get_db)):
+async def create_sale(sale: schemas.SaleCreate, db: AsyncSession = Depends(get_db)):
     """
     Creates a new sale record.
     Sales uses IDs only so no normalization is needed.
     """
-    return crud.create_sale(db, sale)
+    try:
+        return await async_crud.create_sale(db, sale)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/sales/bulk", response_model=schemas.SaleBulkResult)
+async def create_sales_bulk(sales: list[schemas.SaleCreate], db: AsyncSession = Depends(get_db)):
+    """
+    Creates a batch of sales (e.g. a POS terminal sync) in one transaction.
+    Rows that are over stock or reference a missing product are skipped and
+    reported in "errors" with their index in the batch.
+    """
+    try:
+        return await async_crud.create_sales_bulk(db, sales)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.put("/sales/{sale_id}", response_model=schemas.Sale)
-def update_sale(sale_id: int, sale: schemas.SaleCreate, db: Session = Depends(get_db)):
+async def update_sale(sale_id: int, sale: schemas.SaleCreate, db: AsyncSession = Depends(get_db)):
     """
     Updates an existing sale.
     No normalization needed (no string fields).
     """
-    db_sale = crud.update_sale(db, sale_id, sale)
+    db_sale = await async_crud.update_sale(db, sale_id, sale)
     if not db_sale:
         raise HTTPException(status_code=404, detail="Sale not found.")
     return db_sale
 
 @app.delete("/sales/{sale_id}")
-def delete_sale(sale_id: int, db: Session = Depends(get_db)):
-    db_sale = crud.get_sale(db, sale_id)
+async def delete_sale(sale_id: int, db: AsyncSession = Depends(get_db)):
+    db_sale = await async_crud.get_sale(db, sale_id)
     if not db_sale:
         raise HTTPException(status_code=404, detail="Sale not found.")
-    crud.delete_sale(db, db_sale)
-    db.commit()
+    await async_crud.delete_sale(db, db_sale)
+    await db.commit()
     return {"detail": "Sale deleted successfully."}
 
 # ---------- DISCOUNTS ----------
 
 @app.get("/discounts/", response_model=list[schemas.Discount])
-def read_discounts(db: Session = Depends(get_db)):
-    return crud.get_discounts(db)
+async def read_discounts(
+    response: Response,
+    after_id: int = Query(0, ge=0, description="Return rows with id greater than this"),
+    limit: int = Query(crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    discounts, next_after_id = await async_crud.get_discounts_page(db, after_id, limit)
+    set_next_page_header(response, next_after_id)
+    return discounts
 
 @app.post("/discounts/", response_model=schemas.Discount)
-def create_discount(discount: schemas.DiscountCreate, db: Session = Depends(get_db)):
+async def create_discount(discount: schemas.DiscountCreate, db: AsyncSession = Depends(get_db)):
     """
     Creates a new discount.
     No normalization needed (no string fields).
     """
-    return crud.create_discount(db, discount)
+    return await async_crud.create_discount(db, discount)
 
 @app.put("/discounts/{discount_id}", response_model=schemas.Discount)
-def update_discount_route(discount_id: int, discount: schemas.DiscountCreate, db: Session = Depends(get_db)):
+async def update_discount_route(discount_id: int, discount: schemas.DiscountCreate, db: AsyncSession = Depends(get_db)):
     """
     Updates an existing discount.
     No normalization needed (no string fields).
     """
-    db_discount = crud.update_discount(db, discount_id, discount)
+    db_discount = await async_crud.update_discount(db, discount_id, discount)
     if not db_discount:
         raise HTTPException(status_code=404, detail="Discount not found.")
     return db_discount
 
 @app.delete("/discounts/{discount_id}")
-def delete_discount(discount_id: int, db: Session = Depends(get_db)):
-    db_discount = crud.get_discount(db, discount_id)
+async def delete_discount(discount_id: int, db: AsyncSession = Depends(get_db)):
+    db_discount = await async_crud.get_discount(db, discount_id)
     if not db_discount:
         raise HTTPException(status_code=404, detail="Discount not found.")
-    db.delete(db_discount)
-    db.commit()
+    await async_crud.delete_discount(db, db_discount)
     return {"detail": "Discount deleted successfully."}
 
+# ---------- EXPORTS ----------
+
+@app.get("/export/sales")
+async def export_sales(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start_date: date | None = None,
+    end_date: date | None = None,
+    salesperson_id: int | None = None,
+    product_id: int | None = None
+):
+    """
+    Streams every matching sale (with discounted price and commission) as CSV or NDJSON.
+    """
+    query = export.sales_export_query(
+        start_date=start_date, end_date=end_date,
+        salesperson_id=salesperson_id, product_id=product_id
+    )
+    return export.export_response(query, format, "sales")
+
+@app.get("/export/commission_report")
+async def export_commission_report(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start_date: date | None = None,
+    end_date: date | None = None,
+    salesperson_id: int | None = None,
+    product_id: int | None = None
+):
+    """
+    Streams the commission report for any date range as CSV or NDJSON.
+    """
+    query = export.commission_export_query(
+        start_date=start_date, end_date=end_date,
+        salesperson_id=salesperson_id, product_id=product_id
+    )
+    return export.export_response(query, format, "commission_report")
+
+# ---------- ANALYTICS ----------
+
+@app.get("/analytics/sales_series")
+async def get_sales_series(
+    start_date: date,
+    end_date: date,
+    bucket: str = Query("month", pattern="^(day|week|month|quarter|year)$"),
+    group_by: str = Query("none", pattern="^(none|product|manufacturer|style|salesperson)$"),
+    product_id: int | None = None,
+    salesperson_id: int | None = None,
+    manufacturer: str | None = None,
+    style: str | None = None,
+    limit: int = Query(sales_analytics.DEFAULT_SERIES_LIMIT, ge=1, le=sales_analytics.MAX_SERIES_LIMIT,
+                       description="Number of groups returned, largest sales amount first"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Number of sales, sales amount, discount amount and commission per bucket between
+    the dates, as one series or one per product/manufacturer/style/salesperson.
+    Answered from the daily sales rollup, not the sales table.
+    """
+    try:
+        return await async_crud.get_sales_series(
+            db, start_date, end_date, bucket, group_by,
+            product_id=product_id, salesperson_id=salesperson_id,
+            manufacturer=manufacturer, style=style, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # ---------- COMMISSION REPORT ----------
 
 @app.get("/commission_report/")
-def get_commission_report(
+async def get_commission_report(
+    response: Response,
     year: int = Query(..., description="Year for the report"),
     quarter: int = Query(..., ge=1, le=4, description="Quarter (1-4) for the report"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Calculates and returns the quarterly commission report for all salespersons.
+    X-Cache is HIT when the report came from the report cache, MISS otherwise.
+    """
+    report, cache_hit = await async_crud.get_commission_report(db, year, quarter)
+    response.headers["X-Cache"] = "HIT" if cache_hit else "MISS"
+    return report
+
+# ---------- REPORT JOBS ----------
+
+@app.post("/jobs/commission_report", status_code=202)
+async def submit_commission_report_job(
+    response: Response,
+    year: int = Query(..., description="Year for the report, 0 for all years"),
+    quarter: int = Query(0, ge=0, le=4, description="Quarter (1-4), 0 for the whole year"),
+    source: str = Query("rollup", pattern="^(rollup|live|parallel|incremental)$",
+                        description="rollup table, live from the sales, live split across processes, "
+                                    "or incremental (only the sales changed since the last run)")
+):
     """
+    Queues the commission report and returns its job at once (an unfinished job
+    for the same report, or a finished one that is still current, is reused).
+    Poll /jobs/{id} or stream /jobs/{id}/events until it is done.
+    """
+    job_id, _ = await submit_report_job(year, quarter, source)
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return await get_report_job(job_id)
 
-    # Calculate quarter start and end dates
-    quarter_start_month = (quarter - 1) * 3 + 1
-    quarter_end_month = quarter_start_month + 2
-
-    from datetime import date
-    quarter_start = date(year, quarter_start_month, 1)
-    if quarter_end_month == 12:
-        quarter_end = date(year, 12, 31)
-    else:
-        quarter_end = date(year, quarter_end_month + 1, 1) - timedelta(days=1)
-
-    report = []
-
-    salespersons = db.query(models.Salesperson).all()
-
-    for sp in salespersons:
-        sales = db.query(models.Sale).filter(
-            models.Sale.salesperson_id == sp.id,
-            and_(
-                models.Sale.sales_date >= quarter_start,
-                models.Sale.sales_date <= quarter_end
-            )
-        ).all()
-
-        num_sales = len(sales)
-        total_sales_amount = 0.0
-        total_commission = 0.0
-
-        for sale in sales:
-            product = sale.product
-            price = product.sale_price
-
-            # Check if any discount applied to this product at time of sale
-            discount = db.query(models.Discount).filter(
-                models.Discount.product_id == product.id,
-                models.Discount.begin_date <= sale.sales_date,
-                models.Discount.end_date >= sale.sales_date
-            ).first()
-
-            if discount:
-                price = price * (1 - discount.discount_percentage / 100)
-
-            commission = price * (product.commission_percentage / 100)
-            total_sales_amount += price
-            total_commission += commission
-
-        report.append({
-            "salesperson_id": sp.id,
-            "first_name": sp.first_name,
-            "last_name": sp.last_name,
-            "num_sales": num_sales,
-            "total_sales_amount": round(total_sales_amount, 2),
-            "total_commission": round(total_commission, 2)
-        })
-
-    return report
\ No newline at end of file
+@app.get("/jobs/{job_id}")
+async def read_job(job_id: str):
+    """
+    Status and progress (0 to 1) of a report job, and the report once it is done.
+    """
+    return await get_report_job(job_id)
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Server-sent events with the job's status and progress until it is finished.
+    """
+    await get_report_job(job_id, with_result=False)
+    return StreamingResponse(report_jobs.events(job_id), media_type="text/event-stream")
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancels a queued job, or stops a running one after its current step.
+    """
+    await get_report_job(job_id, with_result=False)
+    await asyncio.to_thread(report_jobs.store.cancel, job_id)
+    return await get_report_job(job_id, with_result=False)
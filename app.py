@@ -3,52 +3,115 @@ This file defines the main FastAPI app and routes.
 It acts as the 'controller' layer, handling requests and responses.
 """
 
-from fastapi import FastAPI, Request, Form, Depends, HTTPException
-from fastapi.responses import RedirectResponse
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
+from fastapi import FastAPI, Request, Response, Form, Depends, HTTPException, Path, Query
+from fastapi.responses import PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
-import models, crud, schemas
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, async_engine, engine
+from migrations import run_migrations
+from report_jobs import get_report_job, report_jobs, submit_report_job
+import crud, async_crud, schemas, commission_report, export, metrics, query_debug, reference_data, sales_analytics, search
 
-# initializes db on startup if not done already
-Base.metadata.create_all(bind=engine)
+# initializes db on startup if not done already (and adds any new indexes)
+run_migrations(engine)
 
-app = FastAPI(title="BeSpoked Bikes Client App")
+# close the async connection pool (and stop the report jobs) when the server stops
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    report_jobs.shutdown()
+    await async_engine.dispose()
 
-# Setup Jinja2 templates
-templates = Jinja2Templates(directory="templates")
+app = FastAPI(title="BeSpoked Bikes Client App", lifespan=lifespan)
+
+# SQL count, DB/render time and latency per request (Server-Timing header + /metrics)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# N+1 and slow-query detection for development/staging (QUERY_DEBUG=true)
+if query_debug.QUERY_DEBUG:
+    app.add_middleware(query_debug.QueryDebugMiddleware)
+
+# Setup Jinja2 templates (render time is recorded by metrics)
+templates = metrics.instrument_templates(Jinja2Templates(directory="templates"))
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 # ---------- Home Page ----------
 
 @app.get("/")
-def home(request: Request):
+async def home(request: Request):
     return templates.TemplateResponse("home.html", {"request": request})
 
+# ---------- Metrics ----------
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def read_metrics():
+    return metrics.render_metrics()
+
+@app.get("/debug/queries", include_in_schema=False)
+async def read_query_report():
+    if not query_debug.QUERY_DEBUG:
+        raise HTTPException(status_code=404, detail="Set QUERY_DEBUG=true to collect query reports.")
+    return query_debug.query_report.rows()
+
+# ---------- Typeahead ----------
+
+@app.get("/typeahead/{entity}")
+async def typeahead(
+    entity: str = Path(..., pattern="^(products|salespersons|customers)$"),
+    q: str = Query("", max_length=100),
+    limit: int = Query(reference_data.TYPEAHEAD_LIMIT, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    # suggestions for the search boxes that replace long <select> lists
+    results = await async_crud.search_reference_data(db, entity, q, limit)
+    return [{"id": item_id, "name": name} for item_id, name in results]
+
+# ---------- Search ----------
+
+@app.get("/search")
+async def search_records(
+    q: str = Query(..., min_length=1, max_length=100),
+    entity: str | None = Query(None, pattern="^(products|salespersons|customers)$"),
+    limit: int = Query(search.SEARCH_LIMIT, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    return await async_crud.search_entities(db, q, [entity] if entity else None, limit)
+
 # ---------- Products Pages ----------
 
 @app.get("/products/")
-def list_products(request: Request, db: Session = Depends(get_db)):
-    products = crud.get_products(db)
-    return templates.TemplateResponse("products/list.html", {"request": request, "products": products})
+async def list_products(
+    request: Request,
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    products, next_after_id = await async_crud.get_products_page(db, after_id, limit)
+    return templates.TemplateResponse("products/list.html", {
+        "request": request,
+        "products": products,
+        "after_id": after_id,
+        "next_after_id": next_after_id,
+        "limit": limit
+    })
 
 @app.get("/products/create/")
-def create_product_form(request: Request):
+async def create_product_form(request: Request):
     return templates.TemplateResponse("products/create.html", {"request": request})
 
 @app.post("/products/create/")
-def create_product(
+async def create_product(
     request: Request,
     name: str = Form(...),
     manufacturer: str = Form(...),
@@ -57,14 +120,14 @@ def create_product(
     sale_price: float = Form(...),
     qty_on_hand: int = Form(...),
     commission_percentage: float = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # normalize
     name = name.strip().lower()
     manufacturer = manufacturer.strip().lower()
     style = style.strip().lower()
 
-    existing = db.query(models.Product).filter(models.Product.name == name).first()
+    existing = await async_crud.get_product_by_name(db, name)
     if existing:
         raise HTTPException(status_code=400, detail="Product already exists.")
 
@@ -77,18 +140,18 @@ def create_product(
         qty_on_hand=qty_on_hand,
         commission_percentage=commission_percentage
     )
-    crud.create_product(db, product)
+    await async_crud.create_product(db, product)
     return RedirectResponse(url="/products/", status_code=303)
 
 @app.get("/products/{product_id}/edit/")
-def edit_product_form(product_id: int, request: Request, db: Session = Depends(get_db)):
-    product = crud.get_product(db, product_id)
+async def edit_product_form(product_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    product = await async_crud.get_product(db, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found.")
     return templates.TemplateResponse("products/edit.html", {"request": request, "product": product})
 
 @app.post("/products/{product_id}/edit/")
-def update_product(
+async def update_product(
     product_id: int,
     request: Request,
     name: str = Form(...),
@@ -98,7 +161,7 @@ def update_product(
     sale_price: float = Form(...),
     qty_on_hand: int = Form(...),
     commission_percentage: float = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     product_data = schemas.ProductCreate(
         name=name.strip().lower(),
@@ -109,32 +172,42 @@ def update_product(
         qty_on_hand=qty_on_hand,
         commission_percentage=commission_percentage
     )
-    updated = crud.update_product(db, product_id, product_data)
+    updated = await async_crud.update_product(db, product_id, product_data)
     if not updated:
         raise HTTPException(status_code=404, detail="Product not found.")
     return RedirectResponse(url="/products/", status_code=303)
 
 @app.post("/products/{product_id}/delete/")
-def delete_product(product_id: int, db: Session = Depends(get_db)):
-    product = crud.get_product(db, product_id)
+async def delete_product(product_id: int, db: AsyncSession = Depends(get_db)):
+    product = await async_crud.get_product(db, product_id)
     if product:
-        db.delete(product)
-        db.commit()
+        await async_crud.delete_product(db, product)
     return RedirectResponse(url="/products/", status_code=303)
 
 # ---------- Salespersons Pages ----------
 
 @app.get("/salespersons/")
-def list_salespersons(request: Request, db: Session = Depends(get_db)):
-    salespersons = crud.get_salespersons(db)
-    return templates.TemplateResponse("salespersons/list.html", {"request": request, "salespersons": salespersons})
+async def list_salespersons(
+    request: Request,
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    salespersons, next_after_id = await async_crud.get_salespersons_page(db, after_id, limit)
+    return templates.TemplateResponse("salespersons/list.html", {
+        "request": request,
+        "salespersons": salespersons,
+        "after_id": after_id,
+        "next_after_id": next_after_id,
+        "limit": limit
+    })
 
 @app.get("/salespersons/create/")
-def create_salesperson_form(request: Request):
+async def create_salesperson_form(request: Request):
     return templates.TemplateResponse("salespersons/create.html", {"request": request})
 
 @app.post("/salespersons/create/")
-def create_salesperson(
+async def create_salesperson(
     request: Request,
     first_name: str = Form(...),
     last_name: str = Form(...),
@@ -143,7 +216,7 @@ def create_salesperson(
     start_date: str = Form(...),
     termination_date: str = Form(None),
     manager: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # normalize
     first_name = first_name.strip().lower()
@@ -152,11 +225,7 @@ def create_salesperson(
     manager = manager.strip().lower()
     phone = phone.strip()
 
-    existing = db.query(models.Salesperson).filter(
-        models.Salesperson.first_name == first_name,
-        models.Salesperson.last_name == last_name,
-        models.Salesperson.phone == phone
-    ).first()
+    existing = await async_crud.find_salesperson(db, first_name, last_name, phone)
     if existing:
         raise HTTPException(status_code=400, detail="Salesperson already exists.")
 
@@ -169,18 +238,18 @@ def create_salesperson(
         termination_date=termination_date if termination_date else None,
         manager=manager
     )
-    crud.create_salesperson(db, sp_data)
+    await async_crud.create_salesperson(db, sp_data)
     return RedirectResponse(url="/salespersons/", status_code=303)
 
 @app.get("/salespersons/{salesperson_id}/edit/")
-def edit_salesperson_form(salesperson_id: int, request: Request, db: Session = Depends(get_db)):
-    sp = crud.get_salesperson(db, salesperson_id)
+async def edit_salesperson_form(salesperson_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    sp = await async_crud.get_salesperson(db, salesperson_id)
     if not sp:
         raise HTTPException(status_code=404, detail="Salesperson not found.")
     return templates.TemplateResponse("salespersons/edit.html", {"request": request, "sp": sp})
 
 @app.post("/salespersons/{salesperson_id}/edit/")
-def update_salesperson(
+async def update_salesperson(
     salesperson_id: int,
     request: Request,
     first_name: str = Form(...),
@@ -190,7 +259,7 @@ def update_salesperson(
     start_date: str = Form(...),
     termination_date: str = Form(None),
     manager: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     sp_data = schemas.SalespersonCreate(
         first_name=first_name.strip().lower(),
@@ -201,39 +270,49 @@ def update_salesperson(
         termination_date=termination_date if termination_date else None,
         manager=manager.strip().lower()
     )
-    updated = crud.update_salesperson(db, salesperson_id, sp_data)
+    updated = await async_crud.update_salesperson(db, salesperson_id, sp_data)
     if not updated:
         raise HTTPException(status_code=404, detail="Salesperson not found.")
     return RedirectResponse(url="/salespersons/", status_code=303)
 
 @app.post("/salespersons/{salesperson_id}/delete/")
-def delete_salesperson(salesperson_id: int, db: Session = Depends(get_db)):
-    sp = crud.get_salesperson(db, salesperson_id)
+async def delete_salesperson(salesperson_id: int, db: AsyncSession = Depends(get_db)):
+    sp = await async_crud.get_salesperson(db, salesperson_id)
     if sp:
-        db.delete(sp)
-        db.commit()
+        await async_crud.delete_salesperson(db, sp)
     return RedirectResponse(url="/salespersons/", status_code=303)
 
 # ---------- Customers Pages ----------
 
 @app.get("/customers/")
-def list_customers(request: Request, db: Session = Depends(get_db)):
-    customers = crud.get_customers(db)
-    return templates.TemplateResponse("customers/list.html", {"request": request, "customers": customers})
+async def list_customers(
+    request: Request,
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    customers, next_after_id = await async_crud.get_customers_page(db, after_id, limit)
+    return templates.TemplateResponse("customers/list.html", {
+        "request": request,
+        "customers": customers,
+        "after_id": after_id,
+        "next_after_id": next_after_id,
+        "limit": limit
+    })
 
 @app.get("/customers/create/")
-def create_customer_form(request: Request):
+async def create_customer_form(request: Request):
     return templates.TemplateResponse("customers/create.html", {"request": request})
 
 @app.post("/customers/create/")
-def create_customer(
+async def create_customer(
     request: Request,
     first_name: str = Form(...),
     last_name: str = Form(...),
     address: str = Form(...),
     phone: str = Form(...),
     start_date: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     customer_data = schemas.CustomerCreate(
         first_name=first_name.strip().lower(),
@@ -242,18 +321,18 @@ def create_customer(
         phone=phone.strip(),
         start_date=start_date
     )
-    crud.create_customer(db, customer_data)
+    await async_crud.create_customer(db, customer_data)
     return RedirectResponse(url="/customers/", status_code=303)
 
 @app.get("/customers/{customer_id}/edit/")
-def edit_customer_form(customer_id: int, request: Request, db: Session = Depends(get_db)):
-    customer = crud.get_customer(db, customer_id)
+async def edit_customer_form(customer_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    customer = await async_crud.get_customer(db, customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found.")
     return templates.TemplateResponse("customers/edit.html", {"request": request, "customer": customer})
 
 @app.post("/customers/{customer_id}/edit/")
-def update_customer(
+async def update_customer(
     customer_id: int,
     request: Request,
     first_name: str = Form(...),
@@ -261,7 +340,7 @@ def update_customer(
     address: str = Form(...),
     phone: str = Form(...),
     start_date: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     customer_data = schemas.CustomerCreate(
         first_name=first_name.strip().lower(),
@@ -270,31 +349,42 @@ def update_customer(
         phone=phone.strip(),
         start_date=start_date
     )
-    updated = crud.update_customer(db, customer_id, customer_data)
+    updated = await async_crud.update_customer(db, customer_id, customer_data)
     if not updated:
         raise HTTPException(status_code=404, detail="Customer not found.")
     return RedirectResponse(url="/customers/", status_code=303)
 
 @app.post("/customers/{customer_id}/delete/")
-def delete_customer(customer_id: int, db: Session = Depends(get_db)):
-    customer = crud.get_customer(db, customer_id)
+async def delete_customer(customer_id: int, db: AsyncSession = Depends(get_db)):
+    customer = await async_crud.get_customer(db, customer_id)
     if customer:
-        db.delete(customer)
-        db.commit()
+        await async_crud.delete_customer(db, customer)
     return RedirectResponse(url="/customers/", status_code=303)
 
 # ---------- Sales Pages ----------
 
 @app.get("/sales/")
-def list_sales(request: Request, db: Session = Depends(get_db)):
-    sales = crud.get_sales(db)
-    return templates.TemplateResponse("sales/list.html", {"request": request, "sales": sales})
+async def list_sales(
+    request: Request,
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    # the template shows each sale's product, salesperson and customer
+    sales, next_after_id = await async_crud.get_sales_page(db, after_id, limit, load="joined")
+    return templates.TemplateResponse("sales/list.html", {
+        "request": request,
+        "sales": sales,
+        "after_id": after_id,
+        "next_after_id": next_after_id,
+        "limit": limit
+    })
 
 @app.get("/sales/create/")
-def create_sale_form(request: Request, db: Session = Depends(get_db)):
-    products = crud.get_products(db)
-    salespersons = crud.get_salespersons(db)
-    customers = crud.get_customers(db)
+async def create_sale_form(request: Request, db: AsyncSession = Depends(get_db)):
+    products = await async_crud.get_form_options(db, "products")
+    salespersons = await async_crud.get_form_options(db, "salespersons")
+    customers = await async_crud.get_form_options(db, "customers")
     return templates.TemplateResponse("sales/create.html", {
         "request": request,
         "products": products,
@@ -303,13 +393,13 @@ def create_sale_form(request: Request, db: Session = Depends(get_db)):
     })
 
 @app.post("/sales/create/")
-def create_sale(
+async def create_sale(
     request: Request,
     product_id: int = Form(...),
     salesperson_id: int = Form(...),
     customer_id: int = Form(...),
     sales_date: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         sale_data = schemas.SaleCreate(
@@ -318,12 +408,13 @@ def create_sale(
             customer_id=customer_id,
             sales_date=sales_date
         )
-        crud.create_sale(db, sale_data)
+        await async_crud.create_sale(db, sale_data)
         return RedirectResponse(url="/sales/", status_code=303)
     except ValueError as e:
-        products = crud.get_products(db)
-        salespersons = crud.get_salespersons(db)
-        customers = crud.get_customers(db)
+        # keep what was picked
+        products = await async_crud.get_form_options(db, "products", product_id)
+        salespersons = await async_crud.get_form_options(db, "salespersons", salesperson_id)
+        customers = await async_crud.get_form_options(db, "customers", customer_id)
         return templates.TemplateResponse("sales/create.html", {
             "request": request,
             "products": products,
@@ -333,13 +424,13 @@ def create_sale(
         })
 
 @app.get("/sales/{sale_id}/edit/")
-def edit_sale_form(sale_id: int, request: Request, db: Session = Depends(get_db)):
-    sale = crud.get_sale(db, sale_id)
+async def edit_sale_form(sale_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    sale = await async_crud.get_sale(db, sale_id)
     if not sale:
         raise HTTPException(status_code=404, detail="Sale not found.")
-    products = crud.get_products(db)
-    salespersons = crud.get_salespersons(db)
-    customers = crud.get_customers(db)
+    products = await async_crud.get_form_options(db, "products", sale.product_id)
+    salespersons = await async_crud.get_form_options(db, "salespersons", sale.salesperson_id)
+    customers = await async_crud.get_form_options(db, "customers", sale.customer_id)
     return templates.TemplateResponse("sales/edit.html", {
         "request": request,
         "sale": sale,
@@ -349,14 +440,14 @@ def edit_sale_form(sale_id: int, request: Request, db: Session = Depends(get_db)
     })
 
 @app.post("/sales/{sale_id}/edit/")
-def update_sale(
+async def update_sale(
     sale_id: int,
     request: Request,
     product_id: int = Form(...),
     salesperson_id: int = Form(...),
     customer_id: int = Form(...),
     sales_date: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     sale_data = schemas.SaleCreate(
         product_id=product_id,
@@ -364,39 +455,51 @@ def update_sale(
         customer_id=customer_id,
         sales_date=sales_date
     )
-    updated = crud.update_sale(db, sale_id, sale_data)
+    updated = await async_crud.update_sale(db, sale_id, sale_data)
     if not updated:
         raise HTTPException(status_code=404, detail="Sale not found.")
     return RedirectResponse(url="/sales/", status_code=303)
 
 @app.post("/sales/{sale_id}/delete/")
-def delete_sale(sale_id: int, db: Session = Depends(get_db)):
-    sale = crud.get_sale(db, sale_id)
+async def delete_sale(sale_id: int, db: AsyncSession = Depends(get_db)):
+    sale = await async_crud.get_sale(db, sale_id)
     if sale:
-        crud.delete_sale(db, sale)
-        db.commit()
+        await async_crud.delete_sale(db, sale)
+        await db.commit()
     return RedirectResponse(url="/sales/", status_code=303)
 
 # ---------- Discounts Pages ----------
 
 @app.get("/discounts/")
-def list_discounts(request: Request, db: Session = Depends(get_db)):
-    discounts = crud.get_discounts(db)
-    return templates.TemplateResponse("discounts/list.html", {"request": request, "discounts": discounts})
+async def list_discounts(
+    request: Request,
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    # the template shows each discount's product name
+    discounts, next_after_id = await async_crud.get_discounts_page(db, after_id, limit, load="joined")
+    return templates.TemplateResponse("discounts/list.html", {
+        "request": request,
+        "discounts": discounts,
+        "after_id": after_id,
+        "next_after_id": next_after_id,
+        "limit": limit
+    })
 
 @app.get("/discounts/create/")
-def create_discount_form(request: Request, db: Session = Depends(get_db)):
-    products = crud.get_products(db)
+async def create_discount_form(request: Request, db: AsyncSession = Depends(get_db)):
+    products = await async_crud.get_form_options(db, "products")
     return templates.TemplateResponse("discounts/create.html", {"request": request, "products": products})
 
 @app.post("/discounts/create/")
-def create_discount(
+async def create_discount(
     request: Request,
     product_id: int = Form(...),
     begin_date: str = Form(...),
     end_date: str = Form(...),
     discount_percentage: float = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     discount_data = schemas.DiscountCreate(
         product_id=product_id,
@@ -404,26 +507,26 @@ def create_discount(
         end_date=end_date,
         discount_percentage=discount_percentage
     )
-    crud.create_discount(db, discount_data)
+    await async_crud.create_discount(db, discount_data)
     return RedirectResponse(url="/discounts/", status_code=303)
 
 @app.get("/discounts/{discount_id}/edit/")
-def edit_discount_form(discount_id: int, request: Request, db: Session = Depends(get_db)):
-    discount = crud.get_discount(db, discount_id)
+async def edit_discount_form(discount_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    discount = await async_crud.get_discount(db, discount_id)
     if not discount:
         raise HTTPException(status_code=404, detail="Discount not found.")
-    products = crud.get_products(db)
+    products = await async_crud.get_form_options(db, "products", discount.product_id)
     return templates.TemplateResponse("discounts/edit.html", {"request": request, "discount": discount, "products": products})
 
 @app.post("/discounts/{discount_id}/edit/")
-def update_discount(
+async def update_discount(
     discount_id: int,
     request: Request,
     product_id: int = Form(...),
     begin_date: str = Form(...),
     end_date: str = Form(...),
     discount_percentage: float = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     discount_data = schemas.DiscountCreate(
         product_id=product_id,
@@ -431,98 +534,143 @@ def update_discount(
         end_date=end_date,
         discount_percentage=discount_percentage
     )
-    updated = crud.update_discount(db, discount_id, discount_data)
+    updated = await async_crud.update_discount(db, discount_id, discount_data)
     if not updated:
         raise HTTPException(status_code=404, detail="Discount not found.")
     return RedirectResponse(url="/discounts/", status_code=303)
 
 @app.post("/discounts/{discount_id}/delete/")
-def delete_discount(discount_id: int, db: Session = Depends(get_db)):
-    discount = crud.get_discount(db, discount_id)
+async def delete_discount(discount_id: int, db: AsyncSession = Depends(get_db)):
+    discount = await async_crud.get_discount(db, discount_id)
     if discount:
-        db.delete(discount)
-        db.commit()
+        await async_crud.delete_discount(db, discount)
     return RedirectResponse(url="/discounts/", status_code=303)
 
-# ---------- Commission Report Page ----------
+# ---------- Exports ----------
 
-from sqlalchemy import and_
-from datetime import date, timedelta
+@app.get("/export/sales")
+async def export_sales(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start_date: date | None = None,
+    end_date: date | None = None,
+    salesperson_id: int | None = None,
+    product_id: int | None = None
+):
+    """
+    Streams every matching sale (with discounted price and commission) as CSV or NDJSON.
+    """
+    query = export.sales_export_query(
+        start_date=start_date, end_date=end_date,
+        salesperson_id=salesperson_id, product_id=product_id
+    )
+    return export.export_response(query, format, "sales")
+
+@app.get("/export/commission_report")
+async def export_commission_report(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start_date: date | None = None,
+    end_date: date | None = None,
+    salesperson_id: int | None = None,
+    product_id: int | None = None
+):
+    """
+    Streams the commission report for any date range as CSV or NDJSON.
+    """
+    query = export.commission_export_query(
+        start_date=start_date, end_date=end_date,
+        salesperson_id=salesperson_id, product_id=product_id
+    )
+    return export.export_response(query, format, "commission_report")
+
+# ---------- Analytics ----------
+
+@app.get("/analytics/sales_series")
+async def get_sales_series(
+    start_date: date,
+    end_date: date,
+    bucket: str = Query("month", pattern="^(day|week|month|quarter|year)$"),
+    group_by: str = Query("none", pattern="^(none|product|manufacturer|style|salesperson)$"),
+    product_id: int | None = None,
+    salesperson_id: int | None = None,
+    manufacturer: str | None = None,
+    style: str | None = None,
+    limit: int = Query(sales_analytics.DEFAULT_SERIES_LIMIT, ge=1, le=sales_analytics.MAX_SERIES_LIMIT),
+    db: AsyncSession = Depends(get_db)
+):
+    # JSON time series for charts, answered from the daily sales rollup
+    try:
+        return await async_crud.get_sales_series(
+            db, start_date, end_date, bucket, group_by,
+            product_id=product_id, salesperson_id=salesperson_id,
+            manufacturer=manufacturer, style=style, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# ---------- Report Jobs ----------
+
+@app.post("/jobs/commission_report", status_code=202)
+async def submit_commission_report_job(
+    response: Response,
+    year: int = Query(...),
+    quarter: int = Query(0, ge=0, le=4),
+    source: str = Query("rollup", pattern="^(rollup|live|parallel|incremental)$")
+):
+    # returns the job id at once, poll /jobs/{id} or stream /jobs/{id}/events
+    job_id, _ = await submit_report_job(year, quarter, source)
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return await get_report_job(job_id)
+
+@app.get("/jobs/{job_id}")
+async def read_job(job_id: str):
+    return await get_report_job(job_id)
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    await get_report_job(job_id, with_result=False)
+    return StreamingResponse(report_jobs.events(job_id), media_type="text/event-stream")
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    await get_report_job(job_id, with_result=False)
+    await asyncio.to_thread(report_jobs.store.cancel, job_id)
+    return await get_report_job(job_id, with_result=False)
+
+# ---------- Commission Report Page ----------
 
 @app.get("/commission_report/")
-def commission_report_form(request: Request):
+async def commission_report_form(request: Request):
     return templates.TemplateResponse("commission/report.html", {"request": request, "report": None})
 
 @app.post("/commission_report/")
-def generate_commission_report(
+async def generate_commission_report(
     request: Request,
     year: int = Form(...),
-    quarter: int = Form(...),
-    db: Session = Depends(get_db)
+    quarter: int = Form(...)
 ):
-    
-    report = []
-    salespersons = db.query(models.Salesperson).all()
-
-    for sp in salespersons:
-        sales_query = db.query(models.Sale).filter(models.Sale.salesperson_id == sp.id)
-
-        if year != 0:
-            if quarter != 0:
-                # Filter by year + quarter
-                quarter_start_month = (quarter - 1) * 3 + 1
-                quarter_end_month = quarter_start_month + 2
-
-                quarter_start = date(year, quarter_start_month, 1)
-                if quarter_end_month == 12:
-                    quarter_end = date(year, 12, 31)
-                else:
-                    quarter_end = date(year, quarter_end_month + 1, 1) - timedelta(days=1)
-
-                sales_query = sales_query.filter(
-                    models.Sale.sales_date >= quarter_start,
-                    models.Sale.sales_date <= quarter_end
-                )
-            else:
-                # Filter by year only (all quarters)
-                year_start = date(year, 1, 1)
-                year_end = date(year, 12, 31)
-                sales_query = sales_query.filter(
-                    models.Sale.sales_date >= year_start,
-                    models.Sale.sales_date <= year_end
-                )
-        # if year == 0, do not add any date filter, get all sales
-
-        sales = sales_query.all()
-
-        num_sales = len(sales)
-        total_sales_amount = 0.0
-        total_commission = 0.0
-
-        for sale in sales:
-            product = sale.product
-            price = product.sale_price
-
-            discount = db.query(models.Discount).filter(
-                models.Discount.product_id == product.id,
-                models.Discount.begin_date <= sale.sales_date,
-                models.Discount.end_date >= sale.sales_date
-            ).first()
-
-            if discount:
-                price = price * (1 - discount.discount_percentage / 100)
-
-            commission = price * (product.commission_percentage / 100)
-            total_sales_amount += price
-            total_commission += commission
-
-        report.append({
-            "salesperson_id": sp.id,
-            "first_name": sp.first_name,
-            "last_name": sp.last_name,
-            "num_sales": num_sales,
-            "total_sales_amount": round(total_sales_amount, 2),
-            "total_commission": round(total_commission, 2)
-        })
+    # cached reports are shown at once, others are computed by a report job
+    # while the job page below refreshes itself
+    report = commission_report.cached_commission_report(year, quarter)
+    if report is not None:
+        return templates.TemplateResponse(
+            "commission/report.html",
+            {"request": request, "report": report, "year": year, "quarter": quarter, "cache_hit": True},
+            headers={"X-Cache": "HIT"}
+        )
+    job_id, _ = await submit_report_job(year, quarter, "rollup")
+    return RedirectResponse(url=f"/commission_report/jobs/{job_id}", status_code=303)
+
+@app.get("/commission_report/jobs/{job_id}")
+async def commission_report_job_page(request: Request, job_id: str):
+    job = await get_report_job(job_id)
+    return templates.TemplateResponse(
+        "commission/report.html",
+        {"request": request, "report": job["result"], "year": job["year"], "quarter": job["quarter"],
+         "cache_hit": False, "job": job},
+        headers={"X-Cache": "MISS"}
+    )
 
-    return templates.TemplateResponse("commission/report.html", {"request": request, "report": report, "year": year, "quarter": quarter})
+@app.post("/commission_report/jobs/{job_id}/cancel")
+async def cancel_commission_report_job(job_id: str):
+    await asyncio.to_thread(report_jobs.store.cancel, job_id)
+    return RedirectResponse(url=f"/commission_report/jobs/{job_id}", status_code=303)
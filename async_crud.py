@@ -0,0 +1,103 @@
+"""
+Async versions of the database functions, used by the async route handlers.
+
+Each function runs the matching function from crud.py (or commission_report.py)
+on the AsyncSession with run_sync. The SQL logic stays in one place, while the
+database I/O is awaited on the event loop instead of holding a threadpool thread.
+"""
+
+import asyncio
+from functools import wraps
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+import crud, schemas, commission_report, reference_data, sales_analytics, search
+
+def run_sync(fn):
+    @wraps(fn)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        return await db.run_sync(fn, *args, **kwargs)
+    return wrapper
+
+# ---------- PRODUCTS ----------
+
+get_products = run_sync(crud.get_products)
+get_products_page = run_sync(crud.get_products_page)
+get_product = run_sync(crud.get_product)
+get_product_by_name = run_sync(crud.get_product_by_name)
+create_product = run_sync(crud.create_product)
+update_product = run_sync(crud.update_product)
+delete_product = run_sync(crud.delete_product)
+
+# ---------- SALESPERSONS ----------
+
+get_salespersons = run_sync(crud.get_salespersons)
+get_salespersons_page = run_sync(crud.get_salespersons_page)
+get_salesperson = run_sync(crud.get_salesperson)
+find_salesperson = run_sync(crud.find_salesperson)
+create_salesperson = run_sync(crud.create_salesperson)
+update_salesperson = run_sync(crud.update_salesperson)
+delete_salesperson = run_sync(crud.delete_salesperson)
+
+# ---------- CUSTOMERS ----------
+
+get_customers = run_sync(crud.get_customers)
+get_customers_page = run_sync(crud.get_customers_page)
+get_customer = run_sync(crud.get_customer)
+create_customer = run_sync(crud.create_customer)
+update_customer = run_sync(crud.update_customer)
+delete_customer = run_sync(crud.delete_customer)
+
+# ---------- SALES ----------
+
+get_sales = run_sync(crud.get_sales)
+get_sales_page = run_sync(crud.get_sales_page)
+get_sale = run_sync(crud.get_sale)
+update_sale = run_sync(crud.update_sale)
+delete_sale = run_sync(crud.delete_sale)
+
+async def with_lock_retries(db: AsyncSession, write, *args):
+    """
+    Same retry on "database is locked" as crud.with_lock_retries, but the
+    backoff awaits instead of blocking the event loop.
+    """
+    for attempt in range(crud.LOCK_RETRIES):
+        try:
+            return await db.run_sync(write, *args)
+        except OperationalError as e:
+            await db.rollback()
+            if not crud.is_lock_error(e) or attempt == crud.LOCK_RETRIES - 1:
+                raise
+            await asyncio.sleep(crud.LOCK_RETRY_DELAY * 2 ** attempt)
+
+async def create_sale(db: AsyncSession, sale: schemas.SaleCreate):
+    return await with_lock_retries(db, crud.create_sale_once, sale)
+
+async def create_sales_bulk(db: AsyncSession, sales: list[schemas.SaleCreate]):
+    return await with_lock_retries(db, crud.create_sales_bulk_once, sales)
+
+# ---------- DISCOUNTS ----------
+
+get_discounts = run_sync(crud.get_discounts)
+get_discounts_page = run_sync(crud.get_discounts_page)
+get_discount = run_sync(crud.get_discount)
+create_discount = run_sync(crud.create_discount)
+update_discount = run_sync(crud.update_discount)
+delete_discount = run_sync(crud.delete_discount)
+
+# ---------- COMMISSION REPORT ----------
+
+generate_commission_report = run_sync(commission_report.generate_commission_report)
+get_commission_report = run_sync(commission_report.get_commission_report)
+
+# ---------- ANALYTICS ----------
+
+get_sales_series = run_sync(sales_analytics.sales_series)
+
+# ---------- REFERENCE DATA ----------
+
+get_form_options = run_sync(reference_data.form_options)
+search_reference_data = run_sync(reference_data.search)
+
+# ---------- SEARCH ----------
+
+search_entities = run_sync(search.search)
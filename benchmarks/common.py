@@ -0,0 +1,107 @@
+"""
+Helpers shared by the benchmark scripts: throwaway seeded databases, timing
+and machine-readable result files.
+"""
+
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from sqlalchemy.orm import sessionmaker
+from database import make_engine
+from seed_data import generate_synthetic_data
+
+def sizes_for(num_sales: int):
+    """
+    Catalog sizes that scale with the number of sales (20M sales -> 10k products,
+    2k salespersons, 1M customers, 100k discounts).
+    """
+    return {
+        "products": max(10, num_sales // 2000),
+        "salespersons": max(5, num_sales // 10_000),
+        "customers": max(100, num_sales // 20),
+        "sales": num_sales,
+        "discounts": max(10, num_sales // 200)
+    }
+
+@contextmanager
+def temp_database(num_sales: int, sqlite_profile: str = "default", seed: int = 42, **sizes):
+    """
+    Yields (engine, Session) for a temporary SQLite database seeded with num_sales
+    sales. sizes (e.g. customers=1_000_000) override those of sizes_for.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", sqlite_profile=sqlite_profile)
+        try:
+            generate_synthetic_data(engine, seed=seed, **{**sizes_for(num_sales), **sizes})
+            yield engine, sessionmaker(bind=engine, autocommit=False, autoflush=False)
+        finally:
+            engine.dispose()
+
+def time_case(fn, repeat: int = 5, warmup: int = 1):
+    """
+    Runs fn warmup + repeat times and returns timing stats in milliseconds.
+    """
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "runs": repeat,
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3)
+    }
+
+def time_each(fn, calls, warmup: int = 5):
+    """
+    Times fn(*args) once for each args in calls and returns latency stats in
+    milliseconds, with the 99th percentile. The first warmup calls run untimed first.
+    """
+    for args in calls[:warmup]:
+        fn(*args)
+    timings = []
+    for args in calls:
+        start = time.perf_counter()
+        fn(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "runs": len(calls),
+        "median_ms": round(statistics.median(timings), 3),
+        "p99_ms": round(statistics.quantiles(timings, n=100, method="inclusive")[98], 3),
+        "max_ms": round(max(timings), 3)
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_results(path: str, benchmark: str, args: dict, results):
+    """
+    Writes results as JSON with enough context to compare runs across commits.
+    """
+    with open(path, "w") as f:
+        json.dump({
+            "benchmark": benchmark,
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "args": args,
+            "results": results
+        }, f, indent=2)
@@ -0,0 +1,78 @@
+"""
+All-years commission report as one SQL query (commission_report.py) and split
+across worker processes (parallel_report.py), by salesperson and by quarter,
+for each worker count.
+
+The pools are warmed up before timing (a first report starts the workers).
+Each parallel report is checked against the single query, which both
+partition kinds must match exactly (cent differences are counted). The speedup
+can't exceed the CPUs the machine actually has, which is written to the results.
+
+Run from the project root:
+    python -m benchmarks.parallel_report --sizes 20M --workers 1,2,4,8 --output parallel_results.json
+"""
+
+import argparse
+import os
+import commission_report, parallel_report
+from seed_data import parse_size
+from benchmarks.common import temp_database, time_case, write_results
+
+def cent_differences(single_report, parallel_rows):
+    return sum(
+        (single_row["total_sales_amount"], single_row["total_commission"]) != (row["total_sales_amount"], row["total_commission"])
+        for single_row, row in zip(single_report, parallel_rows)
+    )
+
+def run_cases(Session, worker_counts, partition_kinds, repeat: int):
+    results = []
+    with Session() as db:
+        single = time_case(lambda: commission_report.compute_commission_report(db, 0, 0), repeat)
+        single_report = commission_report.compute_commission_report(db, 0, 0)
+        results.append({"case": "single_query", "workers": 1, **single})
+
+        for partition_by in partition_kinds:
+            for workers in worker_counts:
+                stats = time_case(
+                    lambda: parallel_report.compute_commission_report(db, 0, 0, workers, partition_by), repeat
+                )
+                report = parallel_report.compute_commission_report(db, 0, 0, workers, partition_by)
+                results.append({
+                    "case": f"by_{partition_by}",
+                    "workers": workers,
+                    **stats,
+                    "speedup": round(single["median_ms"] / stats["median_ms"], 2),
+                    "same_sales_counts": [row["num_sales"] for row in report] == [row["num_sales"] for row in single_report],
+                    "cent_differences": cent_differences(single_report, report)
+                })
+    parallel_report.shutdown_worker_pools()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="20M", help="comma separated sales counts")
+    parser.add_argument("--workers", default="1,2,4,8", help="comma separated worker counts")
+    parser.add_argument("--partition-by", default=",".join(parallel_report.PARTITION_KINDS),
+                        help="comma separated partition kinds")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    worker_counts = [int(workers) for workers in args.workers.split(",")]
+    print(f"{os.cpu_count()} CPUs")
+    results = []
+    for num_sales in [parse_size(size) for size in args.sizes.split(",")]:
+        with temp_database(num_sales) as (engine, Session):
+            for result in run_cases(Session, worker_counts, args.partition_by.split(","), args.repeat):
+                results.append({"sales": num_sales, **result})
+                line = f"{num_sales:>10} {result['case']:<16} {result['workers']:>2} workers median {result['median_ms']:>10.3f} ms"
+                if "speedup" in result:
+                    line += (f"  x{result['speedup']:<5} same counts: {result['same_sales_counts']},"
+                             f" cent differences: {result['cent_differences']}")
+                print(line)
+
+    if args.output:
+        write_results(args.output, "parallel_report", vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Mixed read/write benchmark: default SQLite settings vs the high-throughput profile
+(SQLITE_PROFILE=high_throughput in database.py).
+
+Each profile gets its own temporary database filled by generate_synthetic_data.
+Reader threads run commission reports and sales list pages while writer threads
+create sales through crud.create_sale, and the number of completed operations
+is reported.
+
+Run from the project root:
+    python -m benchmarks.sqlite_profile --sales 100k --seconds 10
+"""
+
+import argparse
+import random
+import threading
+import time
+from datetime import date
+import crud, schemas, commission_report
+from seed_data import parse_size
+from benchmarks.common import sizes_for, temp_database, write_results
+
+def run_workload(Session, sizes: dict, seconds: float, readers: int, writers: int):
+    report_years = range(date.today().year - 5, date.today().year)
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def reader():
+        rng = random.Random()
+        with Session() as db:
+            while time.perf_counter() < deadline:
+                try:
+                    if rng.random() < 0.5:
+                        commission_report.compute_commission_report(db, rng.choice(report_years), rng.randint(1, 4))
+                    else:
+                        crud.get_sales_page(db, rng.randint(0, sizes["sales"]), load="joined")
+                    db.rollback()  # end the read transaction
+                    key = "reads"
+                except Exception:
+                    db.rollback()
+                    key = "errors"
+                with lock:
+                    counts[key] += 1
+
+    def writer():
+        rng = random.Random()
+        with Session() as db:
+            while time.perf_counter() < deadline:
+                sale = schemas.SaleCreate(
+                    product_id=rng.randint(1, sizes["products"]),
+                    salesperson_id=rng.randint(1, sizes["salespersons"]),
+                    customer_id=rng.randint(1, sizes["customers"]),
+                    sales_date=date(report_years[-1], rng.randint(1, 12), rng.randint(1, 28))
+                )
+                try:
+                    crud.create_sale(db, sale)
+                    key = "writes"
+                except Exception:
+                    db.rollback()
+                    key = "errors"
+                with lock:
+                    counts[key] += 1
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counts["reads_per_sec"] = round(counts["reads"] / seconds, 1)
+    counts["writes_per_sec"] = round(counts["writes"] / seconds, 1)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sales", type=parse_size, default=100_000)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for profile in ("default", "high_throughput"):
+        with temp_database(args.sales, profile) as (engine, Session):
+            results[profile] = run_workload(Session, sizes_for(args.sales), args.seconds, args.readers, args.writers)
+        print(profile, results[profile])
+
+    if args.output:
+        write_results(args.output, "sqlite_profile", vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark suite for the hot paths at several data sizes: the commission report
+(live, from the rollup and cached), sales list pages, create_sale, discount lookups
+and search (p99 over a mix of queries, target 20 ms with 1M customers).
+
+Each size gets its own generated database (see seed_data.generate_synthetic_data).
+Results are printed and, with --output, written as JSON to compare across commits.
+
+Run from the project root:
+    python -m benchmarks.suite --sizes 10k,100k,1M --output bench_results.json
+    python -m benchmarks.suite --sizes 1M --customers 1M
+"""
+
+import argparse
+import random
+from datetime import date
+import models, crud, schemas, commission_report, search
+from discount_index import DiscountIndex
+from seed_data import parse_size
+from benchmarks.common import temp_database, time_case, time_each, write_results
+
+SEARCH_QUERIES = 500
+
+def discount_pairs(db, count: int, rng: random.Random):
+    max_product = db.query(models.Product.id).order_by(models.Product.id.desc()).first()[0]
+    this_year = date.today().year
+    return [
+        (rng.randint(1, max_product), date(rng.randint(this_year - 5, this_year - 1), rng.randint(1, 12), rng.randint(1, 28)))
+        for _ in range(count)
+    ]
+
+def discount_lookup_sql(db, pairs):
+    for product_id, on_date in pairs:
+        db.query(models.Discount).filter(
+            models.Discount.product_id == product_id,
+            models.Discount.begin_date <= on_date,
+            models.Discount.end_date >= on_date
+        ).first()
+
+def search_queries(db, count: int, rng: random.Random):
+    """
+    What people type: a full or partial name, a last name, part of a phone
+    number, one or two letters, a product.
+    """
+    max_customer = db.query(models.Customer.id).order_by(models.Customer.id.desc()).first()[0]
+    kinds = [
+        lambda: f"customer {rng.randint(0, max_customer - 1)}",
+        lambda: f"omer {rng.randint(0, max_customer - 1)}"[:rng.randint(6, 10)],
+        lambda: f"lastname {rng.randint(0, 9972)}",
+        lambda: f"{rng.randint(0, 99_999_999):08d}"[rng.randint(0, 4):][:4],
+        lambda: rng.choice("abcdefghijklmnopqrstuvwxyz") * rng.randint(1, 2),
+        lambda: f"cu la{rng.randint(0, 9)}",
+        lambda: f"bike {rng.randint(0, 99)}"
+    ]
+    return [(db, rng.choice(kinds)()) for _ in range(count)]
+
+def run_cases(Session, num_sales: int, repeat: int):
+    rng = random.Random(7)
+    report_year = date.today().year - 1
+    cases = {}
+
+    with Session() as db:
+        cases["commission_report_quarter_live"] = time_case(
+            lambda: commission_report.compute_commission_report(db, report_year, 2), repeat)
+        cases["commission_report_all_years_live"] = time_case(
+            lambda: commission_report.compute_commission_report(db, 0, 0), repeat)
+        cases["commission_report_quarter_rollup"] = time_case(
+            lambda: commission_report.generate_commission_report(db, report_year, 2), repeat)
+        cases["commission_report_all_years_rollup"] = time_case(
+            lambda: commission_report.generate_commission_report(db, 0, 0), repeat)
+        cases["commission_report_quarter_cached"] = time_case(
+            lambda: commission_report.get_commission_report(db, report_year, 2), repeat)
+
+        cases["sales_list_first_page"] = time_case(
+            lambda: crud.get_sales_page(db, 0, crud.DEFAULT_PAGE_SIZE, load="joined"), repeat)
+        cases["sales_list_deep_page"] = time_case(
+            lambda: crud.get_sales_page(db, int(num_sales * 0.9), crud.DEFAULT_PAGE_SIZE, load="joined"), repeat)
+
+        pairs = discount_pairs(db, 1000, rng)
+        cases["discount_lookup_sql_x1000"] = time_case(lambda: discount_lookup_sql(db, pairs), repeat)
+        # cold: loads the intervals of every product in the pairs, warm: lookups only
+        cases["discount_lookup_index_cold_x1000"] = time_case(
+            lambda: DiscountIndex().get_discount_percentages(db, pairs), repeat)
+        index = DiscountIndex()
+        index.get_discount_percentages(db, pairs)
+        cases["discount_lookup_index_x1000"] = time_case(
+            lambda: index.get_discount_percentages(db, pairs), repeat)
+
+        cases["search_p99"] = time_each(search.search, search_queries(db, SEARCH_QUERIES, rng))
+
+        def create_sales():
+            for _ in range(100):
+                crud.create_sale(db, schemas.SaleCreate(
+                    product_id=1, salesperson_id=1, customer_id=1,
+                    sales_date=date(report_year, rng.randint(1, 12), rng.randint(1, 28))
+                ))
+        cases["create_sale_x100"] = time_case(create_sales, repeat)
+
+    return cases
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10k,100k", help="comma separated sales counts, e.g. 10k,1M,20M")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sqlite-profile", default="default")
+    parser.add_argument("--customers", type=parse_size, help="customer count, default scales with the sales")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    sizes = {"customers": args.customers} if args.customers else {}
+    results = []
+    for num_sales in [parse_size(size) for size in args.sizes.split(",")]:
+        with temp_database(num_sales, args.sqlite_profile, **sizes) as (engine, Session):
+            for case, stats in run_cases(Session, num_sales, args.repeat).items():
+                results.append({"sales": num_sales, "case": case, **stats})
+                p99 = f" p99 {stats['p99_ms']:>10.3f} ms" if "p99_ms" in stats else ""
+                print(f"{num_sales:>10} {case:<40} median {stats['median_ms']:>10.3f} ms{p99}")
+
+    if args.output:
+        write_results(args.output, "suite", vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Commission report three ways: the SQL GROUP BY (commission_report.py), a per-sale
+Python loop and the NumPy version (vectorized_report.py), for one quarter and
+for all years.
+
+The loop and NumPy read the same rows. Their totals after round(..., 2) are
+compared, and so are the NumPy and SQL reports (which add up the same exact
+millionths of a dollar, so none are expected). The loop adds floats in row
+order: a total of exactly half a cent can round to either cent there, and
+such rows are counted as differences from the loop.
+
+Run from the project root (needs numpy):
+    python -m benchmarks.vectorized_report --sizes 1M,10M --output vectorized_results.json
+"""
+
+import argparse
+from datetime import date
+import commission_report, vectorized_report
+from seed_data import parse_size
+from benchmarks.common import temp_database, time_case, write_results
+
+def loop_totals(db, date_range, chunk_size: int = vectorized_report.VECTOR_CHUNK_SIZE):
+    """
+    {salesperson_id: [num_sales, total_sales_amount, total_commission]} added up
+    one sale at a time in Python, over the same rows as the NumPy version.
+    """
+    totals = {}
+    for chunk in vectorized_report.column_chunks(db, vectorized_report.pricing_query(date_range), chunk_size):
+        for salesperson_id, unit_price, discount, commission_rate in zip(*(column.tolist() for column in chunk)):
+            price = unit_price * (1 - discount / 100.0)
+            row_totals = totals.get(salesperson_id)
+            if row_totals is None:
+                row_totals = totals[salesperson_id] = [0, 0.0, 0.0]
+            row_totals[0] += 1
+            row_totals[1] += price
+            row_totals[2] += price * (commission_rate / 100.0)
+    return totals
+
+def loop_differences(db, year: int, quarter: int):
+    """
+    Salespersons whose NumPy report row isn't the loop's totals after round(..., 2).
+    """
+    loop = loop_totals(db, commission_report.get_report_date_range(year, quarter))
+    return sum(
+        [row["num_sales"], row["total_sales_amount"], row["total_commission"]] != [
+            num_sales, round(amount, 2), round(commission, 2)
+        ]
+        for row in vectorized_report.compute_commission_report(db, year, quarter)
+        for num_sales, amount, commission in [loop.get(row["salesperson_id"], (0, 0.0, 0.0))]
+    )
+
+def rounding_differences(sql_report, numpy_report):
+    return sum(
+        (sql_row["total_sales_amount"], sql_row["total_commission"]) != (numpy_row["total_sales_amount"], numpy_row["total_commission"])
+        for sql_row, numpy_row in zip(sql_report, numpy_report)
+    )
+
+def run_cases(Session, repeat: int):
+    last_year = date.today().year - 1
+    results = []
+    with Session() as db:
+        for period, (year, quarter) in {"quarter": (last_year, 2), "all_years": (0, 0)}.items():
+            date_range = commission_report.get_report_date_range(year, quarter)
+            cases = {
+                "sql": time_case(lambda: commission_report.compute_commission_report(db, year, quarter), repeat),
+                "python_loop": time_case(lambda: loop_totals(db, date_range), repeat),
+                "numpy": time_case(lambda: vectorized_report.compute_commission_report(db, year, quarter), repeat)
+            }
+            checks = {
+                "cent_differences_from_loop": loop_differences(db, year, quarter),
+                "cent_differences_from_sql": rounding_differences(
+                    commission_report.compute_commission_report(db, year, quarter),
+                    vectorized_report.compute_commission_report(db, year, quarter)
+                )
+            }
+            for case, stats in cases.items():
+                results.append({"period": period, "case": case, **stats})
+            results.append({"period": period, "case": "checks", **checks})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1M,10M", help="comma separated sales counts")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for num_sales in [parse_size(size) for size in args.sizes.split(",")]:
+        with temp_database(num_sales) as (engine, Session):
+            for result in run_cases(Session, args.repeat):
+                results.append({"sales": num_sales, **result})
+                if result["case"] == "checks":
+                    print(f"{num_sales:>10} {result['period']:<10} cent differences from the loop: "
+                          f"{result['cent_differences_from_loop']}, from SQL: {result['cent_differences_from_sql']}")
+                else:
+                    print(f"{num_sales:>10} {result['period']:<10} {result['case']:<12} median {result['median_ms']:>10.3f} ms")
+
+    if args.output:
+        write_results(args.output, "vectorized_report", vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+This file builds the quarterly commission report.
+The whole report is computed by a single grouped SQL statement over the sales
+table: every sale carries the price, discount and commission rate it was made
+at, so there is nothing to join or look up per sale. Amounts and commissions
+are added up unrounded and the totals rounded to the cent once, when the report
+is formatted. The sums are taken in whole millionths of a dollar, which adds up
+exactly, so the totals are the same however the sales are split up and added
+(rollup, parallel, incremental).
+
+Totals are also kept per salesperson/quarter in the commission_rollup table.
+crud refreshes the affected rows on every write, and the report pages read
+from it. Finished reports are cached per (year, quarter) in report_cache.py and
+evicted when crud refreshes one of their quarters.
+Run this file directly to rebuild the whole table:
+    python commission_report.py
+"""
+
+from datetime import date, timedelta
+from sqlalchemy import BigInteger, Integer, Numeric, cast, extract, func, select
+from sqlalchemy.orm import Session
+from report_cache import cache_key, invalidate_quarters_on_commit, report_cache
+import models
+
+# ---------- DATE RANGES ----------
+
+def get_report_date_range(year: int, quarter: int):
+    """
+    Returns the (start, end) dates covered by a year/quarter selection.
+    year == 0 means all years (returns None), quarter == 0 means the whole year.
+    """
+    if year == 0:
+        return None
+
+    if quarter == 0:
+        return date(year, 1, 1), date(year, 12, 31)
+
+    quarter_start_month = (quarter - 1) * 3 + 1
+    quarter_end_month = quarter_start_month + 2
+
+    quarter_start = date(year, quarter_start_month, 1)
+    if quarter_end_month == 12:
+        quarter_end = date(year, 12, 31)
+    else:
+        quarter_end = date(year, quarter_end_month + 1, 1) - timedelta(days=1)
+
+    return quarter_start, quarter_end
+
+# ---------- PRICING EXPRESSIONS ----------
+
+def active_discount_id():
+    """
+    Correlated subquery returning the discount that applies to a sale.
+    Picks the lowest id when discounts overlap, like the old .first() lookup did.
+    Only used to backfill the pricing of sales recorded without it.
+    """
+    return (
+        select(func.min(models.Discount.id))
+        .where(
+            models.Discount.product_id == models.Sale.product_id,
+            models.Discount.begin_date <= models.Sale.sales_date,
+            models.Discount.end_date >= models.Sale.sales_date
+        )
+        .correlate(models.Sale)
+        .scalar_subquery()
+    )
+
+# sales is models.Sale or another table with its pricing columns (models.SaleChange)
+
+def discounted_price(sales=models.Sale):
+    # no discount -> multiply by 1.0, which leaves the price unchanged
+    return sales.unit_price * (1 - sales.discount_percentage / 100.0)
+
+def sale_commission(sales=models.Sale):
+    return discounted_price(sales) * (sales.commission_percentage / 100.0)
+
+def priced_sales(sales=models.Sale):
+    # sales of products that didn't exist have no price and don't count
+    return sales.unit_price.is_not(None)
+
+# totals are sums of whole millionths of a dollar
+MICROS = 1_000_000
+
+def in_micros(amount):
+    """
+    An amount in whole millionths of a dollar, rounded half up.
+    """
+    # through numeric: PostgreSQL rounds a float half to even
+    return cast(func.round(cast(amount * MICROS, Numeric)), BigInteger)
+
+def sum_micros(amount):
+    """
+    Sum of the amounts in millionths of a dollar. Adding up integers is exact,
+    so the total doesn't depend on the order the database reads the sales in
+    (a float sum does, and can round to another cent).
+    """
+    # bigint, not PostgreSQL's numeric sum
+    return cast(func.sum(in_micros(amount)), BigInteger)
+
+# ---------- REPORT ----------
+
+def sales_totals_query(date_range=None, sales=models.Sale):
+    """
+    Sales grouped by salesperson, amounts in millionths of a dollar (see sum_micros).
+    """
+    query = (
+        select(
+            sales.salesperson_id.label("salesperson_id"),
+            func.count(sales.id).label("num_sales"),
+            sum_micros(discounted_price(sales)).label("total_sales_amount"),
+            sum_micros(sale_commission(sales)).label("total_commission")
+        )
+        .where(priced_sales(sales))
+        .group_by(sales.salesperson_id)
+    )
+
+    if date_range:
+        start, end = date_range
+        query = query.where(
+            sales.sales_date >= start,
+            sales.sales_date <= end
+        )
+
+    return query
+
+def report_query(totals):
+    """
+    Joins per-salesperson totals onto every salesperson (zero when they have no sales).
+    """
+    totals = totals.subquery()
+
+    return (
+        select(
+            models.Salesperson.id.label("salesperson_id"),
+            models.Salesperson.first_name.label("first_name"),
+            models.Salesperson.last_name.label("last_name"),
+            func.coalesce(totals.c.num_sales, 0).label("num_sales"),
+            func.coalesce(totals.c.total_sales_amount, 0).label("total_sales_amount"),
+            func.coalesce(totals.c.total_commission, 0).label("total_commission")
+        )
+        .outerjoin(totals, totals.c.salesperson_id == models.Salesperson.id)
+        .order_by(models.Salesperson.id)
+    )
+
+def report_rows(db: Session, totals):
+    """
+    Runs report_query and formats the rows.
+    """
+    return format_report(db.execute(report_query(totals)).all())
+
+def format_report(rows):
+    """
+    Report dicts from (salesperson_id, first_name, last_name, num_sales,
+    total_sales_amount, total_commission) rows, amounts in millionths of a dollar.
+    """
+    report = []
+    for sp_id, first_name, last_name, num_sales, total_sales_amount, total_commission in rows:
+        report.append({
+            "salesperson_id": sp_id,
+            "first_name": first_name,
+            "last_name": last_name,
+            "num_sales": num_sales,
+            "total_sales_amount": round(total_sales_amount / MICROS, 2),
+            "total_commission": round(total_commission / MICROS, 2)
+        })
+
+    return report
+
+def compute_commission_report(db: Session, year: int, quarter: int):
+    """
+    Computes the report straight from the sales table (no rollup).
+    """
+    return report_rows(db, sales_totals_query(get_report_date_range(year, quarter)))
+
+def generate_commission_report(db: Session, year: int, quarter: int):
+    """
+    Returns one row per salesperson with their number of sales, total
+    (discounted) sales amount and total commission for the selected period.
+    Answered from the commission_rollup table.
+    """
+    return report_rows(db, rollup_totals_query(year, quarter))
+
+def rollup_totals_query(year: int, quarter: int):
+    """
+    Rollup rows of the period added up per salesperson, like sales_totals_query.
+    """
+    rollup = models.CommissionRollup
+    totals = (
+        select(
+            rollup.salesperson_id.label("salesperson_id"),
+            func.sum(rollup.num_sales).label("num_sales"),
+            # the rows hold exact millionths of a dollar, see rollup_values
+            sum_micros(rollup.total_sales_amount).label("total_sales_amount"),
+            sum_micros(rollup.total_commission).label("total_commission")
+        )
+        .group_by(rollup.salesperson_id)
+    )
+    if year != 0:
+        totals = totals.where(rollup.year == year)
+        if quarter != 0:
+            totals = totals.where(rollup.quarter == quarter)
+
+    return totals
+
+def cached_commission_report(year: int, quarter: int):
+    """
+    The report from the report cache, None if it isn't cached.
+    """
+    return report_cache.get(cache_key(year, quarter))
+
+def get_commission_report(db: Session, year: int, quarter: int):
+    """
+    generate_commission_report through the report cache.
+    Returns (report, cache_hit).
+    """
+    key = cache_key(year, quarter)
+    report = cached_commission_report(year, quarter)
+    if report is not None:
+        return report, True
+
+    generation = report_cache.generation()
+    report = generate_commission_report(db, year, quarter)
+    report_cache.set(key, report, generation)
+    return report, False
+
+# ---------- COMMISSION ROLLUP ----------
+
+# cast so the quarter math is integer division on every backend
+# (PostgreSQL's EXTRACT returns numeric)
+def sale_year():
+    return cast(extract("year", models.Sale.sales_date), Integer)
+
+def sale_quarter():
+    return (cast(extract("month", models.Sale.sales_date), Integer) - 1) // 3 + 1
+
+def rollup_key(salesperson_id, sales_date):
+    """
+    The (salesperson_id, year, quarter) rollup row a sale belongs to.
+    """
+    if salesperson_id is None or sales_date is None:
+        return None
+    return salesperson_id, sales_date.year, (sales_date.month - 1) // 3 + 1
+
+def rollup_keys_for_sales(db: Session, *conditions):
+    """
+    Distinct rollup keys of the sales matching the given filters.
+    """
+    rows = db.execute(
+        select(models.Sale.salesperson_id, sale_year(), sale_quarter())
+        .where(*conditions)
+        .distinct()
+    ).all()
+    return {tuple(row) for row in rows if None not in row}
+
+def refresh_commission_rollup(db: Session, keys):
+    """
+    Recomputes the given (salesperson_id, year, quarter) rollup rows from the sales table.
+    Runs one grouped query and one rollup lookup per affected quarter. Does not commit.
+    """
+    by_quarter = {}
+    for key in keys:
+        if key is None:
+            continue
+        salesperson_id, year, quarter = key
+        by_quarter.setdefault((year, quarter), set()).add(salesperson_id)
+    invalidate_quarters_on_commit(db, by_quarter)
+
+    for (year, quarter), salesperson_ids in by_quarter.items():
+        query = sales_totals_query(get_report_date_range(year, quarter)).where(
+            models.Sale.salesperson_id.in_(salesperson_ids)
+        )
+        totals = {row.salesperson_id: row for row in db.execute(query)}
+        rollup = models.CommissionRollup
+        db_rows = {
+            db_row.salesperson_id: db_row
+            for db_row in db.scalars(select(rollup).where(
+                rollup.year == year, rollup.quarter == quarter, rollup.salesperson_id.in_(salesperson_ids)
+            ))
+        }
+
+        for salesperson_id in salesperson_ids:
+            db_row = db_rows.get(salesperson_id)
+            row = totals.get(salesperson_id)
+            if row is None:
+                if db_row:
+                    db.delete(db_row)
+                continue
+            if db_row is None:
+                db_row = models.CommissionRollup(salesperson_id=salesperson_id, year=year, quarter=quarter)
+                db.add(db_row)
+            for key, value in rollup_values(row).items():
+                setattr(db_row, key, value)
+
+def rollup_values(row):
+    """
+    Rollup columns of a sales_totals_query row (dollars, which convert back to
+    the same millionths).
+    """
+    return {
+        "num_sales": row.num_sales,
+        "total_sales_amount": row.total_sales_amount / MICROS,
+        "total_commission": row.total_commission / MICROS
+    }
+
+def rebuild_commission_rollup(db: Session):
+    """
+    Rebuilds the whole rollup table with a single grouped query and commits.
+    """
+    year = sale_year().label("year")
+    quarter = sale_quarter().label("quarter")
+    totals = sales_totals_query().add_columns(year, quarter).group_by(year, quarter)
+
+    db.query(models.CommissionRollup).delete()
+    db.bulk_insert_mappings(models.CommissionRollup, [
+        {"salesperson_id": row.salesperson_id, "year": row.year, "quarter": row.quarter, **rollup_values(row)}
+        for row in db.execute(totals)
+        if row.salesperson_id is not None and row.year is not None
+    ])
+    db.commit()
+    report_cache.clear()
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    db = SessionLocal()
+    rebuild_commission_rollup(db)
+    db.close()
+    print("Commission rollup rebuilt successfully.")
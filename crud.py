@@ -3,17 +3,52 @@ This file handles all the database interactions.
 Keeping SQL logic separate from the API routes makes the code cleaner and easier to maintain.
 """
 
-from sqlalchemy.orm import Session
-import models, schemas
+import time
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, joinedload, selectinload
+from discount_index import discount_index
+from report_cache import invalidate_all_on_commit
+import models, schemas, commission_report, reference_data, sales_analytics
+
+# ---------- PAGINATION ----------
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def get_page(db: Session, model, after_id: int = 0, limit: int = DEFAULT_PAGE_SIZE, options=()):
+    """
+    Keyset pagination by id: returns (rows, next_after_id).
+    next_after_id is None on the last page. Cost stays flat however deep the page is.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    rows = (
+        db.query(model)
+        .options(*options)
+        .filter(model.id > after_id)
+        .order_by(model.id)
+        .limit(limit + 1)
+        .all()
+    )
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
 
 # ---------- PRODUCTS ----------
 
 def get_products(db: Session):
     return db.query(models.Product).all()
 
+def get_products_page(db: Session, after_id: int = 0, limit: int = DEFAULT_PAGE_SIZE):
+    return get_page(db, models.Product, after_id, limit)
+
 def get_product(db: Session, product_id: int):
     return db.query(models.Product).filter(models.Product.id == product_id).first()
 
+def get_product_by_name(db: Session, name: str):
+    return db.query(models.Product).filter(models.Product.name == name).first()
+
 def create_product(db: Session, product: schemas.ProductCreate):
     """
     Creates a new product.
@@ -24,26 +59,52 @@ def create_product(db: Session, product: schemas.ProductCreate):
     db_product = models.Product(**product.dict())
     db.add(db_product)
     db.commit()
+    reference_data.products.invalidate()
     db.refresh(db_product)
     return db_product
 
 def update_product(db: Session, product_id: int, product: schemas.ProductCreate):
     db_product = get_product(db, product_id)
     if db_product:
+        old_groups = (db_product.manufacturer, db_product.style)
         for key, value in product.dict().items():
             setattr(db_product, key, value)
+        db.flush()
+        # past sales keep their price, only the analytics groups of every day
+        # this product was sold on change
+        if (db_product.manufacturer, db_product.style) != old_groups:
+            refresh_daily_rollup_for_sales(db, models.Sale.product_id == product_id)
         db.commit()
+        reference_data.products.invalidate()
         db.refresh(db_product)
     return db_product
 
+def delete_product(db: Session, product_obj):
+    db.delete(product_obj)
+    db.flush()
+    # its sales still count, under no manufacturer/style
+    refresh_daily_rollup_for_sales(db, models.Sale.product_id == product_obj.id)
+    db.commit()
+    reference_data.products.invalidate()
+
 # ---------- SALESPERSONS ----------
 
 def get_salespersons(db: Session):
     return db.query(models.Salesperson).all()
 
+def get_salespersons_page(db: Session, after_id: int = 0, limit: int = DEFAULT_PAGE_SIZE):
+    return get_page(db, models.Salesperson, after_id, limit)
+
 def get_salesperson(db: Session, salesperson_id: int):
     return db.query(models.Salesperson).filter(models.Salesperson.id == salesperson_id).first()
 
+def find_salesperson(db: Session, first_name: str, last_name: str, phone: str):
+    return db.query(models.Salesperson).filter(
+        models.Salesperson.first_name == first_name,
+        models.Salesperson.last_name == last_name,
+        models.Salesperson.phone == phone
+    ).first()
+
 def create_salesperson(db: Session, salesperson: schemas.SalespersonCreate):
     """
     Creates a new salesperson.
@@ -53,7 +114,10 @@ def create_salesperson(db: Session, salesperson: schemas.SalespersonCreate):
     """
     db_salesperson = models.Salesperson(**salesperson.dict())
     db.add(db_salesperson)
+    # every report lists every salesperson
+    invalidate_all_on_commit(db)
     db.commit()
+    reference_data.salespersons.invalidate()
     db.refresh(db_salesperson)
     return db_salesperson
 
@@ -62,15 +126,26 @@ def update_salesperson(db: Session, salesperson_id: int, salesperson: schemas.Sa
     if db_salesperson:
         for key, value in salesperson.dict().items():
             setattr(db_salesperson, key, value)
+        invalidate_all_on_commit(db)
         db.commit()
+        reference_data.salespersons.invalidate()
         db.refresh(db_salesperson)
     return db_salesperson
 
+def delete_salesperson(db: Session, salesperson_obj):
+    db.delete(salesperson_obj)
+    invalidate_all_on_commit(db)
+    db.commit()
+    reference_data.salespersons.invalidate()
+
 # ---------- CUSTOMERS ----------
 
 def get_customers(db: Session):
     return db.query(models.Customer).all()
 
+def get_customers_page(db: Session, after_id: int = 0, limit: int = DEFAULT_PAGE_SIZE):
+    return get_page(db, models.Customer, after_id, limit)
+
 def get_customer(db: Session, customer_id: int):
     return db.query(models.Customer).filter(models.Customer.id == customer_id).first()
 
@@ -78,6 +153,7 @@ def create_customer(db: Session, customer: schemas.CustomerCreate):
     db_customer = models.Customer(**customer.dict())
     db.add(db_customer)
     db.commit()
+    reference_data.customers.invalidate()
     db.refresh(db_customer)
     return db_customer
 
@@ -87,66 +163,274 @@ def update_customer(db: Session, customer_id: int, customer: schemas.CustomerCre
         for key, value in customer.dict().items():
             setattr(db_customer, key, value)
         db.commit()
+        reference_data.customers.invalidate()
         db.refresh(db_customer)
     return db_customer
 
+def delete_customer(db: Session, customer_obj):
+    db.delete(customer_obj)
+    db.commit()
+    reference_data.customers.invalidate()
+
 # ---------- SALES ----------
 
-def get_sales(db: Session):
-    return db.query(models.Sale).all()
+# Loading profiles for a sale's product, salesperson and customer.
+# "lazy" loads each one on first access (one SELECT per row and relationship),
+# "joined" loads them in the same SELECT, "selectin" with one extra SELECT each.
+SALE_RELATIONSHIPS = (models.Sale.product, models.Sale.salesperson, models.Sale.customer)
 
-def get_sale(db: Session, sale_id: int):
-    return db.query(models.Sale).filter(models.Sale.id == sale_id).first()
+def sale_load_options(load: str = "lazy"):
+    if load == "lazy":
+        return []
+    if load == "joined":
+        return [joinedload(rel) for rel in SALE_RELATIONSHIPS]
+    if load == "selectin":
+        return [selectinload(rel) for rel in SALE_RELATIONSHIPS]
+    raise ValueError(f"Unknown loading profile: {load}")
 
-def create_sale(db: Session, sale: schemas.SaleCreate):
-    product = db.query(models.Product).filter(models.Product.id == sale.product_id).first()
-    if product:
-        if product.qty_on_hand > 0:
-            product.qty_on_hand -= 1
-        else:
-            raise ValueError("Cannot create sale. Product is out of stock.")
-
-    db_sale = models.Sale(**sale.dict())
+def get_sales(db: Session, load: str = "lazy"):
+    return db.query(models.Sale).options(*sale_load_options(load)).all()
+
+def get_sales_page(db: Session, after_id: int = 0, limit: int = DEFAULT_PAGE_SIZE, load: str = "lazy"):
+    return get_page(db, models.Sale, after_id, limit, sale_load_options(load))
+
+def get_sale(db: Session, sale_id: int, load: str = "lazy"):
+    return db.query(models.Sale).options(*sale_load_options(load)).filter(models.Sale.id == sale_id).first()
+
+# Retries when SQLite reports "database is locked" under concurrent writers
+LOCK_RETRIES = 5
+LOCK_RETRY_DELAY = 0.05  # seconds, doubled after every attempt
+
+def is_lock_error(error: OperationalError):
+    return "database is locked" in str(error) or "database is busy" in str(error)
+
+def with_lock_retries(db: Session, write, *args):
+    """
+    Runs write(db, *args), rolled back and retried with a growing delay while
+    SQLite reports the database locked.
+    """
+    for attempt in range(LOCK_RETRIES):
+        try:
+            return write(db, *args)
+        except OperationalError as e:
+            db.rollback()
+            if not is_lock_error(e) or attempt == LOCK_RETRIES - 1:
+                raise
+            time.sleep(LOCK_RETRY_DELAY * 2 ** attempt)
+
+def reserve_stock(db: Session, product_id: int):
+    """
+    Atomically takes one unit of a product, so two concurrent sales can never
+    both get the last one. Raises ValueError (and rolls back) if the product is
+    out of stock or doesn't exist, like create_sales_bulk.
+    """
+    result = db.execute(
+        update(models.Product)
+        .where(models.Product.id == product_id, models.Product.qty_on_hand > 0)
+        .values(qty_on_hand=models.Product.qty_on_hand - 1)
+    )
+    if result.rowcount == 1:
+        return
+    # nothing updated: either out of stock or no such product
+    missing = db.query(models.Product.id).filter(models.Product.id == product_id).first() is None
+    db.rollback()
+    raise ValueError("Product not found." if missing else "Cannot create sale. Product is out of stock.")
+
+def sales_pricing(db: Session, pairs):
+    """
+    The unit_price, discount_percentage and commission_percentage to record on
+    sales of the given (product_id, sales_date) pairs, in the same order: the
+    product's current price and commission rate and the discount in effect on
+    the date. All None if the product doesn't exist.
+    """
+    product_ids = {product_id for product_id, _ in pairs}
+    prices = {
+        row[0]: row[1:]
+        for row in db.execute(
+            select(models.Product.id, models.Product.sale_price, models.Product.commission_percentage)
+            .where(models.Product.id.in_(product_ids))
+        )
+    }
+    pricing = []
+    for (product_id, sales_date), discount in zip(pairs, discount_index.get_discount_percentages(db, pairs)):
+        unit_price, commission_percentage = prices.get(product_id, (None, None))
+        pricing.append({
+            "unit_price": unit_price,
+            "discount_percentage": (discount or 0.0) if product_id in prices else None,
+            "commission_percentage": commission_percentage
+        })
+    return pricing
+
+def create_sale_once(db: Session, sale: schemas.SaleCreate):
+    """
+    One attempt at creating a sale, see create_sale for the retrying version.
+    """
+    reserve_stock(db, sale.product_id)
+    pricing = sales_pricing(db, [(sale.product_id, sale.sales_date)])[0]
+    db_sale = models.Sale(**sale.dict(), **pricing)
     db.add(db_sale)
+    db.flush()
+    sales_analytics.add_sales(db, [db_sale.id])
+    commission_report.refresh_commission_rollup(db, [sale_rollup_key(db_sale)])
     db.commit()
     db.refresh(db_sale)
     return db_sale
 
+def create_sale(db: Session, sale: schemas.SaleCreate):
+    return with_lock_retries(db, create_sale_once, sale)
+
+def create_sales_bulk(db: Session, sales: list[schemas.SaleCreate]):
+    return with_lock_retries(db, create_sales_bulk_once, sales)
+
+def create_sales_bulk_once(db: Session, sales: list[schemas.SaleCreate]):
+    """
+    Creates a batch of sales in one transaction (one attempt, see create_sales_bulk).
+
+    Stock is checked per product for the whole batch: rows are accepted in order
+    until a product runs out, later rows for it are reported as errors (by index).
+    Each product's qty_on_hand is decremented by a single UPDATE and all sales are
+    inserted with one executemany, priced with one product and one discount query.
+    """
+    product_ids = {sale.product_id for sale in sales}
+    remaining = dict(
+        db.query(models.Product.id, models.Product.qty_on_hand)
+        .filter(models.Product.id.in_(product_ids))
+        .all()
+    )
+
+    accepted = []
+    errors = []
+    sold = {}
+    for index, sale in enumerate(sales):
+        if sale.product_id not in remaining:
+            errors.append({"index": index, "detail": "Product not found."})
+            continue
+        if remaining[sale.product_id] - sold.get(sale.product_id, 0) <= 0:
+            errors.append({"index": index, "detail": "Cannot create sale. Product is out of stock."})
+            continue
+        sold[sale.product_id] = sold.get(sale.product_id, 0) + 1
+        accepted.append(sale.dict())
+
+    try:
+        for product_id, qty in sold.items():
+            result = db.execute(
+                update(models.Product)
+                .where(models.Product.id == product_id, models.Product.qty_on_hand >= qty)
+                .values(qty_on_hand=models.Product.qty_on_hand - qty)
+            )
+            if result.rowcount != 1:
+                raise ValueError("Stock changed while importing sales, please retry.")
+
+        if accepted:
+            pricing = sales_pricing(db, [(sale["product_id"], sale["sales_date"]) for sale in accepted])
+            accepted = [{**sale, **prices} for sale, prices in zip(accepted, pricing)]
+            sale_ids = db.scalars(insert(models.Sale).returning(models.Sale.id), accepted).all()
+            sales_analytics.add_sales(db, sale_ids)
+            commission_report.refresh_commission_rollup(db, {
+                commission_report.rollup_key(sale["salesperson_id"], sale["sales_date"])
+                for sale in accepted
+            })
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return {"created": len(accepted), "errors": errors}
+
 def update_sale(db: Session, sale_id: int, sale: schemas.SaleCreate):
     db_sale = db.query(models.Sale).filter(models.Sale.id == sale_id).first()
     if db_sale:
+        old_key = sale_rollup_key(db_sale)
+        log_sale_change(db, db_sale)
+        sales_analytics.add_sales(db, [sale_id], sign=-1)
+        # repriced only if it's now a sale of another product or on another day
+        repriced = (sale.product_id, sale.sales_date) != (db_sale.product_id, db_sale.sales_date)
         for key, value in sale.dict().items():
             setattr(db_sale, key, value)
+        if repriced:
+            for key, value in sales_pricing(db, [(sale.product_id, sale.sales_date)])[0].items():
+                setattr(db_sale, key, value)
+        db.flush()
+        sales_analytics.add_sales(db, [sale_id])
+        commission_report.refresh_commission_rollup(db, [old_key, sale_rollup_key(db_sale)])
         db.commit()
         db.refresh(db_sale)
     return db_sale
 
 def delete_sale(db: Session, sale_obj):
-    product = db.query(models.Product).filter(models.Product.id == sale_obj.product_id).first()
-    if product:
-        product.qty_on_hand += 1
+    db.execute(
+        update(models.Product)
+        .where(models.Product.id == sale_obj.product_id)
+        .values(qty_on_hand=models.Product.qty_on_hand + 1)
+    )
+    key = sale_rollup_key(sale_obj)
+    log_sale_change(db, sale_obj)
+    sales_analytics.add_sales(db, [sale_obj.id], sign=-1)
     db.delete(sale_obj)
+    db.flush()
+    commission_report.refresh_commission_rollup(db, [key])
+
+def log_sale_change(db: Session, sale_obj):
+    """
+    Logs the sale as it is before an update or delete (for incremental_report.py).
+    """
+    db.add(models.SaleChange(
+        sale_id=sale_obj.id,
+        salesperson_id=sale_obj.salesperson_id,
+        sales_date=sale_obj.sales_date,
+        unit_price=sale_obj.unit_price,
+        discount_percentage=sale_obj.discount_percentage,
+        commission_percentage=sale_obj.commission_percentage
+    ))
+
+# ---------- ROLLUPS ----------
+
+def sale_rollup_key(sale_obj):
+    return commission_report.rollup_key(sale_obj.salesperson_id, sale_obj.sales_date)
+
+def refresh_daily_rollup_for_sales(db: Session, *conditions):
+    """
+    Recomputes the daily sales rollup for every day with a sale matching the filters.
+    """
+    dates = db.scalars(select(models.Sale.sales_date).where(*conditions).distinct()).all()
+    sales_analytics.refresh_daily_rollup(db, dates)
 
 # ---------- DISCOUNTS ----------
 
 def get_discounts(db: Session):
     return db.query(models.Discount).all()
 
+def get_discounts_page(db: Session, after_id: int = 0, limit: int = DEFAULT_PAGE_SIZE, load: str = "lazy"):
+    options = [joinedload(models.Discount.product)] if load == "joined" else []
+    return get_page(db, models.Discount, after_id, limit, options)
+
 def get_discount(db: Session, discount_id: int):
     return db.query(models.Discount).filter(models.Discount.id == discount_id).first()
 
+# Sales record the discount they were made with, so discount changes don't
+# touch past sales or the rollups
+
 def create_discount(db: Session, discount: schemas.DiscountCreate):
     db_discount = models.Discount(**discount.dict())
     db.add(db_discount)
     db.commit()
     db.refresh(db_discount)
+    discount_index.invalidate(db_discount.product_id)
     return db_discount
 
 def update_discount(db: Session, discount_id: int, discount: schemas.DiscountCreate):
     db_discount = db.query(models.Discount).filter(models.Discount.id == discount_id).first()
     if db_discount:
+        old_product_id = db_discount.product_id
         for key, value in discount.dict().items():
             setattr(db_discount, key, value)
         db.commit()
         db.refresh(db_discount)
+        discount_index.invalidate(old_product_id, db_discount.product_id)
     return db_discount
+
+def delete_discount(db: Session, discount_obj):
+    product_id = discount_obj.product_id
+    db.delete(discount_obj)
+    db.commit()
+    discount_index.invalidate(product_id)
@@ -0,0 +1,139 @@
+"""
+In-memory index of discounts, used to find the discount on a product for a given date
+without querying the discounts table for every sale.
+
+Each product's discounts are flattened into sorted, non-overlapping date intervals,
+so a lookup is a binary search. Overlapping discounts resolve to the lowest id,
+the same one db.query(models.Discount)...first() returns.
+
+crud prices sales with the shared discount_index. A product's intervals are
+loaded on its first sale and rebuilt after crud creates, updates or deletes one
+of its discounts. DISCOUNT_INDEX_TTL also reloads them periodically, to pick up
+discount writes made by other worker processes.
+"""
+
+import heapq
+import os
+import threading
+import time
+from bisect import bisect_right
+from datetime import date
+from sqlalchemy.orm import Session
+import models
+
+DISCOUNT_INDEX_TTL = float(os.getenv("DISCOUNT_INDEX_TTL", "60"))  # seconds
+LOAD_CHUNK_SIZE = 500  # products per discounts query
+
+def build_intervals(discounts):
+    """
+    Flattens a product's discounts into (starts, ends, percentages) lists.
+    Dates are stored as ordinals, ends are exclusive.
+    """
+    spans = sorted(
+        (d.begin_date.toordinal(), d.end_date.toordinal() + 1, d.id, d.discount_percentage)
+        for d in discounts
+        if d.begin_date is not None and d.end_date is not None and d.begin_date <= d.end_date
+    )
+    points = sorted({p for begin, end, _, _ in spans for p in (begin, end)})
+
+    starts, ends, percentages = [], [], []
+    active = []  # heap of (id, end, percentage), lowest id on top
+    next_span = 0
+    for seg_start, seg_end in zip(points, points[1:]):
+        while next_span < len(spans) and spans[next_span][0] <= seg_start:
+            begin, end, discount_id, pct = spans[next_span]
+            heapq.heappush(active, (discount_id, end, pct))
+            next_span += 1
+        while active and active[0][1] <= seg_start:
+            heapq.heappop(active)
+        if not active:
+            continue
+
+        pct = active[0][2]
+        if ends and ends[-1] == seg_start and percentages[-1] == pct:
+            ends[-1] = seg_end
+        else:
+            starts.append(seg_start)
+            ends.append(seg_end)
+            percentages.append(pct)
+
+    return starts, ends, percentages
+
+class DiscountIndex:
+    def __init__(self, ttl: float = DISCOUNT_INDEX_TTL):
+        self.ttl = ttl
+        self._intervals = {}  # product_id -> (intervals, loaded_at)
+        self._versions = {}  # product_id -> number of invalidations
+        self._lock = threading.Lock()
+
+    def invalidate(self, *product_ids):
+        """
+        Rebuilds the intervals of the given products on their next lookup.
+        """
+        with self._lock:
+            for product_id in product_ids:
+                self._versions[product_id] = self._versions.get(product_id, 0) + 1
+                self._intervals.pop(product_id, None)
+
+    def clear(self):
+        with self._lock:
+            for product_id in list(self._intervals):
+                self._versions[product_id] = self._versions.get(product_id, 0) + 1
+            self._intervals.clear()
+
+    def _load(self, db: Session, product_ids):
+        """
+        {product_id: intervals} of the given products, loading those that aren't
+        loaded yet (or expired) with one discounts query per LOAD_CHUNK_SIZE products.
+        """
+        now = time.monotonic()
+        found, versions = {}, {}
+        with self._lock:
+            for product_id in product_ids:
+                entry = self._intervals.get(product_id)
+                if entry is not None and now - entry[1] < self.ttl:
+                    found[product_id] = entry[0]
+                else:
+                    versions[product_id] = self._versions.get(product_id, 0)
+        if not versions:
+            return found
+
+        by_product = {product_id: [] for product_id in versions}
+        missing = list(versions)
+        for i in range(0, len(missing), LOAD_CHUNK_SIZE):
+            for discount in db.query(models.Discount).filter(
+                models.Discount.product_id.in_(missing[i:i + LOAD_CHUNK_SIZE])
+            ):
+                by_product[discount.product_id].append(discount)
+
+        with self._lock:
+            for product_id, discounts in by_product.items():
+                found[product_id] = build_intervals(discounts)
+                # not kept if a write invalidated the product while it was read
+                if self._versions.get(product_id, 0) == versions[product_id]:
+                    self._intervals[product_id] = (found[product_id], now)
+        return found
+
+    def get_discount_percentages(self, db: Session, pairs):
+        """
+        The discount percentage (or None) on each (product_id, date) pair, in the
+        same order as the pairs.
+        """
+        intervals = self._load(db, {product_id for product_id, _ in pairs})
+        return [find(intervals.get(product_id), on_date) for product_id, on_date in pairs]
+
+def find(intervals, on_date: date):
+    """
+    The percentage of the interval containing the date, None if there is none.
+    """
+    if not intervals or on_date is None:
+        return None
+    starts, ends, percentages = intervals
+    day = on_date.toordinal()
+    i = bisect_right(starts, day) - 1
+    if i >= 0 and day < ends[i]:
+        return percentages[i]
+    return None
+
+# shared by every request in this process
+discount_index = DiscountIndex()
@@ -0,0 +1,112 @@
+"""
+Streaming exports of sales and the commission report as CSV or NDJSON.
+
+Rows are read in chunks through a server-side cursor and written to the response
+as they arrive, so memory stays flat whether 1k or 50M rows are exported.
+"""
+
+import csv
+import io
+import json
+from datetime import date
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from database import async_engine
+import models, commission_report
+
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+# matches the rounding of the commission report page
+ROUNDED_COLUMNS = ("sale_price", "commission", "total_sales_amount", "total_commission")
+# the commission report adds up millionths of a dollar
+MICROS_COLUMNS = ("total_sales_amount", "total_commission")
+
+def sale_filters(start_date: date | None = None, end_date: date | None = None,
+                 salesperson_id: int | None = None, product_id: int | None = None):
+    filters = []
+    if start_date:
+        filters.append(models.Sale.sales_date >= start_date)
+    if end_date:
+        filters.append(models.Sale.sales_date <= end_date)
+    if salesperson_id:
+        filters.append(models.Sale.salesperson_id == salesperson_id)
+    if product_id:
+        filters.append(models.Sale.product_id == product_id)
+    return filters
+
+def sales_export_query(**filters):
+    """
+    One row per sale with names, the discounted price and the commission.
+    """
+    return (
+        select(
+            models.Sale.id.label("sale_id"),
+            models.Sale.sales_date.label("sales_date"),
+            models.Sale.product_id.label("product_id"),
+            models.Product.name.label("product_name"),
+            models.Sale.salesperson_id.label("salesperson_id"),
+            models.Salesperson.first_name.label("salesperson_first_name"),
+            models.Salesperson.last_name.label("salesperson_last_name"),
+            models.Sale.customer_id.label("customer_id"),
+            models.Customer.first_name.label("customer_first_name"),
+            models.Customer.last_name.label("customer_last_name"),
+            commission_report.discounted_price().label("sale_price"),
+            commission_report.sale_commission().label("commission")
+        )
+        .outerjoin(models.Product, models.Product.id == models.Sale.product_id)
+        .outerjoin(models.Salesperson, models.Salesperson.id == models.Sale.salesperson_id)
+        .outerjoin(models.Customer, models.Customer.id == models.Sale.customer_id)
+        .where(*sale_filters(**filters))
+        .order_by(models.Sale.id)
+    )
+
+def commission_export_query(salesperson_id: int | None = None, **filters):
+    """
+    The commission report over any date range, optionally limited to one product
+    and/or one salesperson.
+    """
+    totals = commission_report.sales_totals_query().where(*sale_filters(**filters))
+    query = commission_report.report_query(totals)
+    if salesperson_id:
+        query = query.where(models.Salesperson.id == salesperson_id)
+    return query
+
+def format_value(column, value):
+    if value is None:
+        return None
+    if column in MICROS_COLUMNS:
+        value = value / commission_report.MICROS
+    if column in ROUNDED_COLUMNS:
+        return round(value, 2)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+async def stream_rows(query, export_format: str):
+    async with async_engine.connect() as conn:
+        result = await conn.stream(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        columns = list(result.keys())
+
+        if export_format == "csv":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(columns)
+            yield buffer.getvalue()
+
+        async for rows in result.partitions():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer) if export_format == "csv" else None
+            for row in rows:
+                values = [format_value(column, value) for column, value in zip(columns, row)]
+                if writer:
+                    writer.writerow(values)
+                else:
+                    buffer.write(json.dumps(dict(zip(columns, values))) + "\n")
+            yield buffer.getvalue()
+
+def export_response(query, export_format: str, filename: str):
+    return StreamingResponse(
+        stream_rows(query, export_format),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
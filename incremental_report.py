@@ -0,0 +1,156 @@
+"""
+Commission report kept up to date by applying only what changed since the last run.
+
+The per-salesperson totals of a report are remembered (in this process) with
+two high-water marks: the last sale id and the last sale_changes row they
+include. The next run adds up the sales created after the first mark, and for
+every sale updated or deleted after the second one (crud logs its row as it
+was before, see models.SaleChange) takes out what it added and adds what the
+sale is now. Product and discount edits don't change past sales (each sale
+carries its own price, discount and commission rate), so nothing else needs
+logging. Log entries below every report's second mark are no longer needed and
+are deleted after each run; a report whose mark was pruned away meanwhile (by
+another process, further along) or cleared is recomputed in full.
+
+Sales are added and taken out in whole millionths of a dollar (integers, see
+commission_report.sum_micros), so the totals are exactly those of
+compute_commission_report. Pass full=True
+for a complete recompute after the sales were changed outside crud
+(seed_data.py), and now and then on PostgreSQL, where ids are handed out
+before commit and a write that commits after a later one can be missed.
+"""
+
+import threading
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from report_cache import cache_key
+import models, commission_report, parallel_report
+
+CHANGED_SALES_CHUNK = 500
+READ_ATTEMPTS = 5
+
+class IncrementalTotals:
+    def __init__(self, totals, max_sale_id: int, max_change_id: int):
+        self.totals = totals
+        self.max_sale_id = max_sale_id
+        self.max_change_id = max_change_id
+
+# {(year, quarter): IncrementalTotals}, shared by every request in this process
+incremental_totals = {}
+incremental_lock = threading.Lock()
+
+def high_water_marks(db: Session):
+    return (
+        db.scalar(select(func.coalesce(func.max(models.Sale.id), 0))),
+        db.scalar(select(func.coalesce(func.max(models.SaleChange.id), 0)))
+    )
+
+def remove_logged_sales(db: Session, delta, first_change_ids, date_range):
+    """
+    Takes the logged (before the change) version of sales out of the totals.
+    """
+    query = commission_report.sales_totals_query(date_range, models.SaleChange).where(
+        models.SaleChange.id.in_(first_change_ids)
+    )
+    parallel_report.add_totals(delta, [
+        (sp_id, -num_sales, -(amount or 0), -(commission or 0))
+        for sp_id, num_sales, amount, commission in db.execute(query)
+    ])
+
+def read_changes(db: Session, state: IncrementalTotals, date_range):
+    """
+    (delta, max_sale_id, max_change_id): what changed in the totals up to the
+    returned high-water marks, or None if a write was committed while reading.
+    """
+    max_sale_id, max_change_id = high_water_marks(db)
+    query = commission_report.sales_totals_query(date_range)
+    delta = {}
+
+    if max_change_id > state.max_change_id:
+        # the first logged version of each sale is the one the totals include,
+        # sales created after the last run are read as they are now below
+        logged = (
+            models.SaleChange.id > state.max_change_id,
+            models.SaleChange.id <= max_change_id,
+            models.SaleChange.sale_id <= state.max_sale_id
+        )
+        remove_logged_sales(db, delta, (
+            select(func.min(models.SaleChange.id)).where(*logged).group_by(models.SaleChange.sale_id)
+        ), date_range)
+        sale_ids = db.scalars(select(models.SaleChange.sale_id).where(*logged).distinct()).all()
+        for start in range(0, len(sale_ids), CHANGED_SALES_CHUNK):
+            parallel_report.add_totals(
+                delta, db.execute(query.where(models.Sale.id.in_(sale_ids[start:start + CHANGED_SALES_CHUNK])))
+            )
+
+    if max_sale_id > state.max_sale_id:
+        new_sales = (models.Sale.id > state.max_sale_id, models.Sale.id <= max_sale_id)
+        if state.max_sale_id:
+            # a few new sales: picked by id first, or SQLite walks the whole
+            # period on the sales_date index
+            new_sales = (models.Sale.id.in_(select(models.Sale.id).where(*new_sales)),)
+        parallel_report.add_totals(delta, db.execute(query.where(*new_sales)))
+
+    # every update and delete is logged in its own transaction: an unchanged
+    # log means the sales read above are those of the high-water marks
+    if high_water_marks(db)[1] != max_change_id:
+        return None
+    return delta, max_sale_id, max_change_id
+
+def apply_changes(db: Session, state: IncrementalTotals, date_range):
+    """
+    Brings the totals up to the current sales and moves the high-water marks.
+    """
+    for _ in range(READ_ATTEMPTS):
+        changes = read_changes(db, state, date_range)
+        if changes is not None:
+            break
+    else:
+        raise RuntimeError("Sales kept changing while the report was computed, please retry.")
+
+    delta, max_sale_id, max_change_id = changes
+    for sp_id, (num_sales, amount, commission) in delta.items():
+        row_totals = state.totals.setdefault(sp_id, [0, 0, 0])
+        row_totals[0] += num_sales
+        row_totals[1] += amount or 0
+        row_totals[2] += commission or 0
+    # follows the max id down too: SQLite hands a deleted last id out again
+    state.max_sale_id, state.max_change_id = max_sale_id, max_change_id
+
+def log_intact(db: Session, state: IncrementalTotals):
+    """
+    False if logged changes the totals don't include yet may have been deleted.
+    """
+    if state.max_change_id == 0:
+        return db.scalar(select(func.min(models.SaleChange.id))) in (None, 1)
+    # the entry of the mark itself is never pruned
+    return db.scalar(
+        select(models.SaleChange.id).where(models.SaleChange.id == state.max_change_id)
+    ) is not None
+
+def prune_changes(db: Session):
+    """
+    Deletes the log entries every remembered report is past. The last entry
+    read is kept, so ids aren't handed out again and marks stay checkable.
+    """
+    oldest_mark = min(state.max_change_id for state in incremental_totals.values())
+    if oldest_mark > 1:
+        db.execute(delete(models.SaleChange).where(models.SaleChange.id < oldest_mark))
+        db.commit()
+
+def compute_commission_report(db: Session, year: int, quarter: int, full: bool = False):
+    """
+    compute_commission_report from the remembered totals plus the changes since
+    the last run. full=True recomputes the totals from scratch.
+    """
+    key = cache_key(year, quarter)
+    date_range = commission_report.get_report_date_range(year, quarter)
+    with incremental_lock:
+        state = incremental_totals.get(key)
+        if state is None or full or not log_intact(db, state):
+            # the changes logged so far are already part of the sales read
+            state = IncrementalTotals({}, 0, high_water_marks(db)[1])
+        apply_changes(db, state, date_range)
+        incremental_totals[key] = state
+        prune_changes(db)
+        return parallel_report.report_from_totals(db, state.totals)
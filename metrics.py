@@ -0,0 +1,178 @@
+"""
+Per-request performance metrics: number of SQL statements, time spent in the
+database, time spent rendering templates and total latency.
+
+MetricsMiddleware starts a RequestStats for every request. SQLAlchemy cursor events
+on the engines from database.py add each statement's time to it, and
+instrument_templates times TemplateResponse (where Jinja renders). The numbers are
+sent back in a Server-Timing header and added to per-route histograms, which
+/metrics serves in the Prometheus text format.
+
+Metrics are kept per process.
+"""
+
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from sqlalchemy import event
+from database import engine, async_engine
+
+# ---------- PER-REQUEST STATS ----------
+
+class RequestStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self):
+        return ", ".join([
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.sql_count} queries"',
+            f"render;dur={self.render_time * 1000:.2f}",
+            f"total;dur={self.elapsed() * 1000:.2f}"
+        ])
+
+# the stats of the request being handled (None outside of a request)
+current_stats = ContextVar("current_stats", default=None)
+
+# ---------- SQLALCHEMY HOOKS ----------
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_start_time"].pop()
+    stats = current_stats.get()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.db_time += duration
+
+def instrument_engine(bind):
+    """
+    Times every statement run on a (sync) engine. For an AsyncEngine pass async_engine.sync_engine.
+    """
+    event.listen(bind, "before_cursor_execute", before_cursor_execute)
+    event.listen(bind, "after_cursor_execute", after_cursor_execute)
+
+# scripts and startup use engine, the async routes use async_engine
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+# ---------- TEMPLATES ----------
+
+def instrument_templates(templates):
+    """
+    Wraps templates.TemplateResponse, which renders the template when called.
+    """
+    template_response = templates.TemplateResponse
+
+    @wraps(template_response)
+    def timed_template_response(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return template_response(*args, **kwargs)
+        finally:
+            stats = current_stats.get()
+            if stats is not None:
+                stats.render_time += time.perf_counter() - start
+
+    templates.TemplateResponse = timed_template_response
+    return templates
+
+# ---------- HISTOGRAMS ----------
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self, label_names):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_items = sorted(self._series.items())
+        for labels, series in series_items:
+            label_text = ",".join(f'{name}="{value}"' for name, value in zip(label_names, labels))
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {series[-1]}")
+        return lines
+
+LABELS = ("method", "route")
+
+request_duration = Histogram("http_request_duration_seconds", "Total request latency.", SECONDS_BUCKETS)
+db_duration = Histogram("http_request_db_seconds", "Time spent running SQL per request.", SECONDS_BUCKETS)
+render_duration = Histogram("http_request_render_seconds", "Time spent rendering templates per request.", SECONDS_BUCKETS)
+sql_statements = Histogram("http_request_sql_statements", "SQL statements run per request.", COUNT_BUCKETS)
+HISTOGRAMS = (request_duration, db_duration, render_duration, sql_statements)
+
+def record(labels: tuple, stats: RequestStats):
+    request_duration.observe(labels, stats.elapsed())
+    db_duration.observe(labels, stats.db_time)
+    render_duration.observe(labels, stats.render_time)
+    sql_statements.observe(labels, stats.sql_count)
+
+def render_metrics():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render(LABELS)
+    return "\n".join(lines) + "\n"
+
+# ---------- MIDDLEWARE ----------
+
+def route_label(scope):
+    # the route template (/sales/{sale_id}) keeps the number of series bounded
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (not BaseHTTPMiddleware) so streamed responses are
+    measured until their last chunk is sent.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", stats.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_stats.reset(token)
+            record((scope["method"], route_label(scope)), stats)
@@ -0,0 +1,176 @@
+"""
+This file brings an existing database up to date with the models.
+Base.metadata.create_all() only creates missing tables, so columns and indexes
+added to tables that already exist (e.g. an old bespoked_bikes.db) are created
+here, along with the search indexes (see search.py). The pricing of sales made
+before it was recorded on them is backfilled, and the commission and daily sales
+rollups are filled from existing sales when they are first created.
+
+Run it directly to migrate, backfill the pricing of sales inserted outside crud
+and check the query plans of the hot paths:
+    python migrations.py
+"""
+
+from datetime import date
+from sqlalchemy import func, inspect, select, text, update
+from sqlalchemy.orm import Session
+from database import engine, Base
+import models, commission_report, sales_analytics, search
+
+BACKFILL_BATCH_SIZE = 10_000  # sale ids per transaction
+# indexes made redundant by wider ones (ix_sales_sales_date_pricing starts with sales_date)
+OBSOLETE_INDEXES = ("ix_sales_sales_date",)
+
+def create_missing_indexes(bind):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+def drop_obsolete_indexes(bind):
+    with bind.begin() as conn:
+        for name in OBSOLETE_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+def add_missing_columns(bind):
+    """
+    Adds the model columns missing from existing tables (nullable, no default).
+    Returns the added columns as (table, column) names.
+    """
+    inspector = inspect(bind)
+    added = []
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    conn.execute(text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(bind.dialect)}"
+                    ))
+                    added.append((table.name, column.name))
+    return added
+
+def sale_product_value(column):
+    """
+    Correlated subquery returning a column of the sale's product.
+    """
+    return (
+        select(column)
+        .where(models.Product.id == models.Sale.product_id)
+        .correlate(models.Sale)
+        .scalar_subquery()
+    )
+
+def backfill_sale_prices(bind=engine, batch_size: int = BACKFILL_BATCH_SIZE):
+    """
+    Records the unit price, discount and commission rate on sales that have none,
+    from their product's current values and the discount in effect on the sale
+    date (what the reports used before sales carried them). Sales of products
+    that don't exist stay unpriced. Runs in batches of sale ids, each its own
+    transaction, so writers are never blocked for long. Returns the number of sales priced.
+    """
+    discount = (
+        select(models.Discount.discount_percentage)
+        .where(models.Discount.id == commission_report.active_discount_id())
+        .scalar_subquery()
+    )
+    with bind.connect() as conn:
+        max_id = conn.scalar(select(func.max(models.Sale.id))) or 0
+
+    priced = 0
+    for after_id in range(0, max_id, batch_size):
+        with bind.begin() as conn:
+            priced += conn.execute(
+                update(models.Sale)
+                .where(
+                    models.Sale.id > after_id,
+                    models.Sale.id <= after_id + batch_size,
+                    models.Sale.unit_price.is_(None),
+                    sale_product_value(models.Product.sale_price).is_not(None)
+                )
+                .values(
+                    unit_price=sale_product_value(models.Product.sale_price),
+                    discount_percentage=func.coalesce(discount, 0.0),
+                    commission_percentage=sale_product_value(models.Product.commission_percentage)
+                )
+            ).rowcount
+    return priced
+
+def run_migrations(bind=engine):
+    had_rollup = inspect(bind).has_table(models.CommissionRollup.__tablename__)
+    had_daily_rollup = inspect(bind).has_table(models.DailySalesRollup.__tablename__)
+
+    Base.metadata.create_all(bind=bind)
+    added_columns = add_missing_columns(bind)
+    # the reports and rollups read the pricing from the sales (filled before
+    # the index covering it exists, so it isn't updated row by row)
+    if (models.Sale.__tablename__, "unit_price") in added_columns:
+        backfill_sale_prices(bind)
+    create_missing_indexes(bind)
+    drop_obsolete_indexes(bind)
+    search.create_search_indexes(bind)
+
+    # fill the rollup tables from existing sales the first time they are created
+    if not had_rollup:
+        with Session(bind=bind) as db:
+            commission_report.rebuild_commission_rollup(db)
+    if not had_daily_rollup:
+        with Session(bind=bind) as db:
+            sales_analytics.rebuild_daily_rollup(db)
+
+# ---------- QUERY PLAN CHECKS ----------
+
+def hot_path_queries():
+    """
+    The statements that must be answered from an index, never a table scan.
+    """
+    today = date.today()
+    discount_lookup = select(models.Discount).where(
+        models.Discount.product_id == 1,
+        models.Discount.begin_date <= today,
+        models.Discount.end_date >= today
+    )
+    salesperson_sales = select(models.Sale).where(
+        models.Sale.salesperson_id == 1,
+        models.Sale.sales_date >= date(today.year, 1, 1),
+        models.Sale.sales_date <= today
+    )
+    report_totals = commission_report.sales_totals_query(
+        commission_report.get_report_date_range(today.year, 0)
+    )
+    return {
+        "discount_lookup": discount_lookup,
+        "salesperson_sales": salesperson_sales,
+        "report_totals": report_totals
+    }
+
+def explain_query_plan(conn, query):
+    compiled = query.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+    rows = conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+    return [row[-1] for row in rows]
+
+def check_query_plans(bind=engine):
+    """
+    Raises RuntimeError if any hot path scans the sales or discounts table.
+    Only meaningful on SQLite, other backends are skipped.
+    """
+    if bind.dialect.name != "sqlite":
+        return {}
+
+    plans = {}
+    with bind.connect() as conn:
+        for name, query in hot_path_queries().items():
+            plan = explain_query_plan(conn, query)
+            plans[name] = plan
+            for step in plan:
+                if step.startswith(("SCAN sales", "SCAN discounts")):
+                    raise RuntimeError(f"{name} falls back to a table scan: {step}")
+    return plans
+
+if __name__ == "__main__":
+    run_migrations()
+    print(f"Recorded the pricing of {backfill_sale_prices()} sales.")
+    for name, plan in check_query_plans().items():
+        print(name)
+        for step in plan:
+            print("    " + step)
+    print("Database migrated successfully.")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -48,11 +48,37 @@ class Sale(Base):
     salesperson_id = Column(Integer, ForeignKey("salespersons.id"))
     customer_id = Column(Integer, ForeignKey("customers.id"))
     sales_date = Column(Date)
+    # pricing at the time of sale, so later product and discount edits don't change
+    # past sales (None when the product didn't exist)
+    unit_price = Column(Float, nullable=True)  # the product's sale_price, before the discount
+    discount_percentage = Column(Float, nullable=True)  # 0 when no discount applied
+    commission_percentage = Column(Float, nullable=True)
 
     product = relationship("Product")
     salesperson = relationship("Salesperson")
     customer = relationship("Customer")
 
+    # commission report filters by salesperson + date range
+    __table_args__ = (
+        Index("ix_sales_salesperson_id_sales_date", "salesperson_id", "sales_date"),
+        # covers the report totals: sales in a date range added up from the index alone
+        Index("ix_sales_sales_date_pricing", "sales_date", "salesperson_id",
+              "unit_price", "discount_percentage", "commission_percentage"),
+    )
+
+# Sales as they were before an update or delete, logged by crud so
+# incremental_report.py can take them out of totals it already added up
+class SaleChange(Base):
+    __tablename__ = "sale_changes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sale_id = Column(Integer)
+    salesperson_id = Column(Integer)
+    sales_date = Column(Date)
+    unit_price = Column(Float, nullable=True)
+    discount_percentage = Column(Float, nullable=True)
+    commission_percentage = Column(Float, nullable=True)
+
 # Discount table
 class Discount(Base):
     __tablename__ = "discounts"
@@ -63,4 +89,42 @@ class Discount(Base):
     end_date = Column(Date)
     discount_percentage = Column(Float)
 
-    product = relationship("Product")
\ No newline at end of file
+    product = relationship("Product")
+
+    # discount lookup is by product + begin_date <= date <= end_date
+    __table_args__ = (
+        Index("ix_discounts_product_id_begin_date_end_date", "product_id", "begin_date", "end_date"),
+    )
+
+# Commission rollup table (per salesperson, per quarter), kept current by crud
+class CommissionRollup(Base):
+    __tablename__ = "commission_rollup"
+
+    salesperson_id = Column(Integer, ForeignKey("salespersons.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    quarter = Column(Integer, primary_key=True)
+    num_sales = Column(Integer)
+    total_sales_amount = Column(Float)
+    total_commission = Column(Float)
+
+    __table_args__ = (
+        Index("ix_commission_rollup_year_quarter", "year", "quarter"),
+    )
+
+# Daily sales rollup table: per day, the totals of all sales ("all") and of each
+# product, manufacturer, style and salesperson. Kept current by crud
+class DailySalesRollup(Base):
+    __tablename__ = "daily_sales_rollup"
+
+    dimension = Column(String, primary_key=True)  # all, product, manufacturer, style or salesperson
+    group_key = Column(String, primary_key=True)  # the id/name within the dimension, "" for all
+    sales_date = Column(Date, primary_key=True)
+    num_sales = Column(Integer)
+    list_amount = Column(Float)  # before discounts
+    total_sales_amount = Column(Float)
+    total_commission = Column(Float)
+
+    # crud replaces whole days
+    __table_args__ = (
+        Index("ix_daily_sales_rollup_sales_date", "sales_date"),
+    )
\ No newline at end of file
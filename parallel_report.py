@@ -0,0 +1,187 @@
+"""
+Commission report computed by several processes at once, for reports over so
+many sales (all years) that one grouped query keeps a single core busy.
+
+The sales are split into partitions, each one a sales_totals_query over part of
+them, run in a ProcessPoolExecutor whose workers open their own read-only
+connection. Partial totals are added up per salesperson in partition order.
+    salesperson: salesperson id ranges of about the same number of sales
+                 (weighed with commission_rollup). Every salesperson's totals
+                 come from one query, so the report is the single query's.
+    quarter:     one partition per calendar quarter of the period, added up
+                 across quarters (exact too, the totals are whole millionths
+                 of a dollar).
+
+The worker pool is started on first use (spawned, so a script using it needs
+the usual if __name__ == "__main__" guard) and kept for the next reports. The
+workers read committed data only (not the caller's pending changes), and need a
+database they can open themselves (not an in-memory SQLite).
+    PARALLEL_REPORT_WORKERS (default: number of CPUs)
+
+Compare it with the single query:
+    python -m benchmarks.parallel_report --sizes 20M --workers 1,2,4,8
+"""
+
+import os
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from database import make_engine
+import models, commission_report
+
+PARALLEL_REPORT_WORKERS = int(os.getenv("PARALLEL_REPORT_WORKERS", str(os.cpu_count() or 1)))
+# more partitions than workers, so a worker that finishes early takes the next one
+PARTITIONS_PER_WORKER = 2
+PARTITION_KINDS = ("salesperson", "quarter")
+
+# ---------- WORKERS ----------
+
+worker_engine = None
+
+def init_worker(url: str):
+    global worker_engine
+    worker_engine = make_engine(url, read_only=True)
+
+def partition_totals(date_range, salesperson_range=None):
+    """
+    Runs in a worker: [(salesperson_id, num_sales, total_sales_amount, total_commission)]
+    of the sales in one partition.
+    """
+    query = commission_report.sales_totals_query(date_range)
+    if salesperson_range:
+        query = in_salesperson_range(query, salesperson_range)
+    with worker_engine.connect() as conn:
+        return [tuple(row) for row in conn.execute(query)]
+
+# started on first use and kept for the next reports: starting the worker
+# interpreters costs more than a small report
+worker_pools = {}
+
+def worker_pool(url: str, workers: int):
+    """
+    The pool of worker processes reading url.
+    """
+    pool = worker_pools.get((url, workers))
+    if pool is None:
+        # spawn: a fresh interpreter per worker, nothing inherited from the
+        # (threaded) parent process and its open connections
+        pool = worker_pools[url, workers] = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(url,)
+        )
+    return pool
+
+@atexit.register
+def shutdown_worker_pools():
+    for pool in worker_pools.values():
+        pool.shutdown(cancel_futures=True)
+    worker_pools.clear()
+
+# ---------- PARTITIONS ----------
+
+def in_salesperson_range(totals_query, salesperson_range):
+    """
+    Limits a per-salesperson totals query to a (first_id, last_id) range.
+    """
+    first_id, last_id = salesperson_range
+    return totals_query.where(totals_query.selected_columns.salesperson_id.between(first_id, last_id))
+
+def salesperson_partitions(db: Session, year: int, quarter: int, count: int):
+    """
+    Up to count (first_id, last_id) salesperson ranges with about the same number of sales.
+    """
+    ids = db.scalars(select(models.Salesperson.id).order_by(models.Salesperson.id)).all()
+    if not ids:
+        return []
+    weights_query = select(
+        models.CommissionRollup.salesperson_id, func.sum(models.CommissionRollup.num_sales)
+    ).group_by(models.CommissionRollup.salesperson_id)
+    if year:
+        weights_query = weights_query.where(models.CommissionRollup.year == year)
+    if quarter:
+        weights_query = weights_query.where(models.CommissionRollup.quarter == quarter)
+    weights = dict(db.execute(weights_query).all())
+
+    # +1 so salespersons missing from the rollup still spread out
+    total = sum(weights.get(sp_id, 0) + 1 for sp_id in ids)
+    ranges, start, running = [], 0, 0
+    for i, sp_id in enumerate(ids):
+        running += weights.get(sp_id, 0) + 1
+        if running >= total * (len(ranges) + 1) / count or i == len(ids) - 1:
+            ranges.append((ids[start], sp_id))
+            start = i + 1
+    return ranges
+
+def quarter_partitions(db: Session, year: int, quarter: int):
+    """
+    (start, end) date ranges of every calendar quarter in the report period.
+    """
+    if year:
+        quarters = [(year, quarter)] if quarter else [(year, q) for q in range(1, 5)]
+    else:
+        first, last = db.execute(select(func.min(models.Sale.sales_date), func.max(models.Sale.sales_date))).one()
+        if first is None:
+            return []
+        year, quarter = first.year, (first.month - 1) // 3 + 1
+        quarters = []
+        while (year, quarter) <= (last.year, (last.month - 1) // 3 + 1):
+            quarters.append((year, quarter))
+            year, quarter = (year, quarter + 1) if quarter < 4 else (year + 1, 1)
+    return [commission_report.get_report_date_range(y, q) for y, q in quarters]
+
+# ---------- REPORT ----------
+
+def compute_commission_report(db: Session, year: int, quarter: int,
+                              workers: int = PARALLEL_REPORT_WORKERS, partition_by: str = "salesperson"):
+    """
+    compute_commission_report with the partitions run by a pool of worker processes.
+    """
+    if partition_by not in PARTITION_KINDS:
+        raise ValueError(f"partition_by must be one of {', '.join(PARTITION_KINDS)}")
+
+    date_range = commission_report.get_report_date_range(year, quarter)
+    if partition_by == "salesperson":
+        partitions = [
+            (date_range, (first_id, last_id))
+            for first_id, last_id in salesperson_partitions(db, year, quarter, workers * PARTITIONS_PER_WORKER)
+        ]
+    else:
+        partitions = [(quarter_range, None) for quarter_range in quarter_partitions(db, year, quarter)]
+
+    totals = {}
+    if partitions:
+        pool = worker_pool(db.get_bind().url.render_as_string(hide_password=False), workers)
+        for rows in pool.map(partition_totals, *zip(*partitions)):
+            add_totals(totals, rows)
+    return report_from_totals(db, totals)
+
+def add_totals(totals, rows):
+    """
+    Adds (salesperson_id, num_sales, total_sales_amount, total_commission) rows
+    of one partition to the {salesperson_id: [num_sales, amount, commission]} totals.
+    """
+    for sp_id, num_sales, amount, commission in rows:
+        if sp_id not in totals:
+            totals[sp_id] = [num_sales, amount, commission]
+        else:
+            row_totals = totals[sp_id]
+            row_totals[0] += num_sales
+            row_totals[1] += amount
+            row_totals[2] += commission
+
+def report_from_totals(db: Session, totals):
+    """
+    Report rows for every salesperson from the added up totals.
+    """
+    salespersons = db.execute(
+        select(models.Salesperson.id, models.Salesperson.first_name, models.Salesperson.last_name)
+        .order_by(models.Salesperson.id)
+    ).all()
+    return commission_report.format_report(
+        (sp_id, first_name, last_name, *totals.get(sp_id, (0, 0, 0)))
+        for sp_id, first_name, last_name in salespersons
+    )
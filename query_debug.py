@@ -0,0 +1,227 @@
+"""
+Slow-query log and N+1 detector for development and staging (QUERY_DEBUG=true).
+
+Every statement is reduced to a fingerprint (literals and IN lists replaced, so
+"... WHERE id = 1" and "... WHERE id = 2" match). Within one request, a SELECT
+fingerprint that runs N_PLUS_ONE_THRESHOLD times or more is logged as a likely N+1,
+e.g. one discount query per sale or a lazy sale.product load per row of a list page.
+Statements slower than SLOW_QUERY_MS are logged with their parameters, the route and
+the crud/report function that ran them.
+
+Everything is also aggregated per (route, fingerprint), see /debug/queries, to
+decide what to fix first. In tests and scripts use assert_no_n_plus_one():
+
+    with query_debug.assert_no_n_plus_one():
+        crud.get_sales_page(db, load="joined")
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from database import engine, async_engine
+
+QUERY_DEBUG = os.getenv("QUERY_DEBUG", "false").lower() in ("1", "true", "yes")
+# 0 turns the slow-query log off (the default outside of QUERY_DEBUG)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100" if QUERY_DEBUG else "0"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+logger = logging.getLogger("bespoked_bikes.queries")
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# frames from these files are skipped when looking for the calling function
+INTERNAL_FILES = {"query_debug.py", "metrics.py", "database.py", "async_crud.py"}
+
+# ---------- FINGERPRINTS ----------
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+|__\[POSTCOMPILE_\w+\])\s*,?)+\)", re.IGNORECASE)
+WHITESPACE = re.compile(r"\s+")
+
+def fingerprint(statement: str):
+    """
+    The statement with literals, IN lists and whitespace normalized.
+    """
+    statement = STRING_LITERAL.sub("?", statement)
+    statement = NUMBER_LITERAL.sub("?", statement)
+    statement = IN_LIST.sub("IN (...)", statement)
+    return WHITESPACE.sub(" ", statement).strip()
+
+def fingerprint_id(text: str):
+    return hashlib.sha1(text.encode()).hexdigest()[:10]
+
+def is_select(text: str):
+    return text.lstrip("( ").upper().startswith(("SELECT", "WITH"))
+
+def calling_function():
+    """
+    "module.function (file:line)" of the innermost project function (crud, the
+    report, a route) on the stack, skipping this module and the database plumbing.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PROJECT_DIR) and os.path.basename(filename) not in INTERNAL_FILES:
+            module = os.path.splitext(os.path.relpath(filename, PROJECT_DIR))[0].replace(os.sep, ".")
+            return f"{module}.{frame.f_code.co_name} ({os.path.basename(filename)}:{frame.f_lineno})"
+        frame = frame.f_back
+    return "unknown"
+
+# ---------- PER-REQUEST TRACKING ----------
+
+class QueryTracker:
+    """
+    Counts the statements run while it is active, by fingerprint.
+    """
+    def __init__(self, route: str = None):
+        self.route = route
+        self.queries = {}  # fingerprint -> {"count", "time", "max_time", "caller"}
+
+    def record(self, text: str, duration: float):
+        query = self.queries.get(text)
+        if query is None:
+            query = self.queries[text] = {"count": 0, "time": 0.0, "max_time": 0.0, "caller": calling_function()}
+        query["count"] += 1
+        query["time"] += duration
+        query["max_time"] = max(query["max_time"], duration)
+
+    def repeated_selects(self, threshold: int = N_PLUS_ONE_THRESHOLD):
+        return {
+            text: query for text, query in self.queries.items()
+            if query["count"] >= threshold and is_select(text)
+        }
+
+current_tracker = ContextVar("current_tracker", default=None)
+
+@contextmanager
+def track_queries(route: str = None):
+    tracker = QueryTracker(route)
+    token = current_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        current_tracker.reset(token)
+
+@contextmanager
+def assert_no_n_plus_one(threshold: int = N_PLUS_ONE_THRESHOLD):
+    """
+    Fails with AssertionError if a SELECT repeats threshold times or more in the block.
+    """
+    with track_queries() as tracker:
+        yield tracker
+    repeated = tracker.repeated_selects(threshold)
+    if repeated:
+        raise AssertionError("Possible N+1 queries:\n" + "\n".join(
+            f"  {query['count']}x from {query['caller']}: {text}" for text, query in repeated.items()
+        ))
+
+# ---------- AGGREGATES ----------
+
+class QueryReport:
+    """
+    Totals per (route, fingerprint) over all tracked requests in this process.
+    """
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def add(self, tracker: QueryTracker, threshold: int = N_PLUS_ONE_THRESHOLD):
+        repeated = tracker.repeated_selects(threshold)
+        with self._lock:
+            for text, query in tracker.queries.items():
+                key = (tracker.route, text)
+                row = self._rows.get(key)
+                if row is None:
+                    row = self._rows[key] = {
+                        "route": tracker.route, "fingerprint_id": fingerprint_id(text), "fingerprint": text,
+                        "caller": query["caller"], "requests": 0, "executions": 0, "total_ms": 0.0,
+                        "max_ms": 0.0, "max_per_request": 0, "n_plus_one_requests": 0
+                    }
+                row["requests"] += 1
+                row["executions"] += query["count"]
+                row["total_ms"] += query["time"] * 1000
+                row["max_ms"] = max(row["max_ms"], query["max_time"] * 1000)
+                row["max_per_request"] = max(row["max_per_request"], query["count"])
+                row["n_plus_one_requests"] += text in repeated
+
+    def rows(self):
+        """
+        N+1 suspects first, then by total time spent.
+        """
+        with self._lock:
+            rows = [dict(row) for row in self._rows.values()]
+        for row in rows:
+            row["total_ms"] = round(row["total_ms"], 3)
+            row["max_ms"] = round(row["max_ms"], 3)
+        return sorted(rows, key=lambda row: (-row["n_plus_one_requests"], -row["total_ms"]))
+
+    def clear(self):
+        with self._lock:
+            self._rows = {}
+
+query_report = QueryReport()
+
+# ---------- SQLALCHEMY HOOKS ----------
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_debug_start", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_debug_start"].pop()
+    tracker = current_tracker.get()
+    if tracker is None and not SLOW_QUERY_MS:
+        return
+
+    text = fingerprint(statement)
+    if tracker is not None:
+        tracker.record(text, duration)
+    if SLOW_QUERY_MS and duration * 1000 >= SLOW_QUERY_MS:
+        logger.warning(
+            "slow query %.1f ms [%s] in %s from %s: %s params=%r",
+            duration * 1000, fingerprint_id(text), tracker.route if tracker else "-",
+            calling_function(), statement, parameters
+        )
+
+def instrument_engine(bind):
+    event.listen(bind, "before_cursor_execute", before_cursor_execute)
+    event.listen(bind, "after_cursor_execute", after_cursor_execute)
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+# ---------- MIDDLEWARE ----------
+
+class QueryDebugMiddleware:
+    """
+    Tracks each request, logs likely N+1 patterns and adds the request to query_report.
+    Only added to the apps when QUERY_DEBUG is on.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries(f"{scope['method']} {scope['path']}") as tracker:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                # report by route template (/sales/{sale_id}) rather than the raw path
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    tracker.route = f"{scope['method']} {route}"
+                for text, query in tracker.repeated_selects().items():
+                    logger.warning(
+                        "possible N+1 in %s: %d x [%s] from %s: %s",
+                        tracker.route, query["count"], fingerprint_id(text), query["caller"], text
+                    )
+                query_report.add(tracker)
@@ -0,0 +1,136 @@
+"""
+In-process cache of the (id, display name) pairs used by the product, salesperson
+and customer pickers in the sale and discount forms.
+
+Only the two columns are loaded, once, instead of every full row on every form
+render. Each list has a version number that crud bumps after a create, update or
+delete, and the list is reloaded on its next use. REFERENCE_DATA_TTL also reloads
+it periodically, to pick up writes made by other worker processes.
+
+Lists longer than MAX_SELECT_OPTIONS are not embedded in the page; the form shows
+a search box backed by the /typeahead/{entity} endpoint instead.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+import models
+
+REFERENCE_DATA_TTL = float(os.getenv("REFERENCE_DATA_TTL", "60"))  # seconds
+MAX_SELECT_OPTIONS = int(os.getenv("MAX_SELECT_OPTIONS", "1000"))
+TYPEAHEAD_LIMIT = 20
+
+class ReferenceList:
+    def __init__(self, entity: str, model, name_columns):
+        self.entity = entity
+        self.model = model
+        self.name_columns = name_columns
+        self.version = 0
+        self._loaded_version = None
+        self._loaded_at = 0.0
+        # (ids, names, blob, offsets), swapped as a whole so a reader never
+        # pairs the ids of one load with the names of another
+        self._data = ([], [], "", [])
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+
+    def _refresh(self, db: Session):
+        with self._lock:
+            version = self.version
+            fresh = self._loaded_version == version and time.monotonic() - self._loaded_at < REFERENCE_DATA_TTL
+        if fresh:
+            return
+
+        rows = db.execute(select(self.model.id, *self.name_columns).order_by(self.model.id)).all()
+        ids = [row[0] for row in rows]
+        names = [" ".join(part for part in row[1:] if part).replace("\n", " ") for row in rows]
+        # every lowercased name after a newline in one string, so a search is a few
+        # str.find calls instead of a Python loop over every name
+        lowered = [name.lower() for name in names]
+        offsets, position = [], 0
+        for name in lowered:
+            offsets.append(position)
+            position += len(name) + 1
+        blob = "\n" + "\n".join(lowered)
+        with self._lock:
+            # lists are replaced, never modified, so readers can keep using old ones
+            self._data = (ids, names, blob, offsets)
+            self._loaded_version = version
+            self._loaded_at = time.monotonic()
+
+    def options(self, db: Session):
+        """
+        All (id, name) pairs ordered by id.
+        """
+        self._refresh(db)
+        ids, names, _, _ = self._data
+        return list(zip(ids, names))
+
+    def count(self, db: Session):
+        self._refresh(db)
+        return len(self._data[0])
+
+    def name_of(self, db: Session, item_id):
+        self._refresh(db)
+        ids, names, _, _ = self._data
+        i = bisect_left(ids, item_id) if item_id is not None else len(ids)
+        return names[i] if i < len(ids) and ids[i] == item_id else None
+
+    def search(self, db: Session, term: str, limit: int = TYPEAHEAD_LIMIT):
+        """
+        Up to limit (id, name) pairs where a word of the name starts with term
+        (or the id equals it), names starting with term first.
+        """
+        self._refresh(db)
+        ids, names, blob, offsets = self._data
+        term = term.strip().lower()
+        if not term or "\n" in term:
+            return []
+
+        matches = []
+        for prefix in ("\n", " "):
+            if len(matches) >= limit:
+                break
+            position = blob.find(prefix + term)
+            while position != -1 and len(matches) < limit:
+                # the name the match falls in (blob offsets are shifted by the leading newline)
+                i = bisect_right(offsets, position) - 1
+                if i not in matches:
+                    matches.append(i)
+                position = blob.find(prefix + term, offsets[i + 1] if i + 1 < len(offsets) else len(blob))
+
+        if term.isdigit():
+            i = bisect_left(ids, int(term))
+            if i < len(ids) and ids[i] == int(term) and i not in matches:
+                matches = [i] + matches[:limit - 1]
+        return [(ids[i], names[i]) for i in matches]
+
+products = ReferenceList("products", models.Product, [models.Product.name])
+salespersons = ReferenceList("salespersons", models.Salesperson,
+                             [models.Salesperson.first_name, models.Salesperson.last_name])
+customers = ReferenceList("customers", models.Customer,
+                          [models.Customer.first_name, models.Customer.last_name])
+
+REFERENCE_LISTS = {ref.entity: ref for ref in (products, salespersons, customers)}
+
+def form_options(db: Session, entity: str, selected_id=None):
+    """
+    What a form needs to render one picker: every option if the list is short
+    enough for a <select>, otherwise just the selected item for the search box.
+    """
+    ref = REFERENCE_LISTS[entity]
+    return {
+        "entity": entity,
+        "options": ref.options(db) if ref.count(db) <= MAX_SELECT_OPTIONS else None,
+        "selected_id": selected_id,
+        "selected_name": ref.name_of(db, selected_id)
+    }
+
+def search(db: Session, entity: str, term: str, limit: int = TYPEAHEAD_LIMIT):
+    return REFERENCE_LISTS[entity].search(db, term, limit)
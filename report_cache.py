@@ -0,0 +1,203 @@
+"""
+Cache of finished commission reports, keyed by (year, quarter).
+
+Entries are evicted least recently used once REPORT_CACHE_SIZE reports are stored
+(0 turns the cache off). Two backends:
+  * memory (default): a dict in the current process
+  * sqlite: a small SQLite file (REPORT_CACHE_PATH) shared by every worker process,
+    e.g. REPORT_CACHE_PATH=/dev/shm/report_cache.db keeps it in shared memory
+
+Invalidation is driven by the commission rollup: whenever crud refreshes the rollup
+rows of a quarter, that quarter's report, its whole-year report and the all-years
+report are evicted once the session commits (nothing is evicted on rollback).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "128"))
+REPORT_CACHE_BACKEND = os.getenv("REPORT_CACHE_BACKEND", "memory")
+REPORT_CACHE_PATH = os.getenv("REPORT_CACHE_PATH", "./report_cache.db")
+
+# key under Session.info where pending invalidations wait for the commit
+PENDING_KEY = "report_cache_pending"
+ALL_REPORTS = "all"
+
+def cache_key(year: int, quarter: int):
+    # the all-years report ignores the quarter
+    return (0, 0) if year == 0 else (year, quarter)
+
+def keys_for_quarter(year: int, quarter: int):
+    """
+    Every cached report that includes sales from the given quarter.
+    """
+    return {(year, quarter), (year, 0), (0, 0)}
+
+class MemoryReportCache:
+    def __init__(self, max_size: int = REPORT_CACHE_SIZE):
+        self.max_size = max_size
+        self._reports = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            report = self._reports.get(key)
+            if report is not None:
+                self._reports.move_to_end(key)
+            return report
+
+    def generation(self):
+        """
+        Bumped by every invalidation. A report computed while a write was being
+        committed is only stored if the generation did not change in between.
+        """
+        with self._lock:
+            return self._generation
+
+    def set(self, key, report, generation: int):
+        with self._lock:
+            if self.max_size <= 0 or generation != self._generation:
+                return
+            self._reports[key] = report
+            self._reports.move_to_end(key)
+            while len(self._reports) > self.max_size:
+                self._reports.popitem(last=False)
+
+    def invalidate(self, keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._reports.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._reports.clear()
+
+class SqliteReportCache:
+    """
+    Same interface as MemoryReportCache, stored in a SQLite file so several
+    worker processes share entries and invalidations.
+    """
+    def __init__(self, path: str = REPORT_CACHE_PATH, max_size: int = REPORT_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS report_cache ("
+                "year INTEGER, quarter INTEGER, report TEXT, used_at REAL, "
+                "PRIMARY KEY (year, quarter))"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS report_cache_generation (generation INTEGER)")
+            conn.execute(
+                "INSERT INTO report_cache_generation SELECT 0 "
+                "WHERE NOT EXISTS (SELECT 1 FROM report_cache_generation)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # autocommit mode, writes take the lock up front with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT report FROM report_cache WHERE year = ? AND quarter = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE report_cache SET used_at = ? WHERE year = ? AND quarter = ?",
+                (time.time(), *key)
+            )
+            return json.loads(row[0])
+
+    def generation(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT generation FROM report_cache_generation").fetchone()[0]
+
+    def set(self, key, report, generation: int):
+        if self.max_size <= 0:
+            return
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT generation FROM report_cache_generation").fetchone()[0] != generation:
+                conn.execute("ROLLBACK")
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO report_cache VALUES (?, ?, ?, ?)",
+                (*key, json.dumps(report), time.time())
+            )
+            conn.execute(
+                "DELETE FROM report_cache WHERE rowid NOT IN "
+                "(SELECT rowid FROM report_cache ORDER BY used_at DESC LIMIT ?)",
+                (self.max_size,)
+            )
+            conn.execute("COMMIT")
+
+    def invalidate(self, keys):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE report_cache_generation SET generation = generation + 1")
+            conn.executemany("DELETE FROM report_cache WHERE year = ? AND quarter = ?", list(keys))
+            conn.execute("COMMIT")
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE report_cache_generation SET generation = generation + 1")
+            conn.execute("DELETE FROM report_cache")
+            conn.execute("COMMIT")
+
+def make_report_cache(backend: str = REPORT_CACHE_BACKEND):
+    if backend == "sqlite":
+        return SqliteReportCache()
+    if backend == "memory":
+        return MemoryReportCache()
+    raise ValueError(f"Unknown REPORT_CACHE_BACKEND: {backend}")
+
+# shared by every request in this process
+report_cache = make_report_cache()
+
+# ---------- INVALIDATION ----------
+
+def invalidate_quarters_on_commit(db: Session, quarters):
+    """
+    Evicts the reports covering the given (year, quarter) pairs when db commits.
+    """
+    pending = db.info.setdefault(PENDING_KEY, set())
+    for year, quarter in quarters:
+        pending |= keys_for_quarter(year, quarter)
+
+def invalidate_all_on_commit(db: Session):
+    """
+    Evicts every report when db commits (e.g. a salesperson was renamed).
+    """
+    db.info.setdefault(PENDING_KEY, set()).add(ALL_REPORTS)
+
+@event.listens_for(Session, "after_commit")
+def apply_pending_invalidations(db: Session):
+    pending = db.info.pop(PENDING_KEY, None)
+    if not pending:
+        return
+    if ALL_REPORTS in pending:
+        report_cache.clear()
+    else:
+        report_cache.invalidate(pending)
+
+@event.listens_for(Session, "after_rollback")
+def discard_pending_invalidations(db: Session):
+    db.info.pop(PENDING_KEY, None)
@@ -0,0 +1,405 @@
+"""
+Background jobs for commission reports that take too long to compute inside a request.
+
+Submitting a report adds a row to the job table and returns its id right away.
+A pool of REPORT_JOB_WORKERS threads computes the report and writes its
+progress and the finished report back to the row, so clients poll the job (or
+stream its progress) while the request workers stay free. The job table is a
+small SQLite file, like the sqlite report cache, so every worker process sees
+(and can cancel) every job.
+
+A report is computed in salesperson ranges (parallel_report.salesperson_partitions):
+progress moves after each range and a cancelled job stops before the next one.
+Sources:
+    rollup:   the commission_rollup table, like the report page
+    live:     straight from the sales table
+    parallel: straight from the sales table by parallel_report's worker processes
+              (a single step, so no progress until it is done)
+    incremental: incremental_report's totals plus the sales changed since its
+              last run (a single step)
+
+Submitting reuses the unfinished job for the same report, or a finished one if no
+write changed the report since (the report cache generation; across worker
+processes that needs REPORT_CACHE_BACKEND=sqlite).
+    REPORT_JOB_WORKERS      reports computed at once per process (default 2)
+    REPORT_JOB_MAX_PENDING  queued + running jobs before submitting is refused (default 32)
+    REPORT_JOB_KEEP         seconds finished jobs are kept (default one day)
+    REPORT_JOBS_PATH        job table file (default ./report_jobs.db)
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from fastapi import HTTPException
+from database import SessionLocal
+from report_cache import REPORT_CACHE_BACKEND, cache_key, report_cache
+import commission_report, incremental_report, parallel_report
+
+REPORT_JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", "2"))
+REPORT_JOB_MAX_PENDING = int(os.getenv("REPORT_JOB_MAX_PENDING", "32"))
+REPORT_JOB_KEEP = int(os.getenv("REPORT_JOB_KEEP", "86400"))
+REPORT_JOBS_PATH = os.getenv("REPORT_JOBS_PATH", "./report_jobs.db")
+REPORT_JOB_STEPS = 20
+# how often a progress stream looks at the job
+REPORT_JOB_POLL_INTERVAL = 0.5
+
+SOURCES = ("rollup", "live", "parallel", "incremental")
+STOPPED_ERROR = "The server stopped before the report was done."
+UNFINISHED = ("queued", "running")
+FINISHED = ("done", "failed", "cancelled")
+
+class JobQueueFull(Exception):
+    pass
+
+class JobCancelled(Exception):
+    pass
+
+def data_version():
+    """
+    Changes whenever a write evicts cached reports. The memory cache counts
+    per process, so its generations only compare within the process.
+    """
+    generation = report_cache.generation()
+    return f"{generation}" if REPORT_CACHE_BACKEND == "sqlite" else f"{os.getpid()}:{generation}"
+
+# this start of the process, recorded on its jobs: a restarted server can get
+# the same pid again (PID 1 in a container)
+RUN_ID = uuid.uuid4().hex
+
+def new_run_id():
+    global RUN_ID
+    RUN_ID = uuid.uuid4().hex
+
+os.register_at_fork(after_in_child=new_run_id)
+
+# ---------- JOB TABLE ----------
+
+JOB_COLUMNS = (
+    "id", "year", "quarter", "source", "status", "progress", "version", "error",
+    "created_at", "started_at", "finished_at", "owner_pid"
+)
+
+class JobStore:
+    """
+    The report_jobs table in a SQLite file, shared by every worker process.
+    """
+    def __init__(self, path: str = REPORT_JOBS_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS report_jobs ("
+                "id TEXT PRIMARY KEY, year INTEGER, quarter INTEGER, source TEXT, "
+                "status TEXT, progress REAL, version TEXT, result TEXT, error TEXT, "
+                "cancel_requested INTEGER DEFAULT 0, created_at REAL, started_at REAL, "
+                "finished_at REAL, owner_pid INTEGER, owner_run TEXT)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(report_jobs)")}
+            if "owner_run" not in columns:
+                conn.execute("ALTER TABLE report_jobs ADD COLUMN owner_run TEXT")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_report_jobs_report "
+                "ON report_jobs (year, quarter, source, status)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # autocommit mode, writes take the lock up front with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def get(self, job_id: str, with_result: bool = True):
+        """
+        The job as a dict (with its report once done), None if unknown.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)}, cancel_requested, result FROM report_jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(JOB_COLUMNS, row))
+        job["cancel_requested"] = bool(row[-2])
+        if with_result:
+            job["result"] = json.loads(row[-1]) if row[-1] is not None else None
+        return job
+
+    def find_or_add(self, year: int, quarter: int, source: str, version: str):
+        """
+        (job_id, created) for the report: an unfinished job for it, a done one
+        computed from the current data, or a new queued job.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM report_jobs WHERE year = ? AND quarter = ? AND source = ? "
+                "AND (status IN (?, ?) AND cancel_requested = 0 OR status = 'done' AND version = ?) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (year, quarter, source, *UNFINISHED, version)
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return row[0], False
+
+            pending = conn.execute(
+                "SELECT count(*) FROM report_jobs WHERE status IN (?, ?)", UNFINISHED
+            ).fetchone()[0]
+            if pending >= REPORT_JOB_MAX_PENDING:
+                conn.execute("ROLLBACK")
+                raise JobQueueFull(f"{pending} report jobs are already waiting, try again later.")
+
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO report_jobs (id, year, quarter, source, status, progress, created_at, owner_pid, owner_run) "
+                "VALUES (?, ?, ?, ?, 'queued', 0, ?, ?, ?)",
+                (job_id, year, quarter, source, time.time(), os.getpid(), RUN_ID)
+            )
+            conn.execute("COMMIT")
+            return job_id, True
+
+    def start(self, job_id: str, version: str):
+        """
+        Marks a queued job running. False if it was cancelled in the meantime.
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE report_jobs SET status = 'running', version = ?, started_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (version, time.time(), job_id)
+            ).rowcount == 1
+
+    def set_progress(self, job_id: str, progress: float):
+        """
+        Records the progress, False if the job should stop (cancelled).
+        """
+        with self._connect() as conn:
+            conn.execute("UPDATE report_jobs SET progress = ? WHERE id = ?", (progress, job_id))
+            row = conn.execute("SELECT cancel_requested FROM report_jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is not None and not row[0]
+
+    def finish(self, job_id: str, status: str, result=None, error: str | None = None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE report_jobs SET status = ?, progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END, "
+                "result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+
+    def cancel(self, job_id: str):
+        """
+        Cancels a queued job at once and asks a running one to stop at its next step.
+        False if the job is unknown or already finished.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT status FROM report_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row[0] in FINISHED:
+                conn.execute("ROLLBACK")
+                return False
+            if row[0] == "queued":
+                conn.execute(
+                    "UPDATE report_jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ? WHERE id = ?",
+                    (time.time(), job_id)
+                )
+            else:
+                conn.execute("UPDATE report_jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            conn.execute("COMMIT")
+            return True
+
+    def fail_orphaned(self):
+        """
+        Fails the unfinished jobs of worker processes that are gone (restarted
+        server), including an earlier start of this one under the same pid.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, owner_pid, owner_run FROM report_jobs WHERE status IN (?, ?)", UNFINISHED
+            ).fetchall()
+            orphaned = [
+                job_id for job_id, pid, run in rows
+                if run != RUN_ID and (pid == os.getpid() or not process_alive(pid))
+            ]
+            conn.executemany(
+                "UPDATE report_jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)",
+                [(STOPPED_ERROR, time.time(), job_id, *UNFINISHED) for job_id in orphaned]
+            )
+
+    def stop_run(self, run_id: str):
+        """
+        Fails the queued jobs of a run that stops and asks its running ones to
+        stop at their next step.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE report_jobs SET status = 'failed', error = ?, finished_at = ? "
+                "WHERE owner_run = ? AND status = 'queued'",
+                (STOPPED_ERROR, time.time(), run_id)
+            )
+            conn.execute(
+                "UPDATE report_jobs SET cancel_requested = 1 WHERE owner_run = ? AND status = 'running'",
+                (run_id,)
+            )
+            conn.execute("COMMIT")
+
+    def purge(self, keep_seconds: int = REPORT_JOB_KEEP):
+        """
+        Deletes jobs finished more than keep_seconds ago.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM report_jobs WHERE status IN (?, ?, ?) AND finished_at < ?",
+                (*FINISHED, time.time() - keep_seconds)
+            )
+
+def process_alive(pid: int):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+# ---------- REPORTS ----------
+
+def totals_query(source: str, year: int, quarter: int):
+    if source == "rollup":
+        return commission_report.rollup_totals_query(year, quarter)
+    return commission_report.sales_totals_query(commission_report.get_report_date_range(year, quarter))
+
+def compute_report(db, year: int, quarter: int, source: str, on_progress=None):
+    """
+    The report, computed one salesperson range at a time. on_progress(fraction)
+    is called after each range and stops the job by returning False.
+    """
+    if source == "parallel":
+        return parallel_report.compute_commission_report(db, year, quarter)
+    if source == "incremental":
+        return incremental_report.compute_commission_report(db, year, quarter)
+
+    query = totals_query(source, year, quarter)
+    ranges = parallel_report.salesperson_partitions(db, year, quarter, REPORT_JOB_STEPS)
+    totals = {}
+    for step, salesperson_range in enumerate(ranges, start=1):
+        parallel_report.add_totals(totals, db.execute(parallel_report.in_salesperson_range(query, salesperson_range)))
+        if on_progress and not on_progress(step / len(ranges)):
+            raise JobCancelled()
+    return parallel_report.report_from_totals(db, totals)
+
+# ---------- QUEUE ----------
+
+class ReportJobQueue:
+    """
+    Runs submitted report jobs on a thread pool of REPORT_JOB_WORKERS threads.
+    """
+    def __init__(self, store: JobStore, workers: int = REPORT_JOB_WORKERS):
+        self.store = store
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self.store.purge()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="report_job")
+            return self._executor
+
+    def submit(self, year: int, quarter: int, source: str = "rollup"):
+        """
+        Returns (job_id, created) right away, the report is computed in the background.
+        """
+        if source not in SOURCES:
+            raise ValueError(f"source must be one of {', '.join(SOURCES)}")
+        year, quarter = cache_key(year, quarter)
+        # not worth waiting for a job a stopped process will never finish
+        self.store.fail_orphaned()
+        job_id, created = self.store.find_or_add(year, quarter, source, data_version())
+        if created:
+            self._pool().submit(self.run, job_id, year, quarter, source)
+        return job_id, created
+
+    def run(self, job_id: str, year: int, quarter: int, source: str):
+        # captured before reading, so a write committed during the job makes it stale
+        version = data_version()
+        generation = report_cache.generation()
+        if not self.store.start(job_id, version):
+            return
+        try:
+            with SessionLocal() as db:
+                report = compute_report(
+                    db, year, quarter, source,
+                    on_progress=lambda progress: self.store.set_progress(job_id, progress)
+                )
+        except JobCancelled:
+            self.store.finish(job_id, "cancelled")
+            return
+        except Exception as e:
+            self.store.finish(job_id, "failed", error=str(e))
+            return
+        if source == "rollup":
+            # the report page reads the same rows
+            report_cache.set(cache_key(year, quarter), report, generation)
+        self.store.finish(job_id, "done", result=report)
+
+    async def events(self, job_id: str, interval: float = REPORT_JOB_POLL_INTERVAL):
+        """
+        Server-sent events with the job (without its report) whenever its status
+        or progress changes, until it is finished.
+        """
+        last = None
+        while True:
+            job = await asyncio.to_thread(self.store.get, job_id, False)
+            if job is None:
+                return
+            if (job["status"], job["progress"]) != last:
+                last = job["status"], job["progress"]
+                yield f"data: {json.dumps(job)}\n\n"
+            if job["status"] in FINISHED:
+                return
+            await asyncio.sleep(interval)
+
+    def shutdown(self):
+        """
+        Stops the pool. Jobs it won't run any more are failed, not left queued
+        (submitting would keep handing them out).
+        """
+        with self._lock:
+            if self._executor is None:
+                return
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self.store.stop_run(RUN_ID)
+
+# shared by every request in this process, the pool starts with the first job
+report_jobs = ReportJobQueue(JobStore())
+
+# ---------- ROUTES ----------
+
+async def submit_report_job(year: int, quarter: int, source: str):
+    """
+    report_jobs.submit for the routes: 429 when the queue is full, 400 for a bad report.
+    """
+    try:
+        return await asyncio.to_thread(report_jobs.submit, year, quarter, source)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def get_report_job(job_id: str, with_result: bool = True):
+    job = await asyncio.to_thread(report_jobs.store.get, job_id, with_result)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
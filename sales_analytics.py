@@ -0,0 +1,420 @@
+"""
+Time-bucketed sales series (day, week, month, quarter or year) for any date range,
+optionally split by product, manufacturer, style or salesperson.
+
+Series are read from the daily_sales_rollup table, which holds per day the number
+of sales, list and discounted amounts and commission of all sales and of every
+product, manufacturer, style and salesperson. Five years of the total series is
+under 2k rows, split by style about 15k, instead of a scan of the sales table.
+crud adds every created or changed sale to its rows and takes out every changed or
+deleted one; product manufacturer/style changes recompute the affected days.
+Filter combinations the table can't answer (e.g. one salesperson split by style)
+are computed from the sales table instead, with the same output.
+
+Amounts are added up in whole millionths of a dollar like the commission report
+(commission_report.sum_micros), so a salesperson's commission series adds up to
+their commission report for the same period. The table stores the dollars
+(which convert back to the same millionths).
+
+Days are folded into weeks/months/... in Python, which keeps the SQL the same on
+every backend.
+Run this file directly to rebuild the whole table:
+    python sales_analytics.py
+"""
+
+from datetime import date, timedelta
+from sqlalchemy import and_, delete, func, insert, literal_column, or_, select
+from sqlalchemy.orm import Session
+import models, commission_report
+
+BUCKETS = ("day", "week", "month", "quarter", "year")
+DIMENSIONS = ("product", "manufacturer", "style", "salesperson")
+DEFAULT_SERIES_LIMIT = 10
+MAX_SERIES_LIMIT = 100
+MAX_SERIES_POINTS = 4000  # a bit under eleven years of days
+REBUILD_BATCH_DAYS = 31
+AMOUNT_COLUMNS = ("list_amount", "total_sales_amount", "total_commission")
+CHUNK_SIZE = 1000  # ids/dates per IN list
+LOOKUP_CHUNK_SIZE = 200  # rollup keys per lookup
+
+# ---------- DAILY ROLLUP ----------
+
+def daily_totals_query():
+    """
+    Sales grouped by day, product and salesperson.
+    """
+    return (
+        select(
+            models.Sale.sales_date,
+            models.Sale.product_id,
+            models.Sale.salesperson_id,
+            func.count(models.Sale.id),
+            commission_report.sum_micros(models.Sale.unit_price),
+            commission_report.sum_micros(commission_report.discounted_price()),
+            commission_report.sum_micros(commission_report.sale_commission())
+        )
+        .where(commission_report.priced_sales())
+        .group_by(models.Sale.sales_date, models.Sale.product_id, models.Sale.salesperson_id)
+    )
+
+def product_groups(db: Session, product_ids=None):
+    """
+    {product_id: (manufacturer, style)}, for the given products or all of them.
+    """
+    query = select(models.Product.id, models.Product.manufacturer, models.Product.style)
+    if product_ids is not None:
+        query = query.where(models.Product.id.in_(product_ids))
+    return {row[0]: (row[1] or "", row[2] or "") for row in db.execute(query)}
+
+def rollup_cells(rows, groups):
+    """
+    Adds up daily_totals_query rows into {(dimension, group_key, sales_date): totals},
+    totals being [num_sales, list_amount, total_sales_amount, total_commission]
+    (amounts in millionths of a dollar).
+    """
+    cells = {}
+    for sales_date, product_id, salesperson_id, num_sales, list_amount, amount, commission in rows:
+        manufacturer, style = groups.get(product_id, ("", ""))
+        keys = [("all", ""), ("product", str(product_id)), ("manufacturer", manufacturer), ("style", style)]
+        if salesperson_id is not None:
+            keys.append(("salesperson", str(salesperson_id)))
+        for dimension, group_key in keys:
+            totals = cells.get((dimension, group_key, sales_date))
+            if totals is None:
+                totals = cells[(dimension, group_key, sales_date)] = [0, 0, 0, 0]
+            totals[0] += num_sales
+            totals[1] += list_amount or 0
+            totals[2] += amount or 0
+            totals[3] += commission or 0
+    return cells
+
+def rollup_row(key, totals):
+    dimension, group_key, sales_date = key
+    return {
+        "dimension": dimension, "group_key": group_key, "sales_date": sales_date, "num_sales": totals[0],
+        **{column: micros / commission_report.MICROS for column, micros in zip(AMOUNT_COLUMNS, totals[1:])}
+    }
+
+def refresh_daily_rollup(db: Session, dates, groups=None):
+    """
+    Recomputes every rollup row of the given days from the sales table, for
+    writes that change many sales at once (a product's manufacturer or style).
+    Does not commit.
+    """
+    dates = sorted({day for day in dates if day is not None})
+    rollup = models.DailySalesRollup
+    for i in range(0, len(dates), CHUNK_SIZE):
+        chunk = dates[i:i + CHUNK_SIZE]
+        rows = db.execute(daily_totals_query().where(models.Sale.sales_date.in_(chunk))).all()
+        cells = rollup_cells(rows, groups if groups is not None else product_groups(db, {row[1] for row in rows}))
+        db.execute(delete(rollup).where(rollup.sales_date.in_(chunk)))
+        if cells:
+            db.execute(insert(rollup), [rollup_row(key, totals) for key, totals in cells.items()])
+
+def existing_rollup_rows(db: Session, keys):
+    """
+    {(dimension, group_key, sales_date): DailySalesRollup} of the given keys that exist.
+    Looked up as ORs of primary keys (SQLite doesn't answer a row-value IN from the index).
+    """
+    rollup = models.DailySalesRollup
+    keys = list(keys)
+    existing = {}
+    for i in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        for db_row in db.query(rollup).filter(or_(*[
+            and_(rollup.dimension == dimension, rollup.group_key == group_key, rollup.sales_date == sales_date)
+            for dimension, group_key, sales_date in keys[i:i + LOOKUP_CHUNK_SIZE]
+        ])):
+            existing[(db_row.dimension, db_row.group_key, db_row.sales_date)] = db_row
+    return existing
+
+def add_sales(db: Session, sale_ids, sign: int = 1):
+    """
+    Adds the given sales to their rollup rows (sign=-1 takes them out again).
+    Called before a sale is changed or deleted and after it is created or changed.
+    Does not commit.
+    """
+    sale_ids = list(sale_ids)
+    rollup = models.DailySalesRollup
+    # every chunk's totals first: two chunks can add to the same new row, which
+    # the session doesn't flush before the lookup (autoflush is off)
+    rows = []
+    for i in range(0, len(sale_ids), CHUNK_SIZE):
+        rows += db.execute(daily_totals_query().where(models.Sale.id.in_(sale_ids[i:i + CHUNK_SIZE]))).all()
+    cells = rollup_cells(rows, product_groups(db, {row[1] for row in rows}))
+    existing = existing_rollup_rows(db, cells)
+
+    for key, totals in cells.items():
+        db_row = existing.get(key)
+        if db_row is None:
+            if sign > 0:
+                db.add(rollup(**rollup_row(key, totals)))
+            continue
+        db_row.num_sales += sign * totals[0]
+        if db_row.num_sales <= 0:
+            db.delete(db_row)
+            continue
+        for column, micros in zip(AMOUNT_COLUMNS, totals[1:]):
+            # added up in millionths, so the row stays what a rebuild computes
+            stored = round(getattr(db_row, column) * commission_report.MICROS)
+            setattr(db_row, column, (stored + sign * micros) / commission_report.MICROS)
+
+def rebuild_daily_rollup(db: Session):
+    """
+    Rebuilds the whole daily rollup table, REBUILD_BATCH_DAYS sales days at a time, and commits.
+    """
+    db.execute(delete(models.DailySalesRollup))
+    groups = product_groups(db)
+    dates = db.scalars(
+        select(models.Sale.sales_date).where(models.Sale.sales_date.is_not(None))
+        .distinct().order_by(models.Sale.sales_date)
+    ).all()
+    for i in range(0, len(dates), REBUILD_BATCH_DAYS):
+        refresh_daily_rollup(db, dates[i:i + REBUILD_BATCH_DAYS], groups)
+    db.commit()
+
+# ---------- BUCKETS ----------
+
+def bucket_start(day: date, bucket: str):
+    """
+    First day of the day/week (Monday)/month/quarter/year containing day.
+    """
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    if bucket == "quarter":
+        return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+    if bucket == "year":
+        return date(day.year, 1, 1)
+    return day
+
+def next_bucket(start: date, bucket: str):
+    if bucket == "day":
+        return start + timedelta(days=1)
+    if bucket == "week":
+        return start + timedelta(days=7)
+    months = {"month": 1, "quarter": 3, "year": 12}[bucket]
+    month = start.month - 1 + months
+    return date(start.year + month // 12, month % 12 + 1, 1)
+
+def bucket_starts(start_date: date, end_date: date, bucket: str, limit: int = MAX_SERIES_POINTS):
+    """
+    Start of every bucket overlapping the dates, at most limit + 1 of them.
+    """
+    starts = []
+    current = bucket_start(start_date, bucket)
+    while current <= end_date and len(starts) <= limit:
+        starts.append(current)
+        current = next_bucket(current, bucket)
+    return starts
+
+# ---------- SERIES ----------
+
+def format_point(bucket: date, totals):
+    num_sales, list_amount, amount, commission = totals
+    return {
+        "bucket": bucket.isoformat(),
+        "num_sales": num_sales,
+        "total_sales_amount": round(amount / commission_report.MICROS, 2),
+        # what discounts took off the list price
+        "discount_amount": round((list_amount - amount) / commission_report.MICROS, 2),
+        "total_commission": round(commission / commission_report.MICROS, 2)
+    }
+
+def rollup_selection(group_by: str, filters):
+    """
+    The (dimension, group_key) rows of the rollup table that answer a series
+    request (group_key None for every key), or None if it can't be answered from
+    the table: it has no rows for two dimensions at once.
+    """
+    if len(filters) > 1:
+        return None
+    if filters:
+        dimension, value = next(iter(filters.items()))
+        if group_by not in ("none", dimension):
+            return None
+        return dimension, str(value)
+    if group_by == "none":
+        return "all", ""
+    return group_by, None
+
+def rollup_series_query(dimension: str, start_date: date, end_date: date, group_keys):
+    rollup = models.DailySalesRollup
+    return select(
+        rollup.sales_date, rollup.group_key, rollup.num_sales,
+        *[commission_report.in_micros(getattr(rollup, column)) for column in AMOUNT_COLUMNS]
+    ).where(
+        rollup.dimension == dimension,
+        rollup.group_key.in_(group_keys),
+        rollup.sales_date >= start_date,
+        rollup.sales_date <= end_date
+    )
+
+def rollup_top_keys(db: Session, dimension: str, start_date: date, end_date: date, limit: int):
+    """
+    The limit group keys of a dimension with the most sales amount between the dates.
+    """
+    rollup = models.DailySalesRollup
+    amount = commission_report.sum_micros(rollup.total_sales_amount)
+    return db.scalars(
+        select(rollup.group_key)
+        .where(rollup.dimension == dimension, rollup.sales_date >= start_date, rollup.sales_date <= end_date)
+        .group_by(rollup.group_key)
+        .order_by(amount.desc(), rollup.group_key)
+        .limit(limit)
+    ).all()
+
+def live_series_query(start_date: date, end_date: date, group_by: str, filters):
+    """
+    The same daily rows computed from the sales table.
+    """
+    # the same keys as the rollup rows
+    columns = {
+        "none": literal_column("''"),
+        "product": models.Sale.product_id,
+        "manufacturer": func.coalesce(models.Product.manufacturer, ""),
+        "style": func.coalesce(models.Product.style, ""),
+        "salesperson": models.Sale.salesperson_id
+    }
+    group_key = columns[group_by].label("group_key")
+    return (
+        select(
+            models.Sale.sales_date,
+            group_key,
+            func.count(models.Sale.id),
+            commission_report.sum_micros(models.Sale.unit_price),
+            commission_report.sum_micros(commission_report.discounted_price()),
+            commission_report.sum_micros(commission_report.sale_commission())
+        )
+        # only for the manufacturer/style, "" once the product is deleted (like product_groups)
+        .outerjoin(models.Product, models.Product.id == models.Sale.product_id)
+        .where(
+            commission_report.priced_sales(),
+            models.Sale.sales_date >= start_date,
+            models.Sale.sales_date <= end_date,
+            *[columns[dimension] == value for dimension, value in filters.items()]
+        )
+        .group_by(models.Sale.sales_date, *([group_key] if group_by != "none" else []))
+    )
+
+def group_labels(db: Session, group_by: str, keys):
+    """
+    Display names of the series keys (product names, salesperson names).
+    """
+    if group_by == "product":
+        rows = db.execute(
+            select(models.Product.id, models.Product.name).where(models.Product.id.in_(keys))
+        ).all()
+        return {row[0]: row[1] for row in rows}
+    if group_by == "salesperson":
+        rows = db.execute(
+            select(models.Salesperson.id, models.Salesperson.first_name, models.Salesperson.last_name)
+            .where(models.Salesperson.id.in_(keys))
+        ).all()
+        return {row[0]: " ".join(part for part in row[1:] if part) for row in rows}
+    return {key: key for key in keys}
+
+def series_filters(product_id=None, salesperson_id=None, manufacturer=None, style=None):
+    return {
+        dimension: value
+        for dimension, value in zip(DIMENSIONS, (product_id, manufacturer, style, salesperson_id))
+        if value is not None
+    }
+
+def series_buckets(start_date: date, end_date: date, bucket: str):
+    """
+    bucket_starts, raising ValueError for an empty range or more than MAX_SERIES_POINTS buckets.
+    """
+    if start_date > end_date:
+        raise ValueError("start_date must not be after end_date.")
+    starts = bucket_starts(start_date, end_date, bucket)
+    if len(starts) > MAX_SERIES_POINTS:
+        raise ValueError(f"More than {MAX_SERIES_POINTS} {bucket} buckets, use a shorter range or a larger bucket.")
+    return starts
+
+def build_series(rows, starts, bucket: str, group_by: str, limit: int, labels_for):
+    """
+    Folds daily (sales_date, group_key, num_sales, list_amount, total_sales_amount,
+    total_commission) rows, amounts in millionths of a dollar, into the series of
+    the limit largest groups.
+    labels_for(keys) returns the display names of the kept group keys.
+    """
+    # group key -> bucket start -> totals
+    groups = {}
+    for sales_date, key, num_sales, list_amount, amount, commission in rows:
+        if group_by == "none":
+            key = None
+        elif group_by in ("product", "salesperson"):
+            key = int(key)
+        buckets = groups.get(key)
+        if buckets is None:
+            buckets = groups[key] = {}
+        start = bucket_start(sales_date, bucket)
+        totals = buckets.get(start)
+        if totals is None:
+            totals = buckets[start] = [0, 0, 0, 0]
+        totals[0] += num_sales
+        totals[1] += list_amount or 0
+        totals[2] += amount or 0
+        totals[3] += commission or 0
+
+    if group_by == "none":
+        keys = [None]
+        labels = {None: "all sales"}
+    else:
+        amounts = {key: sum(totals[2] for totals in buckets.values()) for key, buckets in groups.items()}
+        keys = sorted(amounts, key=lambda key: (-amounts[key], str(key)))[:limit]
+        labels = labels_for(keys)
+
+    return [
+        {
+            "key": key,
+            "label": labels.get(key, key),
+            "points": [
+                format_point(start, groups.get(key, {}).get(start, [0, 0, 0, 0]))
+                for start in starts
+            ]
+        }
+        for key in keys
+    ]
+
+def sales_series(db: Session, start_date: date, end_date: date, bucket: str = "month",
+                 group_by: str = "none", product_id: int | None = None,
+                 salesperson_id: int | None = None, manufacturer: str | None = None,
+                 style: str | None = None, limit: int = DEFAULT_SERIES_LIMIT):
+    """
+    Returns {"bucket", "group_by", "start_date", "end_date", "series"}. Each series
+    has a key, a label and one point per bucket between the dates (zero when there
+    were no sales), with the number of sales, sales amount, discount amount and
+    commission. When grouped, only the limit groups with the most sales amount are
+    returned, largest first.
+    Raises ValueError for an empty range or one with more than MAX_SERIES_POINTS buckets.
+    """
+    starts = series_buckets(start_date, end_date, bucket)
+    filters = series_filters(product_id, salesperson_id, manufacturer, style)
+    selection = rollup_selection(group_by, filters)
+    if selection is None:
+        query = live_series_query(start_date, end_date, group_by, filters)
+    else:
+        dimension, group_key = selection
+        # pick the top groups first so only their rows are read
+        group_keys = [group_key] if group_key is not None else \
+            rollup_top_keys(db, dimension, start_date, end_date, limit)
+        query = rollup_series_query(dimension, start_date, end_date, group_keys)
+
+    return {
+        "bucket": bucket,
+        "group_by": group_by,
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "series": build_series(db.execute(query), starts, bucket, group_by, limit,
+                               lambda keys: group_labels(db, group_by, keys))
+    }
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    db = SessionLocal()
+    rebuild_daily_rollup(db)
+    db.close()
+    print("Daily sales rollup rebuilt successfully.")
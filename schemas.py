@@ -73,10 +73,22 @@ class SaleCreate(SaleBase):
 
 class Sale(SaleBase):
     id: int
+    unit_price: float | None = None
+    discount_percentage: float | None = None
+    commission_percentage: float | None = None
 
     class Config:
         orm_mode = True
 
+# Bulk sale import result, errors point at the row index in the submitted batch
+class SaleBulkError(BaseModel):
+    index: int
+    detail: str
+
+class SaleBulkResult(BaseModel):
+    created: int
+    errors: list[SaleBulkError]
+
 # Discount schema
 class DiscountBase(BaseModel):
     product_id: int
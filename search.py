@@ -0,0 +1,261 @@
+"""
+Search over customers, salespersons and products by name, phone, manufacturer
+and style, matching any part of the text ("smi" finds "Smith" and "Goldsmith").
+
+SQLite: one FTS5 table per entity with the trigram tokenizer, using the entity
+table as external content (nothing is stored twice). Triggers keep it in sync on
+insert, delete and on updates of the searched columns.
+PostgreSQL: a pg_trgm GIN index on the same text, used by LIKE '%...%'.
+If neither is available the same LIKE query runs without an index.
+
+Matches are ranked in SQL, and the best SEARCH_CANDIDATES per entity fetched:
+exact matches, then matches at the start of a field, then at the start of a
+word, then anywhere; shorter names first. Only the first SEARCH_SCAN matches and
+the first SEARCH_SCAN names (or phones) starting with the first term, in index
+order, are ranked, so a broad query ("omer", "a") doesn't sort the whole table.
+Terms shorter than three characters only filter the matches of the longer
+terms. A query made of short terms only ("sm", "j sm") matches the start of
+names and phone numbers instead, with an index on each of those columns
+(COLLATE NOCASE on SQLite, text_pattern_ops on PostgreSQL) serving LIKE 'sm%'.
+"""
+
+import functools
+import re
+from sqlalchemy import case, column, func, literal_column, or_, select, table, text, union
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+import models
+
+SEARCH_LIMIT = 20
+SEARCH_CANDIDATES = 200
+SEARCH_SCAN = 500  # matches ranked at most per entity, see candidate_rows
+MIN_TERM_LENGTH = 3  # trigram index
+
+# entity -> (model, searched columns, columns making up the display name)
+SEARCH_ENTITIES = {
+    "customers": (models.Customer, ("first_name", "last_name", "phone"), ("first_name", "last_name")),
+    "salespersons": (models.Salesperson, ("first_name", "last_name", "phone"), ("first_name", "last_name")),
+    "products": (models.Product, ("name", "manufacturer", "style"), ("name",))
+}
+
+# entity -> columns matched by prefix when every term is too short for the trigram index
+PREFIX_COLUMNS = {
+    "customers": ("first_name", "last_name", "phone"),
+    "salespersons": ("first_name", "last_name", "phone"),
+    "products": ("name",)
+}
+
+def search_table(entity: str):
+    return f"{entity}_search"
+
+# ---------- INDEXES ----------
+
+def sqlite_search_ddl(entity: str):
+    model, columns, _ = SEARCH_ENTITIES[entity]
+    table_name, fts = model.__tablename__, search_table(entity)
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    insert_new = f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values});"
+    delete_old = f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});"
+    return [
+        # start over if only part of it exists (e.g. the entity table was dropped and recreated)
+        f"DROP TRIGGER IF EXISTS {fts}_insert",
+        f"DROP TRIGGER IF EXISTS {fts}_delete",
+        f"DROP TRIGGER IF EXISTS {fts}_update",
+        f"DROP TABLE IF EXISTS {fts}",
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({column_list}, content='{table_name}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table_name} BEGIN {insert_new} END",
+        f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table_name} BEGIN {delete_old} END",
+        # only the searched columns, so e.g. qty_on_hand updates on every sale skip the index
+        f"CREATE TRIGGER {fts}_update AFTER UPDATE OF {column_list} ON {table_name} BEGIN {delete_old} {insert_new} END",
+        # index the rows that already exist
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"
+    ]
+
+def prefix_index_ddl(dialect: str):
+    for entity, columns in PREFIX_COLUMNS.items():
+        table_name = SEARCH_ENTITIES[entity][0].__tablename__
+        for name in columns:
+            indexed = f"{name} COLLATE NOCASE" if dialect == "sqlite" else f"lower({name}) text_pattern_ops"
+            yield f"CREATE INDEX IF NOT EXISTS ix_{table_name}_{name}_prefix ON {table_name} ({indexed})"
+
+@functools.lru_cache(maxsize=None)
+def search_text(entity: str):
+    """
+    Lowercased searched columns joined by spaces (what the PostgreSQL index covers).
+    Built once per entity, it's part of every search query.
+    """
+    model, columns, _ = SEARCH_ENTITIES[entity]
+    # literals instead of bound parameters, so queries match the index expression
+    parts = [func.coalesce(getattr(model, name), literal_column("''")) for name in columns]
+    joined = parts[0]
+    for part in parts[1:]:
+        joined = joined.op("||")(literal_column("' '")).op("||")(part)
+    return func.lower(joined)
+
+def create_search_indexes(bind):
+    """
+    Creates the search tables/indexes that don't exist yet. The trigram ones are
+    skipped (search falls back to unindexed LIKE) if the database has no FTS5
+    trigram or pg_trgm support.
+    """
+    if bind.dialect.name in ("sqlite", "postgresql"):
+        with bind.begin() as conn:
+            for statement in prefix_index_ddl(bind.dialect.name):
+                conn.execute(text(statement))
+
+    if bind.dialect.name == "sqlite":
+        with bind.begin() as conn:
+            existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master"))}
+        for entity in SEARCH_ENTITIES:
+            fts = search_table(entity)
+            if {fts, f"{fts}_insert", f"{fts}_delete", f"{fts}_update"} <= existing:
+                continue
+            try:
+                with bind.begin() as conn:
+                    for statement in sqlite_search_ddl(entity):
+                        conn.execute(text(statement))
+            except DBAPIError:
+                return  # SQLite built without FTS5 or older than 3.34 (no trigram tokenizer)
+
+    elif bind.dialect.name == "postgresql":
+        try:
+            with bind.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                for entity, (model, _, _) in SEARCH_ENTITIES.items():
+                    expression = search_text(entity).compile(bind)
+                    conn.execute(text(
+                        f"CREATE INDEX IF NOT EXISTS ix_{search_table(entity)} "
+                        f"ON {model.__tablename__} USING gin (({expression}) gin_trgm_ops)"
+                    ))
+        except DBAPIError:
+            return  # pg_trgm not installed / not permitted
+
+# (database url, entity) pairs known to have their FTS table
+fts_tables = set()
+
+def has_fts(db: Session, entity: str):
+    bind = db.get_bind()
+    if bind.dialect.name != "sqlite":
+        return False
+    key = (str(bind.url), entity)
+    if key not in fts_tables and db.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": search_table(entity)}
+    ).first() is not None:
+        fts_tables.add(key)
+    return key in fts_tables
+
+# ---------- QUERIES ----------
+
+def search_terms(query: str):
+    return [term for term in query.lower().split() if term]
+
+def fts_match(terms):
+    # every term as a quoted string: a substring match with the trigram tokenizer
+    return " AND ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+def escape_like(term: str):
+    return re.sub(r"([\\%_])", r"\\\1", term)
+
+def starts_with(db: Session, model, name: str, term: str):
+    """
+    The column starts with the term, in the form its prefix index serves.
+    """
+    pattern = f"{escape_like(term)}%"
+    if db.get_bind().dialect.name == "sqlite":
+        # LIKE is case-insensitive there, and uses the COLLATE NOCASE index
+        return getattr(model, name).like(pattern, escape="\\")
+    return func.lower(getattr(model, name)).like(pattern, escape="\\")
+
+def rank_columns(entity: str, terms, query: str):
+    """
+    (tier, name length) of a match, lower is better. Selected with the rows, so
+    the matches of every entity are merged on the same values they were ranked by.
+    """
+    model, columns, name_columns = SEARCH_ENTITIES[entity]
+    fields = [
+        func.lower(func.coalesce(getattr(model, name), literal_column("''")))
+        for name in dict.fromkeys(name_columns + columns)
+    ]
+    words = literal_column("' '").op("||")(search_text(entity))
+    tier = case(
+        (or_(*[field == query for field in fields]), 0),
+        (or_(*[field.like(f"{escape_like(terms[0])}%", escape="\\") for field in fields]), 1),
+        (or_(*[words.like(f"% {escape_like(term)}%", escape="\\") for term in terms]), 2),
+        else_=3
+    )
+    lengths = [func.length(func.coalesce(getattr(model, name), literal_column("''"))) for name in name_columns]
+    return tier.label("tier"), sum(lengths[1:], lengths[0]).label("name_length")
+
+def candidate_rows(db: Session, entity: str, terms, candidates: int):
+    model, columns, name_columns = SEARCH_ENTITIES[entity]
+    selected = [model.id] + [getattr(model, column) for column in dict.fromkeys(name_columns + columns)]
+    long_terms = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+    haystack = search_text(entity)
+    contains = [haystack.like(f"%{escape_like(term)}%", escape="\\") for term in terms]
+    params = {}
+
+    if not long_terms:
+        # every term must start one of the prefix-indexed columns
+        matches = [or_(*[starts_with(db, model, name, term) for name in PREFIX_COLUMNS[entity]]) for term in terms]
+        matched = select(model.id).where(*matches)
+    elif has_fts(db, entity):
+        matches = contains
+        fts = search_table(entity)
+        fts_table = table(fts, column("rowid"))
+        matched = (
+            select(model.id).join(fts_table, fts_table.c.rowid == model.id)
+            .where(text(f"{fts} MATCH :match"))
+            # short terms weren't part of the index lookup
+            .where(*[like for term, like in zip(terms, contains) if len(term) < MIN_TERM_LENGTH])
+        )
+        params["match"] = fts_match(long_terms)
+    else:
+        matches = contains
+        matched = select(model.id).where(*contains)
+
+    # the first SEARCH_SCAN matches, and the first SEARCH_SCAN rows starting
+    # with the first term in index order (exact and shorter ones first), so the
+    # best matches of a broad query are ranked without sorting all of them
+    starting = select(model.id).where(or_(*[starts_with(db, model, name, terms[0]) for name in PREFIX_COLUMNS[entity]]))
+    scanned = union(*[
+        select(subquery.c.id) for subquery in (
+            matched.limit(SEARCH_SCAN).subquery(), starting.limit(SEARCH_SCAN).subquery()
+        )
+    ])
+    tier, name_length = rank_columns(entity, terms, " ".join(terms))
+    return db.execute(
+        select(*selected, tier, name_length)
+        .where(model.id.in_(scanned), *matches)
+        .order_by(tier, name_length, model.id)
+        .limit(candidates),
+        params
+    ).all()
+
+def search(db: Session, query: str, entities=None, limit: int = SEARCH_LIMIT, candidates: int = SEARCH_CANDIDATES):
+    """
+    Returns up to limit {"entity", "id", "name", "detail"} matches, best first.
+    Every term must appear in one of the searched fields.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    ranked = []
+    for entity in entities or SEARCH_ENTITIES:
+        _, columns, name_columns = SEARCH_ENTITIES[entity]
+        all_columns = list(dict.fromkeys(name_columns + columns))
+        for row in candidate_rows(db, entity, terms, candidates):
+            values = dict(zip(all_columns, row[1:-2]))
+            name = " ".join(values[column] for column in name_columns if values[column])
+            ranked.append((row.tier, row.name_length, entity, row[0], {
+                "entity": entity,
+                "id": row[0],
+                "name": name,
+                "detail": ", ".join(values[column] for column in columns
+                                    if column not in name_columns and values[column])
+            }))
+
+    ranked.sort(key=lambda item: item[:4])
+    return [item[4] for item in ranked[:limit]]
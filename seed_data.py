@@ -1,20 +1,32 @@
 """
 This script populates the database with test data.
 All data is lowercase for consistency.
+
+Without arguments it loads the small demo data set. With any size argument it
+generates a large synthetic data set instead (sizes accept k/M suffixes):
+    python seed_data.py --products 10k --salespersons 2k --customers 1M --sales 20M --discounts 100k
 """
 
-from datetime import date
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from sqlalchemy import func, insert, select
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
-import models
-
-# Create database tables at startup if they don't exist
-Base.metadata.create_all(bind=engine)
+from database import SessionLocal, engine
+from migrations import backfill_sale_prices, run_migrations
+import models, commission_report, sales_analytics
 
 def seed_database():
+    # Create database tables and indexes if they don't exist
+    run_migrations(engine)
+
     db: Session = SessionLocal()
 
     # Clear existing data (order matters due to foreign key constraints)
+    db.query(models.CommissionRollup).delete()
+    db.query(models.DailySalesRollup).delete()
+    db.query(models.SaleChange).delete()
     db.query(models.Sale).delete()
     db.query(models.Discount).delete()
     db.query(models.Customer).delete()
@@ -53,34 +65,235 @@ def seed_database():
     # Sales (spread across quarters)
     sales = [
         # john
-        models.Sale(product_id=1, salesperson_id=1, customer_id=1, sales_date=date(2024, 1, 15)),
-        models.Sale(product_id=2, salesperson_id=1, customer_id=2, sales_date=date(2024, 4, 10)),
-        models.Sale(product_id=3, salesperson_id=1, customer_id=3, sales_date=date(2024, 7, 20)),
+        models.Sale(product_id=products[0].id, salesperson_id=salespersons[0].id, customer_id=customers[0].id, sales_date=date(2024, 1, 15)),
+        models.Sale(product_id=products[1].id, salesperson_id=salespersons[0].id, customer_id=customers[1].id, sales_date=date(2024, 4, 10)),
+        models.Sale(product_id=products[2].id, salesperson_id=salespersons[0].id, customer_id=customers[2].id, sales_date=date(2024, 7, 20)),
         # alice
-        models.Sale(product_id=4, salesperson_id=2, customer_id=2, sales_date=date(2024, 3, 22)),
-        models.Sale(product_id=1, salesperson_id=2, customer_id=3, sales_date=date(2024, 6, 18)),
-        models.Sale(product_id=2, salesperson_id=2, customer_id=1, sales_date=date(2024, 9, 5)),
+        models.Sale(product_id=products[3].id, salesperson_id=salespersons[1].id, customer_id=customers[1].id, sales_date=date(2024, 3, 22)),
+        models.Sale(product_id=products[0].id, salesperson_id=salespersons[1].id, customer_id=customers[2].id, sales_date=date(2024, 6, 18)),
+        models.Sale(product_id=products[1].id, salesperson_id=salespersons[1].id, customer_id=customers[0].id, sales_date=date(2024, 9, 5)),
         # mike
-        models.Sale(product_id=3, salesperson_id=3, customer_id=3, sales_date=date(2024, 2, 14)),
-        models.Sale(product_id=4, salesperson_id=3, customer_id=1, sales_date=date(2024, 5, 30)),
-        models.Sale(product_id=2, salesperson_id=3, customer_id=2, sales_date=date(2024, 10, 8)),
+        models.Sale(product_id=products[2].id, salesperson_id=salespersons[2].id, customer_id=customers[2].id, sales_date=date(2024, 2, 14)),
+        models.Sale(product_id=products[3].id, salesperson_id=salespersons[2].id, customer_id=customers[0].id, sales_date=date(2024, 5, 30)),
+        models.Sale(product_id=products[1].id, salesperson_id=salespersons[2].id, customer_id=customers[1].id, sales_date=date(2024, 10, 8)),
     ]
     db.add_all(sales)
 
     # Discounts (3 overlap sales, 2 don't)
     discounts = [
-        models.Discount(product_id=1, begin_date=date(2024, 1, 1), end_date=date(2024, 1, 31), discount_percentage=15.0),  # overlaps sale
-        models.Discount(product_id=2, begin_date=date(2024, 9, 1), end_date=date(2024, 9, 30), discount_percentage=20.0),  # overlaps sale
-        models.Discount(product_id=4, begin_date=date(2024, 5, 15), end_date=date(2024, 6, 15), discount_percentage=10.0),  # overlaps sale
-        models.Discount(product_id=5, begin_date=date(2024, 7, 1), end_date=date(2024, 7, 31), discount_percentage=25.0),  # no sale
-        models.Discount(product_id=5, begin_date=date(2024, 11, 1), end_date=date(2024, 11, 30), discount_percentage=12.5), # no sale
+        models.Discount(product_id=products[0].id, begin_date=date(2024, 1, 1), end_date=date(2024, 1, 31), discount_percentage=15.0),  # overlaps sale
+        models.Discount(product_id=products[1].id, begin_date=date(2024, 9, 1), end_date=date(2024, 9, 30), discount_percentage=20.0),  # overlaps sale
+        models.Discount(product_id=products[3].id, begin_date=date(2024, 5, 15), end_date=date(2024, 6, 15), discount_percentage=10.0),  # overlaps sale
+        models.Discount(product_id=products[4].id, begin_date=date(2024, 7, 1), end_date=date(2024, 7, 31), discount_percentage=25.0),  # no sale
+        models.Discount(product_id=products[4].id, begin_date=date(2024, 11, 1), end_date=date(2024, 11, 30), discount_percentage=12.5), # no sale
     ]
     db.add_all(discounts)
 
     db.commit()
+
+    # Rows above bypass crud, so record the sale prices and rebuild the rollups in one go
+    backfill_sale_prices(engine)
+    commission_report.rebuild_commission_rollup(db)
+    sales_analytics.rebuild_daily_rollup(db)
     db.close()
 
     print("Database seeded successfully.")
 
+# ---------- SYNTHETIC DATA ----------
+
+# Sales volume by month: spring/summer riding season plus a December bump
+MONTH_WEIGHTS = [0.6, 0.6, 0.9, 1.1, 1.3, 1.4, 1.4, 1.3, 1.0, 0.8, 0.7, 1.0]
+# Each year sells this much more than the one before
+YEARLY_GROWTH = 1.3
+
+STYLES = ["road", "mountain", "hybrid", "gravel", "kids", "cruiser", "electric", "bmx"]
+
+def zipf_cum_weights(n: int, s: float = 0.8):
+    """
+    Cumulative weights where item i is picked proportional to 1 / (i + 1)^s,
+    so a few products and salespersons account for most sales.
+    """
+    total = 0.0
+    cum_weights = []
+    for i in range(n):
+        total += 1 / (i + 1) ** s
+        cum_weights.append(total)
+    return cum_weights
+
+def month_cum_weights(first_year: int, years: int):
+    months = []
+    total = 0.0
+    cum_weights = []
+    for y in range(years):
+        for m in range(12):
+            total += MONTH_WEIGHTS[m] * YEARLY_GROWTH ** y
+            months.append((first_year + y, m + 1))
+            cum_weights.append(total)
+    return months, cum_weights
+
+def insert_chunks(bind, model, rows, chunk_size: int):
+    """
+    Inserts rows from a generator with one executemany per chunk.
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            with bind.begin() as conn:
+                conn.execute(insert(model), chunk)
+            chunk = []
+    if chunk:
+        with bind.begin() as conn:
+            conn.execute(insert(model), chunk)
+
+def generate_synthetic_data(bind=engine, products: int = 100, salespersons: int = 20, customers: int = 1000,
+                            sales: int = 10_000, discounts: int = 200, years: int = 5,
+                            seed: int = 42, chunk_size: int = 50_000, verbose: bool = False):
+    """
+    Replaces all data with a generated data set of the given size.
+    Product and salesperson popularity follow a Zipf-like curve, sales dates
+    are skewed towards recent years and the riding season.
+    """
+    rng = random.Random(seed)
+    first_year = date.today().year - years
+    first_day = date(first_year, 1, 1)
+
+    run_migrations(bind)
+    with bind.begin() as conn:
+        for model in (models.CommissionRollup, models.DailySalesRollup, models.SaleChange, models.Sale,
+                      models.Discount, models.Customer, models.Salesperson, models.Product):
+            conn.execute(model.__table__.delete())
+
+    def log(message):
+        if verbose:
+            print(f"{time.strftime('%H:%M:%S')} {message}")
+
+    log(f"inserting {products} products")
+    insert_chunks(bind, models.Product, (
+        {
+            "name": f"bike {i}",
+            "manufacturer": f"manufacturer {i % 50}",
+            "style": STYLES[i % len(STYLES)],
+            "purchase_price": round(price * 0.65, 2),
+            "sale_price": price,
+            "qty_on_hand": 10**9,
+            "commission_percentage": round(rng.uniform(5, 15), 1)
+        }
+        for i in range(products)
+        for price in [round(rng.uniform(200, 5000), 2)]
+    ), chunk_size)
+
+    log(f"inserting {salespersons} salespersons")
+    insert_chunks(bind, models.Salesperson, (
+        {
+            "first_name": f"rep {i}",
+            "last_name": f"lastname {i % 997}",
+            "address": f"{i} main st",
+            "phone": f"555-{i:07d}",
+            "start_date": first_day + timedelta(days=rng.randint(0, 365 * years)),
+            "termination_date": None,
+            "manager": f"manager {i % 40}"
+        }
+        for i in range(salespersons)
+    ), chunk_size)
+
+    log(f"inserting {customers} customers")
+    insert_chunks(bind, models.Customer, (
+        {
+            "first_name": f"customer {i}",
+            "last_name": f"lastname {i % 9973}",
+            "address": f"{i} oak ave",
+            "phone": f"555-{i:08d}",
+            "start_date": first_day + timedelta(days=rng.randint(0, 365 * years))
+        }
+        for i in range(customers)
+    ), chunk_size)
+
+    # ids are assigned in insert order, look up where they start
+    with bind.connect() as conn:
+        first_ids = [
+            conn.execute(select(func.min(model.id))).scalar() or 1
+            for model in (models.Product, models.Salesperson, models.Customer)
+        ]
+    product_ids = range(first_ids[0], first_ids[0] + products)
+    salesperson_ids = range(first_ids[1], first_ids[1] + salespersons)
+    customer_ids = range(first_ids[2], first_ids[2] + customers)
+
+    product_weights = zipf_cum_weights(products)
+    salesperson_weights = zipf_cum_weights(salespersons, 0.5)
+    months, month_weights = month_cum_weights(first_year, years)
+
+    def sale_rows():
+        # draw a whole chunk of each column at once, much faster than per row
+        remaining = sales
+        while remaining > 0:
+            n = min(chunk_size, remaining)
+            remaining -= n
+            columns = zip(
+                rng.choices(months, cum_weights=month_weights, k=n),
+                rng.choices(product_ids, cum_weights=product_weights, k=n),
+                rng.choices(salesperson_ids, cum_weights=salesperson_weights, k=n),
+                rng.choices(customer_ids, k=n),
+                rng.choices(range(1, 29), k=n)
+            )
+            for (year, month), product_id, salesperson_id, customer_id, day in columns:
+                yield {
+                    "product_id": product_id,
+                    "salesperson_id": salesperson_id,
+                    "customer_id": customer_id,
+                    "sales_date": date(year, month, day)
+                }
+
+    log(f"inserting {sales} sales")
+    insert_chunks(bind, models.Sale, sale_rows(), chunk_size)
+
+    log(f"inserting {discounts} discounts")
+    insert_chunks(bind, models.Discount, (
+        {
+            "product_id": rng.choice(product_ids),
+            "begin_date": begin,
+            "end_date": begin + timedelta(days=rng.choice([7, 14, 30, 60])),
+            "discount_percentage": float(rng.choice([5, 10, 15, 20, 25]))
+        }
+        for _ in range(discounts)
+        for begin in [first_day + timedelta(days=rng.randint(0, 365 * years))]
+    ), chunk_size)
+
+    log("recording sale prices")
+    backfill_sale_prices(bind)
+    log("rebuilding commission rollup")
+    with Session(bind=bind) as db:
+        commission_report.rebuild_commission_rollup(db)
+    log("rebuilding daily sales rollup")
+    with Session(bind=bind) as db:
+        sales_analytics.rebuild_daily_rollup(db)
+    log("done")
+
+def parse_size(value: str):
+    """
+    Parses sizes like 500, 10k or 20M.
+    """
+    value = value.strip().lower().replace("_", "")
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    if multiplier != 1:
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
 if __name__ == "__main__":
-    seed_database()
+    parser = argparse.ArgumentParser(description="Seed the database with demo or synthetic data.")
+    for name in ("products", "salespersons", "customers", "sales", "discounts"):
+        parser.add_argument(f"--{name}", type=parse_size)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sizes = {name: getattr(args, name) for name in ("products", "salespersons", "customers", "sales", "discounts")}
+    if any(sizes.values()):
+        start = time.perf_counter()
+        generate_synthetic_data(
+            engine, years=args.years, seed=args.seed, verbose=True,
+            **{name: size for name, size in sizes.items() if size is not None}
+        )
+        print(f"Synthetic data generated in {time.perf_counter() - start:.1f}s.")
+    else:
+        seed_database()
@@ -0,0 +1,355 @@
+"""
+Columnar snapshot of the sales for heavy reporting off the OLTP database.
+
+refresh_snapshot() exports the sales with the price, discount and commission rate
+recorded on them and their product's manufacturer and style, as Parquet files
+partitioned by year/quarter (hive layout, sales/year=2024/quarter=1/).
+Each run only appends the sales with an id above the last run's, as one new file
+per partition; --full rewrites everything (needed to pick up changed or deleted
+sales and manufacturer/style edits made after a sale was exported).
+Products and salespersons are copied whole on every run, they are small.
+
+The commission report and the sales series are then computed by DuckDB from those
+files, so finance queries never take a lock on the database create_sale writes to.
+Results have the same shape as commission_report.py and sales_analytics.py.
+
+    python snapshot.py                     # append new sales
+    python snapshot.py refresh --full      # rewrite the snapshot
+    python snapshot.py report 2024 1       # commission report (0 = all years / whole year)
+    python snapshot.py series 2024-01-01 2024-12-31 --bucket month --group-by style
+
+Needs the optional pyarrow and duckdb packages: pip install pyarrow duckdb
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import time
+from datetime import date, datetime, timezone
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import func, select
+from database import engine
+import models, commission_report, sales_analytics
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshot")
+SNAPSHOT_CHUNK_SIZE = 100_000
+
+SALES_SCHEMA = pa.schema([
+    ("sale_id", pa.int64()),
+    ("sales_date", pa.date32()),
+    ("product_id", pa.int64()),
+    ("salesperson_id", pa.int64()),
+    ("customer_id", pa.int64()),
+    ("manufacturer", pa.string()),
+    ("style", pa.string()),
+    ("list_price", pa.float64()),
+    ("commission_percentage", pa.float64()),
+    ("discount_percentage", pa.float64()),
+    ("sale_price", pa.float64()),  # after the discount
+    ("commission", pa.float64())
+])
+PRODUCTS_SCHEMA = pa.schema([("id", pa.int64()), ("name", pa.string())])
+SALESPERSONS_SCHEMA = pa.schema([("id", pa.int64()), ("first_name", pa.string()), ("last_name", pa.string())])
+
+# ---------- EXPORT ----------
+
+def snapshot_query(after_id: int, up_to_id: int):
+    """
+    Sales with after_id < id <= up_to_id and everything the reports need, by id.
+    """
+    return (
+        select(
+            models.Sale.id,
+            models.Sale.sales_date,
+            models.Sale.product_id,
+            models.Sale.salesperson_id,
+            models.Sale.customer_id,
+            models.Product.manufacturer,
+            models.Product.style,
+            models.Sale.unit_price,
+            models.Sale.commission_percentage,
+            models.Sale.discount_percentage,
+            commission_report.discounted_price(),
+            commission_report.sale_commission()
+        )
+        .outerjoin(models.Product, models.Product.id == models.Sale.product_id)
+        .where(
+            commission_report.priced_sales(),
+            models.Sale.id > after_id,
+            models.Sale.id <= up_to_id,
+            models.Sale.sales_date.is_not(None)
+        )
+        .order_by(models.Sale.id)
+    )
+
+def to_table(rows, schema: pa.Schema):
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    return pa.Table.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema
+    )
+
+def partition_dir(root: str, year: int, quarter: int):
+    return os.path.join(root, f"year={year}", f"quarter={quarter}")
+
+def read_state(directory: str):
+    try:
+        with open(os.path.join(directory, "state.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def write_state(directory: str, state, name: str = "state.json"):
+    path = os.path.join(directory, name)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def sales_files(sales_dir: str):
+    return glob.glob(os.path.join(sales_dir, "*", "*", "*.parquet"))
+
+def publish(directory: str):
+    """
+    Moves the files of a finished staging directory into sales/, removes those a
+    full refresh replaces and writes the state from its manifest. A run that
+    stopped part way through is finished by running it again.
+    """
+    staging_dir = os.path.join(directory, "staging")
+    sales_dir = os.path.join(directory, "sales")
+    with open(os.path.join(staging_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+
+    file_name = manifest["file_name"]
+    for path in sales_files(staging_dir):
+        target = os.path.join(sales_dir, os.path.relpath(os.path.dirname(path), staging_dir))
+        os.makedirs(target, exist_ok=True)
+        os.replace(path, os.path.join(target, file_name))
+    if manifest["full"]:
+        for path in sales_files(sales_dir):
+            if os.path.basename(path) != file_name:
+                os.remove(path)
+    write_state(directory, manifest["state"])
+    shutil.rmtree(staging_dir)
+
+def write_dimension(conn, directory: str, name: str, query, schema: pa.Schema):
+    path = os.path.join(directory, f"{name}.parquet")
+    pq.write_table(to_table(conn.execute(query).all(), schema), path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+def refresh_snapshot(bind=engine, directory: str = SNAPSHOT_DIR, full: bool = False):
+    """
+    Appends the sales added since the last refresh (all of them if full) and
+    returns how many were written. New files are staged first and moved into
+    place at the end (see publish), so readers never see half-written partitions
+    and a run stopped while moving them is finished instead of exported twice.
+    """
+    os.makedirs(directory, exist_ok=True)
+    staging_dir = os.path.join(directory, "staging")
+    if os.path.exists(os.path.join(staging_dir, "manifest.json")):
+        publish(directory)
+    shutil.rmtree(staging_dir, ignore_errors=True)  # left over by a failed export
+    state = {} if full else read_state(directory)
+    after_id = state.get("last_sale_id", 0)
+
+    writers = {}  # (year, quarter) -> ParquetWriter
+    written = 0
+    with bind.connect() as conn:
+        # fixed upper bound: sales inserted while exporting go to the next run
+        up_to_id = conn.scalar(select(func.max(models.Sale.id))) or 0
+        file_name = f"sales-{after_id + 1:012d}-{up_to_id:012d}.parquet"
+        try:
+            result = conn.execution_options(yield_per=SNAPSHOT_CHUNK_SIZE).execute(
+                snapshot_query(after_id, up_to_id)
+            )
+            for rows in result.partitions():
+                by_partition = {}
+                for row in rows:
+                    sales_date = row[1]
+                    by_partition.setdefault((sales_date.year, (sales_date.month - 1) // 3 + 1), []).append(row)
+                for (year, quarter), partition_rows in by_partition.items():
+                    writer = writers.get((year, quarter))
+                    if writer is None:
+                        path = partition_dir(staging_dir, year, quarter)
+                        os.makedirs(path)
+                        writer = writers[(year, quarter)] = pq.ParquetWriter(os.path.join(path, file_name), SALES_SCHEMA)
+                    writer.write_table(to_table(partition_rows, SALES_SCHEMA))
+                written += len(rows)
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        write_dimension(conn, directory, "products",
+                        select(models.Product.id, models.Product.name), PRODUCTS_SCHEMA)
+        write_dimension(conn, directory, "salespersons",
+                        select(models.Salesperson.id, models.Salesperson.first_name, models.Salesperson.last_name),
+                        SALESPERSONS_SCHEMA)
+
+    # the staged files are complete: from here on the run is finished, not redone
+    os.makedirs(staging_dir, exist_ok=True)
+    write_state(staging_dir, {
+        "file_name": file_name,
+        "full": full,
+        "state": {
+            "last_sale_id": up_to_id,
+            "refreshed_at": datetime.now(timezone.utc).isoformat(timespec="seconds")
+        }
+    }, "manifest.json")
+    publish(directory)
+    return written
+
+# ---------- REPORTING ----------
+
+def sql_path(path: str):
+    return "'" + path.replace("'", "''") + "'"
+
+def connect(directory: str = SNAPSHOT_DIR):
+    """
+    In-memory DuckDB connection with sales, products and salespersons views over the snapshot.
+    """
+    if not os.path.exists(os.path.join(directory, "salespersons.parquet")):
+        raise FileNotFoundError(f"No snapshot in {directory}, run python snapshot.py first.")
+
+    con = duckdb.connect()
+    pattern = os.path.join(directory, "sales", "*", "*", "*.parquet")
+    if glob.glob(pattern):
+        con.execute(f"CREATE VIEW sales AS SELECT * FROM read_parquet({sql_path(pattern)}, hive_partitioning = true)")
+    else:
+        empty = SALES_SCHEMA.empty_table().append_column("year", pa.array([], pa.int64())) \
+            .append_column("quarter", pa.array([], pa.int64()))
+        con.register("sales", empty)
+    for name in ("products", "salespersons"):
+        con.execute(f"CREATE VIEW {name} AS SELECT * FROM read_parquet({sql_path(os.path.join(directory, name + '.parquet'))})")
+    return con
+
+def snapshot_commission_report(year: int, quarter: int, directory: str = SNAPSHOT_DIR):
+    """
+    generate_commission_report computed from the snapshot.
+    year == 0 means all years, quarter == 0 the whole year.
+    """
+    conditions, params = [], []
+    if year != 0:
+        # partition columns, so DuckDB only reads the matching directories
+        conditions.append("year = ?")
+        params.append(year)
+        if quarter != 0:
+            conditions.append("quarter = ?")
+            params.append(quarter)
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+
+    con = connect(directory)
+    try:
+        rows = con.execute(f"""
+            WITH totals AS (
+                -- in millionths of a dollar, like commission_report.sum_micros
+                SELECT salesperson_id, count(*) AS num_sales,
+                       sum(CAST(round(sale_price * 1000000) AS BIGINT)) AS total_sales_amount,
+                       sum(CAST(round(commission * 1000000) AS BIGINT)) AS total_commission
+                FROM sales {where}
+                GROUP BY salesperson_id
+            )
+            SELECT s.id, s.first_name, s.last_name, coalesce(t.num_sales, 0),
+                   coalesce(t.total_sales_amount, 0), coalesce(t.total_commission, 0)
+            FROM salespersons s LEFT JOIN totals t ON t.salesperson_id = s.id
+            ORDER BY s.id
+        """, params).fetchall()
+    finally:
+        con.close()
+    return commission_report.format_report(rows)
+
+SERIES_GROUP_KEYS = {
+    "none": "''",
+    "product": "product_id",
+    "manufacturer": "coalesce(manufacturer, '')",
+    "style": "coalesce(style, '')",
+    "salesperson": "salesperson_id"
+}
+
+def snapshot_sales_series(start_date: date, end_date: date, bucket: str = "month",
+                          group_by: str = "none", product_id: int | None = None,
+                          salesperson_id: int | None = None, manufacturer: str | None = None,
+                          style: str | None = None, limit: int = sales_analytics.DEFAULT_SERIES_LIMIT,
+                          directory: str = SNAPSHOT_DIR):
+    """
+    sales_analytics.sales_series computed from the snapshot.
+    """
+    starts = sales_analytics.series_buckets(start_date, end_date, bucket)
+    conditions = ["year BETWEEN ? AND ?", "sales_date BETWEEN ? AND ?"]
+    params = [start_date.year, end_date.year, start_date, end_date]
+    for dimension, value in sales_analytics.series_filters(product_id, salesperson_id, manufacturer, style).items():
+        conditions.append(f"{SERIES_GROUP_KEYS[dimension]} = ?")
+        params.append(value)
+
+    con = connect(directory)
+    try:
+        group_key = SERIES_GROUP_KEYS[group_by]
+        where = " AND ".join(conditions)
+        if group_by != "none":
+            # only the rows of the top groups are fetched into Python
+            where += f""" AND {group_key} IN (
+                SELECT {group_key} FROM sales WHERE {where}
+                GROUP BY ALL ORDER BY sum(CAST(round(sale_price * 1000000) AS BIGINT)) DESC, 1 LIMIT ?
+            )"""
+            params = params + params + [limit]
+        # in millionths of a dollar, like sales_analytics.daily_totals_query
+        rows = con.execute(f"""
+            SELECT sales_date, {group_key} AS group_key, count(*),
+                   sum(CAST(round(list_price * 1000000) AS BIGINT)),
+                   sum(CAST(round(sale_price * 1000000) AS BIGINT)),
+                   sum(CAST(round(commission * 1000000) AS BIGINT))
+            FROM sales
+            WHERE {where}
+            GROUP BY ALL
+        """, params).fetchall()
+
+        def labels_for(keys):
+            if group_by == "product":
+                return dict(con.execute("SELECT id, name FROM products WHERE id IN (SELECT unnest(?))", [keys]).fetchall())
+            if group_by == "salesperson":
+                names = con.execute("SELECT id, first_name, last_name FROM salespersons WHERE id IN (SELECT unnest(?))", [keys]).fetchall()
+                return {row[0]: " ".join(part for part in row[1:] if part) for row in names}
+            return {key: key for key in keys}
+
+        series = sales_analytics.build_series(rows, starts, bucket, group_by, limit, labels_for)
+    finally:
+        con.close()
+
+    return {
+        "bucket": bucket,
+        "group_by": group_by,
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "series": series
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parquet snapshot of the sales and reports computed from it.")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR)
+    commands = parser.add_subparsers(dest="command")
+    refresh = commands.add_parser("refresh", help="append new sales (the default)")
+    refresh.add_argument("--full", action="store_true", help="rewrite the whole snapshot")
+    report = commands.add_parser("report", help="commission report")
+    report.add_argument("year", type=int)
+    report.add_argument("quarter", type=int)
+    series = commands.add_parser("series", help="sales series as JSON")
+    series.add_argument("start_date", type=date.fromisoformat)
+    series.add_argument("end_date", type=date.fromisoformat)
+    series.add_argument("--bucket", choices=sales_analytics.BUCKETS, default="month")
+    series.add_argument("--group-by", choices=("none",) + sales_analytics.DIMENSIONS, default="none")
+    series.add_argument("--limit", type=int, default=sales_analytics.DEFAULT_SERIES_LIMIT)
+    args = parser.parse_args()
+
+    if args.command == "report":
+        for row in snapshot_commission_report(args.year, args.quarter, args.dir):
+            print(row)
+    elif args.command == "series":
+        print(json.dumps(snapshot_sales_series(
+            args.start_date, args.end_date, args.bucket, args.group_by, limit=args.limit, directory=args.dir
+        ), indent=2))
+    else:
+        start = time.perf_counter()
+        count = refresh_snapshot(engine, args.dir, full=getattr(args, "full", False))
+        print(f"Snapshot refreshed: {count} sales written in {time.perf_counter() - start:.1f}s.")
@@ -0,0 +1,37 @@
+// Search boxes for long product/salesperson/customer lists (templates/reference_select.html).
+// Suggestions come from /typeahead/<entity>?q=..., the chosen "name (#id)" sets the hidden id field.
+document.addEventListener("DOMContentLoaded", function() {
+    document.querySelectorAll("input.typeahead").forEach(input => {
+        const hidden = input.form.querySelector(`input[type="hidden"][name="${input.dataset.target}"]`);
+        const datalist = document.getElementById(input.getAttribute("list"));
+        let timer = null;
+
+        input.addEventListener("input", function() {
+            const match = input.value.match(/\(#(\d+)\)$/);
+            hidden.value = match ? match[1] : "";
+            if (match) {
+                return;
+            }
+            clearTimeout(timer);
+            timer = setTimeout(function() {
+                fetch(`/typeahead/${input.dataset.entity}?q=${encodeURIComponent(input.value)}`)
+                    .then(response => response.json())
+                    .then(results => {
+                        datalist.innerHTML = "";
+                        results.forEach(result => {
+                            const option = document.createElement("option");
+                            option.value = `${result.name} (#${result.id})`;
+                            datalist.appendChild(option);
+                        });
+                    });
+            }, 200);
+        });
+
+        input.form.addEventListener("submit", function(e) {
+            if (!hidden.value) {
+                e.preventDefault();
+                alert("Please pick an entry from the suggestions.");
+            }
+        });
+    });
+});
@@ -0,0 +1,47 @@
+"""
+Shared fixtures. The tests run against a throwaway SQLite database: DATABASE_URL
+(and the report job table) point into a temporary directory before any project
+module creates its engine. TEST_DATABASE_URL runs them against another database
+instead (e.g. PostgreSQL, see test_postgresql.py); its tables are wiped.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+TEST_DIR = tempfile.mkdtemp(prefix="bespoked_bikes_tests_")
+atexit.register(shutil.rmtree, TEST_DIR, ignore_errors=True)
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL") or f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}"
+os.environ["REPORT_JOBS_PATH"] = os.path.join(TEST_DIR, "report_jobs.db")
+
+import pytest
+from database import SessionLocal, engine
+from discount_index import discount_index
+from report_cache import report_cache
+from seed_data import generate_synthetic_data
+import models, incremental_report, reference_data
+
+# n_plus_one fails tests that run an N+1, pytester runs it on a test file
+pytest_plugins = ("n_plus_one", "pytester")
+
+# small enough to reseed for every test, spread over five years like the real data
+TEST_DATA_SIZES = {"products": 20, "salespersons": 8, "customers": 200, "sales": 3000, "discounts": 40}
+
+@pytest.fixture
+def db():
+    """
+    Session on a freshly generated data set. Caches of the previous test are dropped.
+    """
+    if engine.dialect.name != "sqlite":
+        # sequences don't restart when the rows are deleted, the tests expect ids from 1
+        models.Base.metadata.drop_all(engine)
+    generate_synthetic_data(engine, **TEST_DATA_SIZES)
+    report_cache.clear()
+    incremental_report.incremental_totals.clear()
+    discount_index.clear()
+    for reference in (reference_data.products, reference_data.salespersons, reference_data.customers):
+        reference.invalidate()
+    session = SessionLocal()
+    yield session
+    session.close()
@@ -0,0 +1,34 @@
+"""
+pytest plugin failing every test that runs the same SELECT N_PLUS_ONE_THRESHOLD
+times or more (a likely N+1, see query_debug.py), loaded by conftest.py.
+
+Only the test itself is checked, not its fixtures. Setup and verification
+loops inside a test are left out with not_checked(), tests that repeat
+queries on purpose (a per-row reference computation, batches processed in
+chunks) are marked:
+
+    @pytest.mark.allow_n_plus_one
+"""
+
+from contextlib import contextmanager
+import pytest
+import query_debug
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "allow_n_plus_one: the test repeats queries on purpose")
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    if item.get_closest_marker("allow_n_plus_one"):
+        return (yield)
+    # a failing test keeps its own error, the check only runs after it passed
+    with query_debug.assert_no_n_plus_one():
+        return (yield)
+
+@contextmanager
+def not_checked():
+    """
+    Leaves the statements run in the block out of the test's check.
+    """
+    with query_debug.track_queries():
+        yield
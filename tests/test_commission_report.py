@@ -0,0 +1,158 @@
+"""
+The grouped commission report against the per-row computation it replaced.
+"""
+
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import Float, literal, select
+from n_plus_one import not_checked
+import models, schemas, crud, commission_report
+
+def per_row_report(db, year: int, quarter: int):
+    """
+    The report as the commission report page used to compute it, copied
+    unchanged from app.generate_commission_report before the grouped query:
+    every sale of every salesperson loaded and priced from its product and
+    discount one by one, added up as floats and rounded once.
+    """
+    report = []
+    salespersons = db.query(models.Salesperson).all()
+
+    for sp in salespersons:
+        sales_query = db.query(models.Sale).filter(models.Sale.salesperson_id == sp.id)
+
+        if year != 0:
+            if quarter != 0:
+                # Filter by year + quarter
+                quarter_start_month = (quarter - 1) * 3 + 1
+                quarter_end_month = quarter_start_month + 2
+
+                quarter_start = date(year, quarter_start_month, 1)
+                if quarter_end_month == 12:
+                    quarter_end = date(year, 12, 31)
+                else:
+                    quarter_end = date(year, quarter_end_month + 1, 1) - timedelta(days=1)
+
+                sales_query = sales_query.filter(
+                    models.Sale.sales_date >= quarter_start,
+                    models.Sale.sales_date <= quarter_end
+                )
+            else:
+                # Filter by year only (all quarters)
+                year_start = date(year, 1, 1)
+                year_end = date(year, 12, 31)
+                sales_query = sales_query.filter(
+                    models.Sale.sales_date >= year_start,
+                    models.Sale.sales_date <= year_end
+                )
+        # if year == 0, do not add any date filter, get all sales
+
+        sales = sales_query.all()
+
+        num_sales = len(sales)
+        total_sales_amount = 0.0
+        total_commission = 0.0
+
+        for sale in sales:
+            product = sale.product
+            price = product.sale_price
+
+            discount = db.query(models.Discount).filter(
+                models.Discount.product_id == product.id,
+                models.Discount.begin_date <= sale.sales_date,
+                models.Discount.end_date >= sale.sales_date
+            ).first()
+
+            if discount:
+                price = price * (1 - discount.discount_percentage / 100)
+
+            commission = price * (product.commission_percentage / 100)
+            total_sales_amount += price
+            total_commission += commission
+
+        report.append({
+            "salesperson_id": sp.id,
+            "first_name": sp.first_name,
+            "last_name": sp.last_name,
+            "num_sales": num_sales,
+            "total_sales_amount": round(total_sales_amount, 2),
+            "total_commission": round(total_commission, 2)
+        })
+
+    return report
+
+LAST_YEAR = date.today().year - 1
+
+@pytest.mark.parametrize("year, quarter", [(0, 0), (LAST_YEAR, 0), (LAST_YEAR, 1), (LAST_YEAR, 3), (LAST_YEAR - 2, 2)])
+def test_grouped_query_matches_per_row_computation(db, year, quarter):
+    with not_checked():
+        expected = per_row_report(db, year, quarter)
+    assert commission_report.compute_commission_report(db, year, quarter) == expected
+    assert commission_report.generate_commission_report(db, year, quarter) == expected
+
+def test_totals_do_not_depend_on_sale_order(db):
+    # float sums of these three discounted prices (1828.865 exactly) round to
+    # 1828.86 in one order and 1828.87 in the other. The same sales are made by
+    # two salespersons, with dates that follow the ids for one and run
+    # backwards for the other, so the date index reads them in both orders.
+    year = date.today().year + 1
+    with not_checked():
+        salesperson_ids = make_sales_in_both_orders(db, year)
+    for report in (commission_report.compute_commission_report(db, year, 1),
+                   commission_report.generate_commission_report(db, year, 1)):
+        assert [
+            (row["num_sales"], row["total_sales_amount"], row["total_commission"])
+            for row in report if row["salesperson_id"] in salesperson_ids
+        ] == [(3, 1828.87, 182.89)] * 2
+
+def make_sales_in_both_orders(db, year: int) -> list[int]:
+    products = []
+    for i, (sale_price, discount_percentage) in enumerate([(720.71, 15.0), (671.74, 10.0), (643.89, 5.0)]):
+        product = crud.create_product(db, schemas.ProductCreate(
+            name=f"order test {i}", manufacturer="test", style="road", purchase_price=100.0,
+            sale_price=sale_price, qty_on_hand=10, commission_percentage=10.0
+        ))
+        crud.create_discount(db, schemas.DiscountCreate(
+            product_id=product.id, begin_date=date(year, 1, 1), end_date=date(year, 12, 31),
+            discount_percentage=discount_percentage
+        ))
+        products.append(product)
+
+    salesperson_ids = []
+    for days in ([1, 2, 3], [3, 2, 1]):
+        salesperson = crud.create_salesperson(db, schemas.SalespersonCreate(
+            first_name="order", last_name=f"test {days[0]}", address="1 test st", phone=f"555-{days[0]:07d}",
+            start_date=date(2020, 1, 1), termination_date=None, manager="manager 0"
+        ))
+        salesperson_ids.append(salesperson.id)
+        for product, day in zip(products, days):
+            crud.create_sale(db, schemas.SaleCreate(
+                product_id=product.id, salesperson_id=salesperson.id, customer_id=1, sales_date=date(year, 3, day)
+            ))
+    return salesperson_ids
+
+@pytest.mark.parametrize("year, quarter, expected", [
+    (0, 0, None),
+    (2024, 0, (date(2024, 1, 1), date(2024, 12, 31))),
+    (2024, 1, (date(2024, 1, 1), date(2024, 3, 31))),
+    (2024, 4, (date(2024, 10, 1), date(2024, 12, 31)))
+])
+def test_report_date_range(year, quarter, expected):
+    assert commission_report.get_report_date_range(year, quarter) == expected
+
+# exact halves: PostgreSQL rounds a float half to even, the numeric cast rounds it up
+@pytest.mark.parametrize("amount, micros", [
+    (0.0000005, 1), (0.0000025, 3), (0.0000035, 4), (1234.5, 1_234_500_000), (None, None)
+])
+def test_in_micros_rounds_half_up_to_an_integer(db, amount, micros):
+    result = db.scalar(select(commission_report.in_micros(literal(amount, Float))))
+    assert result == micros
+    assert micros is None or type(result) is int
+
+def test_sale_year_and_quarter_are_integers(db):
+    rows = db.execute(
+        select(models.Sale.sales_date, commission_report.sale_year(), commission_report.sale_quarter())
+    ).all()
+    for sales_date, year, quarter in rows:
+        assert (year, quarter) == (sales_date.year, (sales_date.month - 1) // 3 + 1)
+        assert type(year) is int and type(quarter) is int
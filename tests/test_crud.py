@@ -0,0 +1,165 @@
+"""
+crud write paths and the rollups they keep current.
+"""
+
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from database import engine
+from n_plus_one import not_checked
+import models, schemas, crud, commission_report
+
+def sales_count(db):
+    return db.scalar(select(func.count(models.Sale.id)))
+
+def assert_rollups_current(db, year: int):
+    # the commission rollup crud updated adds up to what the sales table says
+    with not_checked():
+        for quarter in range(5):
+            assert commission_report.generate_commission_report(db, year, quarter) == \
+                commission_report.compute_commission_report(db, year, quarter)
+
+# the rollup rows of the batch are looked up and updated in chunks
+@pytest.mark.allow_n_plus_one
+def test_create_sales_bulk(db):
+    # a product with little stock left, so later rows for it are refused
+    scarce = crud.get_product(db, 5)
+    scarce.qty_on_hand = 10
+    db.commit()
+    stock_before = {product.id: product.qty_on_hand for product in crud.get_products(db)}
+    count_before = sales_count(db)
+
+    year = date.today().year - 1
+    sales = [
+        schemas.SaleCreate(
+            product_id=1 + i % 6, salesperson_id=1 + i % 8, customer_id=1 + i % 200,
+            sales_date=date(year, 1, 1) + timedelta(days=i % 365)
+        )
+        for i in range(5000)
+    ]
+    sales.append(schemas.SaleCreate(product_id=9999, salesperson_id=1, customer_id=1, sales_date=date(year, 6, 1)))
+    result = crud.create_sales_bulk(db, sales)
+
+    refused = [i for i, sale in enumerate(sales) if sale.product_id == 5][10:]
+    assert result["errors"] == [
+        {"index": i, "detail": "Cannot create sale. Product is out of stock."} for i in refused
+    ] + [{"index": len(sales) - 1, "detail": "Product not found."}]
+    assert result["created"] == len(sales) - len(refused) - 1
+    assert sales_count(db) == count_before + result["created"]
+
+    db.expire_all()
+    for product_id in range(1, 7):
+        sold = sum(1 for i, sale in enumerate(sales) if sale.product_id == product_id and i not in refused)
+        assert crud.get_product(db, product_id).qty_on_hand == stock_before[product_id] - sold
+
+    assert_rollups_current(db, year)
+    daily_sales = db.scalar(
+        select(func.sum(models.DailySalesRollup.num_sales)).where(models.DailySalesRollup.dimension == "all")
+    )
+    assert daily_sales == db.scalar(select(func.count(models.Sale.id)).where(commission_report.priced_sales()))
+
+def test_concurrent_sales_never_oversell(db):
+    product = crud.get_product(db, 1)
+    product.qty_on_hand = 25
+    db.commit()
+    count_before = db.scalar(select(func.count(models.Sale.id)).where(models.Sale.product_id == 1))
+    if engine.dialect.name == "sqlite":
+        # a short busy timeout, so writers run into "database is locked" and retry
+        contended = create_engine(engine.url, connect_args={"check_same_thread": False, "timeout": 0.1})
+    else:
+        contended = create_engine(engine.url)
+
+    def sell(thread: int):
+        created = refused = 0
+        with Session(contended, autoflush=False) as session:
+            for i in range(10):
+                try:
+                    crud.create_sale(session, schemas.SaleCreate(
+                        product_id=1, salesperson_id=1 + thread, customer_id=1 + i,
+                        sales_date=date(date.today().year - 1, 1 + thread, 1 + i)
+                    ))
+                    created += 1
+                except ValueError:
+                    refused += 1
+        return created, refused
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(sell, range(8)))
+    contended.dispose()
+
+    db.expire_all()
+    assert sum(created for created, _ in results) == 25
+    assert sum(refused for _, refused in results) == 80 - 25
+    assert crud.get_product(db, 1).qty_on_hand == 0
+    assert db.scalar(select(func.count(models.Sale.id)).where(models.Sale.product_id == 1)) == count_before + 25
+    assert_rollups_current(db, date.today().year - 1)
+
+@pytest.mark.parametrize("create, create_once, many", [
+    ("create_sale", "create_sale_once", False),
+    ("create_sales_bulk", "create_sales_bulk_once", True)
+])
+def test_sale_writes_retry_lock_errors(db, monkeypatch, create, create_once, many):
+    write_once = getattr(crud, create_once)
+    attempts = []
+
+    def locked(times: int):
+        def attempt(session, sales):
+            attempts.append(sales)
+            if len(attempts) <= times:
+                raise OperationalError("INSERT INTO sales", {}, sqlite3.OperationalError("database is locked"))
+            return write_once(session, sales)
+        return attempt
+
+    monkeypatch.setattr(crud, "LOCK_RETRY_DELAY", 0)
+    sale = schemas.SaleCreate(product_id=2, salesperson_id=1, customer_id=1, sales_date=date.today())
+    count_before = sales_count(db)
+
+    monkeypatch.setattr(crud, create_once, locked(2))
+    getattr(crud, create)(db, [sale] if many else sale)
+    assert len(attempts) == 3
+    assert sales_count(db) == count_before + 1
+
+    # a lock that doesn't go away is raised after LOCK_RETRIES attempts
+    attempts.clear()
+    monkeypatch.setattr(crud, create_once, locked(crud.LOCK_RETRIES))
+    with pytest.raises(OperationalError):
+        getattr(crud, create)(db, [sale] if many else sale)
+    assert len(attempts) == crud.LOCK_RETRIES
+    assert sales_count(db) == count_before + 1
+
+def test_sale_of_a_missing_product_is_refused(db):
+    stock_before = {product.id: product.qty_on_hand for product in crud.get_products(db)}
+    count_before = sales_count(db)
+    sale = schemas.SaleCreate(product_id=9999, salesperson_id=1, customer_id=1, sales_date=date.today())
+
+    with pytest.raises(ValueError, match="Product not found."):
+        crud.create_sale(db, sale)
+    assert crud.create_sales_bulk(db, [sale]) == {"created": 0, "errors": [{"index": 0, "detail": "Product not found."}]}
+
+    assert sales_count(db) == count_before
+    db.expire_all()
+    assert {product.id: product.qty_on_hand for product in crud.get_products(db)} == stock_before
+
+def test_sales_are_priced_with_the_current_discounts(db):
+    product = crud.create_product(db, schemas.ProductCreate(
+        name="discount test", manufacturer="test", style="road", purchase_price=100.0,
+        sale_price=200.0, qty_on_hand=10, commission_percentage=10.0
+    ))
+    sales_date = date(date.today().year + 1, 5, 5)
+    sale = schemas.SaleCreate(product_id=product.id, salesperson_id=1, customer_id=1, sales_date=sales_date)
+    assert crud.create_sale(db, sale).discount_percentage == 0.0
+
+    discount = crud.create_discount(db, schemas.DiscountCreate(
+        product_id=product.id, begin_date=sales_date, end_date=sales_date, discount_percentage=20.0
+    ))
+    assert crud.create_sale(db, sale).discount_percentage == 20.0
+    crud.update_discount(db, discount.id, schemas.DiscountCreate(
+        product_id=product.id, begin_date=sales_date, end_date=sales_date, discount_percentage=30.0
+    ))
+    assert crud.create_sale(db, sale).discount_percentage == 30.0
+    crud.delete_discount(db, discount)
+    assert crud.create_sale(db, sale).discount_percentage == 0.0
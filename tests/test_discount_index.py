@@ -0,0 +1,84 @@
+"""
+The discount index: flattened intervals match the discount rows, and the shared
+index follows discount writes.
+"""
+
+from datetime import date
+import pytest
+from types import SimpleNamespace
+import crud, schemas, models
+from discount_index import DiscountIndex, build_intervals, find
+
+def discount(id, begin, end, pct):
+    return SimpleNamespace(id=id, begin_date=begin, end_date=end, discount_percentage=pct)
+
+def lookup(discounts, day):
+    return find(build_intervals(discounts), day)
+
+def test_overlapping_discounts_resolve_to_the_lowest_id():
+    discounts = [
+        discount(3, date(2024, 1, 1), date(2024, 1, 31), 30.0),
+        discount(1, date(2024, 1, 10), date(2024, 1, 20), 10.0),
+        discount(2, date(2024, 1, 15), date(2024, 2, 10), 20.0),
+    ]
+    assert lookup(discounts, date(2024, 1, 5)) == 30.0
+    assert lookup(discounts, date(2024, 1, 10)) == 10.0
+    assert lookup(discounts, date(2024, 1, 20)) == 10.0
+    assert lookup(discounts, date(2024, 1, 21)) == 20.0
+    assert lookup(discounts, date(2024, 2, 10)) == 20.0
+    assert build_intervals(discounts) == (
+        [date(2024, 1, 1).toordinal(), date(2024, 1, 10).toordinal(), date(2024, 1, 21).toordinal()],
+        [date(2024, 1, 10).toordinal(), date(2024, 1, 21).toordinal(), date(2024, 2, 11).toordinal()],
+        [30.0, 10.0, 20.0],
+    )
+
+def test_begin_and_end_dates_are_included():
+    discounts = [discount(1, date(2024, 3, 1), date(2024, 3, 31), 15.0)]
+    assert lookup(discounts, date(2024, 2, 29)) is None
+    assert lookup(discounts, date(2024, 3, 1)) == 15.0
+    assert lookup(discounts, date(2024, 3, 31)) == 15.0
+    assert lookup(discounts, date(2024, 4, 1)) is None
+    # a one-day discount
+    assert lookup([discount(1, date(2024, 3, 1), date(2024, 3, 1), 5.0)], date(2024, 3, 1)) == 5.0
+
+def test_days_between_discounts_have_none():
+    discounts = [
+        discount(1, date(2024, 1, 1), date(2024, 1, 10), 10.0),
+        discount(2, date(2024, 1, 11), date(2024, 1, 20), 10.0),
+        discount(3, date(2024, 2, 1), date(2024, 2, 10), 10.0),
+    ]
+    assert lookup(discounts, date(2024, 1, 25)) is None
+    # adjacent discounts with the same percentage merge, the gap stays
+    assert build_intervals(discounts)[0] == [date(2024, 1, 1).toordinal(), date(2024, 2, 1).toordinal()]
+    assert lookup([], date(2024, 1, 1)) is None
+    assert lookup([discount(1, date(2024, 1, 10), date(2024, 1, 1), 10.0)], date(2024, 1, 5)) is None
+    assert lookup(discounts, None) is None
+
+@pytest.mark.allow_n_plus_one  # every lookup after a write reloads on purpose
+def test_index_follows_discount_writes(db):
+    index = DiscountIndex()
+    sales_date = date(1990, 6, 1)  # before any seeded discount
+    pairs = [(1, sales_date), (2, sales_date)]
+    assert index.get_discount_percentages(db, pairs) == [None, None]
+
+    # written by another process: seen once the product's intervals expire
+    db.add(models.Discount(product_id=1, begin_date=sales_date, end_date=sales_date, discount_percentage=5.0))
+    db.commit()
+    assert index.get_discount_percentages(db, pairs) == [None, None]
+    index.ttl = 0
+    assert index.get_discount_percentages(db, pairs) == [5.0, None]
+
+    # written through crud: the shared index rebuilds that product at once
+    shared = crud.discount_index
+    assert shared.get_discount_percentages(db, pairs) == [5.0, None]
+    created = crud.create_discount(db, schemas.DiscountCreate(
+        product_id=2, begin_date=sales_date, end_date=sales_date, discount_percentage=25.0
+    ))
+    assert shared.get_discount_percentages(db, pairs) == [5.0, 25.0]
+    crud.update_discount(db, created.id, schemas.DiscountCreate(
+        product_id=1, begin_date=sales_date, end_date=sales_date, discount_percentage=25.0
+    ))
+    # the older discount keeps product 1, product 2 has none left
+    assert shared.get_discount_percentages(db, pairs) == [5.0, None]
+    crud.delete_discount(db, db.get(models.Discount, created.id))
+    assert shared.get_discount_percentages(db, pairs) == [5.0, None]
@@ -0,0 +1,67 @@
+"""
+Streaming exports: every matching sale once in id order, the same rows as CSV
+and NDJSON, and a commission report equal to the report page's.
+"""
+
+import csv
+import io
+import json
+from datetime import date
+import pytest
+from fastapi.testclient import TestClient
+import app, commission_report, export, models
+
+YEAR = date.today().year - 1
+
+@pytest.fixture
+def client():
+    with TestClient(app.app) as client:
+        yield client
+
+def ndjson_rows(client, url):
+    response = client.get(url + "&format=ndjson" if "?" in url else url + "?format=ndjson")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()]
+
+def csv_rows(client, url):
+    response = client.get(url + "&format=csv" if "?" in url else url + "?format=csv")
+    assert response.status_code == 200
+    assert 'filename="' in response.headers["content-disposition"]
+    return list(csv.DictReader(io.StringIO(response.text)))
+
+def test_sales_export_has_every_matching_sale_in_order(db, client, monkeypatch):
+    # several chunks, written to the response one by one
+    monkeypatch.setattr(export, "EXPORT_CHUNK_SIZE", 10)
+    url = f"/export/sales?start_date={YEAR}-04-01&end_date={YEAR}-06-30&salesperson_id=2"
+    rows = ndjson_rows(client, url)
+    expected = db.query(models.Sale).filter(
+        models.Sale.sales_date.between(date(YEAR, 4, 1), date(YEAR, 6, 30)), models.Sale.salesperson_id == 2
+    ).order_by(models.Sale.id).all()
+    assert len(expected) > 10
+    assert [row["sale_id"] for row in rows] == [sale.id for sale in expected]
+    for row, sale in zip(rows, expected):
+        price = sale.unit_price * (1 - sale.discount_percentage / 100)
+        assert row["sales_date"] == sale.sales_date.isoformat()
+        assert row["sale_price"] == pytest.approx(round(price, 2), abs=0.006)
+        assert row["commission"] == pytest.approx(round(price * sale.commission_percentage / 100, 2), abs=0.006)
+
+def test_csv_and_ndjson_have_the_same_rows(db, client):
+    url = f"/export/sales?product_id=3&end_date={YEAR}-12-31"
+    as_json = ndjson_rows(client, url)
+    as_csv = csv_rows(client, url)
+    assert list(as_csv[0]) == list(as_json[0])
+    assert as_csv == [{key: "" if value is None else str(value) for key, value in row.items()} for row in as_json]
+
+@pytest.mark.parametrize("quarter", [0, 2])
+def test_commission_report_export_matches_the_report(db, client, quarter):
+    start, end = commission_report.get_report_date_range(YEAR, quarter)
+    rows = ndjson_rows(client, f"/export/commission_report?start_date={start}&end_date={end}")
+    assert rows == commission_report.compute_commission_report(db, YEAR, quarter)
+
+    rows = ndjson_rows(client, f"/export/commission_report?start_date={start}&end_date={end}&salesperson_id=3")
+    assert rows == [row for row in commission_report.compute_commission_report(db, YEAR, quarter)
+                    if row["salesperson_id"] == 3]
+
+def test_unknown_format_is_refused(client):
+    assert client.get("/export/sales?format=xml").status_code == 422
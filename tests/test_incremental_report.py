@@ -0,0 +1,76 @@
+"""
+The incremental commission report against a full recompute, after random sale edits.
+"""
+
+import random
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import delete, func, select
+import models, schemas, crud, commission_report, incremental_report
+
+LAST_YEAR = date.today().year - 1
+PERIODS = [(0, 0), (LAST_YEAR, 0), (LAST_YEAR, 2), (LAST_YEAR - 1, 4), (LAST_YEAR - 2, 1)]
+
+def random_sale(rng: random.Random):
+    return schemas.SaleCreate(
+        product_id=rng.randint(1, 20), salesperson_id=rng.randint(1, 8), customer_id=rng.randint(1, 200),
+        sales_date=date(LAST_YEAR - 2, 1, 1) + timedelta(days=rng.randrange(3 * 365))
+    )
+
+def random_edit(db, rng: random.Random):
+    max_id = db.scalar(select(func.max(models.Sale.id)))
+    action = rng.choice(["create", "update", "delete", "delete newest"])
+    try:
+        if action == "create":
+            crud.create_sale(db, random_sale(rng))
+        elif action == "update":
+            crud.update_sale(db, rng.randint(1, max_id), random_sale(rng))
+        elif action == "delete":
+            sale = crud.get_sale(db, rng.randint(1, max_id))
+            if sale:
+                crud.delete_sale(db, sale)
+                db.commit()
+        else:
+            # SQLite hands the id of the newest sale out again to the next one
+            crud.delete_sale(db, crud.get_sale(db, max_id))
+            db.commit()
+            crud.create_sale(db, random_sale(rng))
+    except ValueError:
+        # out of stock
+        db.rollback()
+
+# every round edits sales and reads reports again
+@pytest.mark.allow_n_plus_one
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_incremental_matches_full_recompute(db, seed):
+    rng = random.Random(seed)
+    for period in PERIODS:
+        incremental_report.compute_commission_report(db, *period)
+
+    for _ in range(15):
+        for _ in range(rng.randint(1, 8)):
+            random_edit(db, rng)
+        for period in rng.sample(PERIODS, 3):
+            assert incremental_report.compute_commission_report(db, *period) == \
+                commission_report.compute_commission_report(db, *period)
+
+    # only the log entries from the oldest report's mark on are kept
+    oldest_mark = min(state.max_change_id for state in incremental_report.incremental_totals.values())
+    assert oldest_mark > 1
+    assert db.scalar(select(func.min(models.SaleChange.id))) == oldest_mark
+
+@pytest.mark.allow_n_plus_one
+def test_log_pruned_elsewhere_means_a_full_recompute(db):
+    rng = random.Random(4)
+    incremental_report.compute_commission_report(db, 0, 0)
+    for _ in range(10):
+        random_edit(db, rng)
+    # another process, further along, pruned the changes this one hasn't read
+    newest = db.scalar(select(func.max(models.SaleChange.id)))
+    db.execute(delete(models.SaleChange).where(models.SaleChange.id < newest))
+    db.commit()
+    for _ in range(5):
+        random_edit(db, rng)
+
+    assert incremental_report.compute_commission_report(db, 0, 0) == \
+        commission_report.compute_commission_report(db, 0, 0)
@@ -0,0 +1,33 @@
+"""
+The n_plus_one plugin, run by pytester on a test file of its own.
+"""
+
+import pytest
+
+TESTS = '''
+import pytest
+from database import SessionLocal
+import crud
+
+def product_names(load):
+    with SessionLocal() as db:
+        return [sale.product.name for sale in crud.get_sales_page(db, limit=20, load=load)[0]]
+
+def test_lazy_loop():
+    product_names("lazy")
+
+@pytest.mark.allow_n_plus_one
+def test_lazy_loop_allowed():
+    product_names("lazy")
+
+def test_joined():
+    product_names("joined")
+'''
+
+# the inner tests' queries run within this one
+@pytest.mark.allow_n_plus_one
+def test_plugin_fails_a_lazy_load_loop(db, pytester):
+    pytester.makepyfile(TESTS)
+    result = pytester.runpytest_inprocess("-p", "n_plus_one")
+    result.assert_outcomes(passed=2, failed=1)
+    result.stdout.fnmatch_lines(["*Possible N+1*", "FAILED *::test_lazy_loop - *"])
@@ -0,0 +1,73 @@
+"""
+Keyset pagination: pages cover every row once in id order, and the last page
+says so.
+"""
+
+from datetime import date
+import pytest
+from fastapi.testclient import TestClient
+import app, crud, models, schemas
+from n_plus_one import not_checked
+
+PAGE_FUNCTIONS = [
+    (models.Product, crud.get_products_page),
+    (models.Salesperson, crud.get_salespersons_page),
+    (models.Customer, crud.get_customers_page),
+    (models.Sale, crud.get_sales_page),
+    (models.Discount, crud.get_discounts_page),
+]
+
+def all_pages(get_page, limit):
+    pages, after_id = [], 0
+    while after_id is not None:
+        rows, after_id = get_page(after_id, limit)
+        pages.append([row.id for row in rows])
+    return pages
+
+@pytest.mark.parametrize("model, get_page", PAGE_FUNCTIONS)
+def test_pages_cover_every_row_once_in_id_order(db, model, get_page):
+    ids = [row_id for (row_id,) in db.query(model.id).order_by(model.id)]
+    with not_checked():
+        pages = all_pages(lambda after_id, limit: get_page(db, after_id, limit), 7)
+    assert [row_id for page in pages for row_id in page] == ids
+    assert all(len(page) == 7 for page in pages[:-1])
+    assert 0 < len(pages[-1]) <= 7
+
+def test_last_page_boundaries(db):
+    count = db.query(models.Product).count()
+    last_id = db.query(models.Product.id).order_by(models.Product.id.desc()).first()[0]
+
+    # a page that ends exactly on the last row is the last page, with no empty page after it
+    rows, next_after_id = crud.get_products_page(db, 0, count)
+    assert len(rows) == count and next_after_id is None
+    rows, next_after_id = crud.get_products_page(db, 0, count - 1)
+    assert next_after_id == rows[-1].id
+    assert [row.id for row in crud.get_products_page(db, next_after_id, count - 1)[0]] == [last_id]
+    assert crud.get_products_page(db, last_id) == ([], None)
+
+def test_page_size_is_clamped(db):
+    assert len(crud.get_sales_page(db, 0, 0)[0]) == 1
+    assert len(crud.get_sales_page(db, 0, crud.MAX_PAGE_SIZE + 100)[0]) == crud.MAX_PAGE_SIZE
+
+def test_pages_skip_deleted_rows_and_keep_their_place(db):
+    _, next_after_id = crud.get_discounts_page(db, 0, 5)
+    # a row deleted before the next page is read doesn't shift it
+    crud.delete_discount(db, crud.get_discount(db, next_after_id + 1))
+    rows, _ = crud.get_discounts_page(db, next_after_id, 5)
+    assert [row.id for row in rows] == [next_after_id + 2 + i for i in range(5)]
+    # a row added meanwhile appears on the last page, not in the middle
+    added = crud.create_discount(db, schemas.DiscountCreate(
+        product_id=1, begin_date=date(2024, 1, 1), end_date=date(2024, 1, 2), discount_percentage=10.0
+    ))
+    assert added.id in all_pages(lambda after_id, limit: crud.get_discounts_page(db, after_id, limit), 100)[-1]
+
+def test_list_pages_link_to_the_next_page(db):
+    with TestClient(app.app) as client:
+        first = client.get("/customers/?limit=10")
+        assert "?after_id=10&limit=10" in first.text
+        assert "First Page" not in first.text
+        last_id = db.query(models.Customer.id).order_by(models.Customer.id.desc()).first()[0]
+        last = client.get(f"/customers/?after_id={last_id - 3}&limit=10")
+        assert "Next Page" not in last.text and "First Page" in last.text
+        assert client.get("/customers/?limit=0").status_code == 422
+        assert client.get(f"/customers/?limit={crud.MAX_PAGE_SIZE + 1}").status_code == 422
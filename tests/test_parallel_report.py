@@ -0,0 +1,43 @@
+"""
+The parallel commission report: partitions cover every sale once, and the
+added up partial totals equal the single query's report.
+"""
+
+from datetime import date
+import pytest
+import commission_report, models, parallel_report
+
+YEAR = date.today().year - 1
+
+@pytest.mark.parametrize("partition_by", parallel_report.PARTITION_KINDS)
+def test_parallel_report_matches_the_single_query(db, partition_by):
+    for year, quarter in ((0, 0), (YEAR, 0), (YEAR, 3)):
+        assert parallel_report.compute_commission_report(db, year, quarter, workers=2, partition_by=partition_by) \
+            == commission_report.compute_commission_report(db, year, quarter)
+
+def test_salesperson_ranges_cover_every_salesperson_once(db):
+    ids = [row_id for (row_id,) in db.query(models.Salesperson.id).order_by(models.Salesperson.id)]
+    for count in (1, 3, 100):
+        ranges = parallel_report.salesperson_partitions(db, 0, 0, count)
+        assert 0 < len(ranges) <= count
+        assert (ranges[0][0], ranges[-1][1]) == (ids[0], ids[-1])
+        assert all(first <= last for first, last in ranges)
+        assert all(previous[1] + 1 == following[0] for previous, following in zip(ranges, ranges[1:]))
+
+def test_quarter_ranges_cover_the_period(db):
+    assert parallel_report.quarter_partitions(db, YEAR, 2) == [commission_report.get_report_date_range(YEAR, 2)]
+    assert parallel_report.quarter_partitions(db, YEAR, 0) == \
+        [commission_report.get_report_date_range(YEAR, q) for q in range(1, 5)]
+    ranges = parallel_report.quarter_partitions(db, 0, 0)
+    assert all(previous[1].toordinal() + 1 == following[0].toordinal()
+               for previous, following in zip(ranges, ranges[1:]))
+
+def test_partial_totals_are_added_per_salesperson():
+    totals = {}
+    parallel_report.add_totals(totals, [(1, 2, 3_000_000, 300_000), (2, 1, 500_000, 50_000)])
+    parallel_report.add_totals(totals, [(1, 1, 1_000_001, 100_001)])
+    assert totals == {1: [3, 4_000_001, 400_001], 2: [1, 500_000, 50_000]}
+
+def test_unknown_partitioning_is_refused(db):
+    with pytest.raises(ValueError):
+        parallel_report.compute_commission_report(db, YEAR, 0, partition_by="product")
@@ -0,0 +1,95 @@
+"""
+Sales keep the price, discount and commission rate they were made with: the
+backfill prices sales inserted outside crud once, and later product or
+discount edits change neither those sales nor the reports.
+"""
+
+from datetime import date
+import pytest
+from sqlalchemy import insert
+import commission_report, crud, models, schemas
+from migrations import backfill_sale_prices
+from database import engine
+
+SALE_DATE = date(1995, 3, 10)  # before any seeded discount
+
+def pricing(db, sale_id):
+    db.expire_all()
+    sale = db.get(models.Sale, sale_id)
+    return sale.unit_price, sale.discount_percentage, sale.commission_percentage
+
+def insert_unpriced_sale(db, product_id, sales_date=SALE_DATE):
+    # the way seed_data.py and imports insert sales, without crud
+    sale_id = db.execute(insert(models.Sale).values(
+        product_id=product_id, salesperson_id=1, customer_id=1, sales_date=sales_date
+    ).returning(models.Sale.id)).scalar_one()
+    db.commit()
+    return sale_id
+
+def product_form(product, **changes):
+    return schemas.ProductCreate(**{
+        "name": product.name, "manufacturer": product.manufacturer, "style": product.style,
+        "purchase_price": product.purchase_price, "sale_price": product.sale_price,
+        "qty_on_hand": product.qty_on_hand, "commission_percentage": product.commission_percentage,
+        **changes
+    })
+
+def test_backfill_prices_sales_from_the_product_and_discount_of_the_day(db):
+    product = crud.get_product(db, 1)
+    for percentage in (30.0, 20.0):  # overlapping, the first one applies
+        crud.create_discount(db, schemas.DiscountCreate(
+            product_id=1, begin_date=SALE_DATE, end_date=SALE_DATE, discount_percentage=percentage
+        ))
+    discounted = insert_unpriced_sale(db, 1)
+    full_price = insert_unpriced_sale(db, 1, date(1995, 3, 11))
+
+    assert backfill_sale_prices(engine, batch_size=7) == 2
+    assert pricing(db, discounted) == (product.sale_price, 30.0, product.commission_percentage)
+    assert pricing(db, full_price) == (product.sale_price, 0.0, product.commission_percentage)
+    # sales already priced are left alone
+    assert backfill_sale_prices(engine) == 0
+
+@pytest.mark.skipif(engine.dialect.name != "sqlite", reason="other databases enforce the foreign key")
+def test_sales_of_missing_products_stay_unpriced(db):
+    sale_id = insert_unpriced_sale(db, 10_000)
+    assert backfill_sale_prices(engine) == 0
+    assert pricing(db, sale_id) == (None, None, None)
+
+@pytest.mark.allow_n_plus_one  # a series of separate writes, each read back
+def test_product_and_discount_edits_keep_historical_pricing(db):
+    product = crud.get_product(db, 1)
+    price, commission = product.sale_price, product.commission_percentage
+    discount = crud.create_discount(db, schemas.DiscountCreate(
+        product_id=1, begin_date=SALE_DATE, end_date=SALE_DATE, discount_percentage=10.0
+    ))
+    made_by_crud = crud.create_sale(db, schemas.SaleCreate(
+        product_id=1, salesperson_id=1, customer_id=1, sales_date=SALE_DATE
+    )).id
+    backfilled = insert_unpriced_sale(db, 1)
+    backfill_sale_prices(engine)
+    before = {sale_id: pricing(db, sale_id) for sale_id in (made_by_crud, backfilled)}
+    assert before[made_by_crud] == before[backfilled] == (price, 10.0, commission)
+    commission_report.rebuild_commission_rollup(db)
+    report = commission_report.generate_commission_report(db, 1995, 1)
+
+    crud.update_product(db, 1, product_form(product, sale_price=price * 2, commission_percentage=50.0))
+    crud.update_discount(db, discount.id, schemas.DiscountCreate(
+        product_id=1, begin_date=SALE_DATE, end_date=SALE_DATE, discount_percentage=40.0
+    ))
+    assert {sale_id: pricing(db, sale_id) for sale_id in before} == before
+    assert commission_report.generate_commission_report(db, 1995, 1) == report
+    assert commission_report.compute_commission_report(db, 1995, 1) == report
+
+    # a new sale uses the new pricing, and so does moving an old one to another day
+    new_sale = crud.create_sale(db, schemas.SaleCreate(
+        product_id=1, salesperson_id=1, customer_id=1, sales_date=SALE_DATE
+    )).id
+    assert pricing(db, new_sale) == (price * 2, 40.0, 50.0)
+    crud.update_sale(db, made_by_crud, schemas.SaleCreate(
+        product_id=1, salesperson_id=2, customer_id=1, sales_date=SALE_DATE
+    ))
+    assert pricing(db, made_by_crud) == before[made_by_crud]
+    crud.update_sale(db, made_by_crud, schemas.SaleCreate(
+        product_id=1, salesperson_id=2, customer_id=1, sales_date=date(1995, 3, 11)
+    ))
+    assert pricing(db, made_by_crud) == (price * 2, 0.0, 50.0)
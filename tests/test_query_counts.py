@@ -0,0 +1,83 @@
+"""
+Statements run by the list and detail pages, which must not grow with the rows shown.
+"""
+
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import inspect
+from fastapi.testclient import TestClient
+import app, crud, metrics
+from n_plus_one import not_checked
+
+@contextmanager
+def count_statements():
+    """
+    Counts the statements run in the block, with the per-request stats of metrics.py.
+    """
+    stats = metrics.RequestStats()
+    token = metrics.current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        metrics.current_stats.reset(token)
+
+def show_sales(sales):
+    # what the sales templates read from every row
+    return [(sale.product.name, sale.salesperson.first_name, sale.customer.first_name) for sale in sales]
+
+@pytest.mark.parametrize("load, statements", [("joined", 1), ("selectin", 4)])
+def test_sales_page_statements(db, load, statements):
+    for limit in (10, 100):
+        # nothing already loaded in the session
+        db.expunge_all()
+        with count_statements() as stats:
+            sales, _ = crud.get_sales_page(db, limit=limit, load=load)
+            show_sales(sales)
+        assert len(sales) == limit
+        assert stats.sql_count == statements
+
+@pytest.mark.parametrize("load", ["joined", "selectin"])
+def test_loading_profiles_load_the_same_sales_and_relationships(db, load):
+    with not_checked():
+        expected = show_sales(crud.get_sales_page(db, limit=50, load="lazy")[0])
+    db.expunge_all()
+    sales, _ = crud.get_sales_page(db, limit=50, load=load)
+    for sale in sales:
+        assert not {"product", "salesperson", "customer"} & inspect(sale).unloaded
+    assert show_sales(sales) == expected
+    # the page doesn't need the session any more
+    db.expunge_all()
+    assert show_sales(sales) == expected
+
+def test_unknown_loading_profile_is_refused(db):
+    with pytest.raises(ValueError):
+        crud.get_sales_page(db, load="eager")
+
+def test_discounts_page_loads_the_products(db):
+    db.expunge_all()
+    with count_statements() as stats:
+        discounts, _ = crud.get_discounts_page(db, limit=40, load="joined")
+        names = [discount.product.name for discount in discounts]
+    assert stats.sql_count == 1 and all(names)
+
+@pytest.mark.parametrize("load, statements", [("joined", 1), ("selectin", 4)])
+def test_sale_detail_statements(db, load, statements):
+    with count_statements() as stats:
+        show_sales([crud.get_sale(db, 1, load=load)])
+    assert stats.sql_count == statements
+
+@pytest.mark.allow_n_plus_one
+def test_lazy_loading_grows_with_the_page(db):
+    with count_statements() as stats:
+        show_sales(crud.get_sales_page(db, limit=100, load="lazy")[0])
+    assert stats.sql_count > 4
+
+def test_page_statements(db):
+    with TestClient(app.app) as client:
+        # the edit form's pickers read the cached reference lists, loaded once
+        client.get("/sales/1/edit/")
+        for url in ("/sales/?limit=10", "/sales/?limit=200", "/sales/?after_id=100&limit=50",
+                    "/discounts/?limit=40", "/sales/2/edit/", "/sales/3/edit/"):
+            response = client.get(url)
+            assert response.status_code == 200
+            assert 'desc="1 queries"' in response.headers["server-timing"], url
@@ -0,0 +1,28 @@
+"""
+EXPLAIN QUERY PLAN of the report and discount lookups (SQLite).
+"""
+
+import pytest
+from sqlalchemy import inspect
+from database import engine
+import migrations
+
+pytestmark = pytest.mark.skipif(engine.dialect.name != "sqlite", reason="SQLite query plans")
+
+@pytest.mark.parametrize("name", list(migrations.hot_path_queries()))
+def test_hot_path_uses_an_index(db, name):
+    with engine.connect() as conn:
+        plan = migrations.explain_query_plan(conn, migrations.hot_path_queries()[name])
+    assert plan
+    assert [step for step in plan if step.startswith(("SCAN sales", "SCAN discounts"))] == []
+
+def test_check_query_plans(db):
+    assert set(migrations.check_query_plans(engine)) == set(migrations.hot_path_queries())
+
+def test_migrations_drop_the_redundant_sales_date_index(db):
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_sales_sales_date ON sales (sales_date)")
+    migrations.run_migrations(engine)
+    indexes = {index["name"] for index in inspect(engine).get_indexes("sales")}
+    assert "ix_sales_sales_date" not in indexes
+    assert "ix_sales_sales_date_pricing" in indexes
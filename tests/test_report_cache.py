@@ -0,0 +1,92 @@
+"""
+The report cache: a write evicts only the reports that include its sales, on
+commit, with either backend.
+"""
+
+from datetime import date
+import pytest
+import commission_report, crud, schemas
+from n_plus_one import not_checked
+import report_cache as report_cache_module
+from report_cache import MemoryReportCache, SqliteReportCache, invalidate_quarters_on_commit
+
+YEAR = date.today().year - 1
+CACHED_KEYS = [(YEAR, 1), (YEAR, 2), (YEAR, 3), (YEAR, 0), (YEAR - 1, 2), (YEAR - 1, 0), (0, 0)]
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path, monkeypatch):
+    if request.param == "sqlite":
+        cache = SqliteReportCache(str(tmp_path / "report_cache.db"))
+    else:
+        cache = MemoryReportCache()
+    monkeypatch.setattr(report_cache_module, "report_cache", cache)
+    monkeypatch.setattr(commission_report, "report_cache", cache)
+    return cache
+
+def fill(db):
+    with not_checked():
+        for year, quarter in CACHED_KEYS:
+            commission_report.get_commission_report(db, year, quarter)
+
+def cached_keys():
+    return [key for key in CACHED_KEYS if commission_report.cached_commission_report(*key) is not None]
+
+def sale_on(sales_date):
+    return schemas.SaleCreate(product_id=1, salesperson_id=1, customer_id=1, sales_date=sales_date)
+
+def test_a_sale_evicts_its_quarter_year_and_all_years(db, cache):
+    fill(db)
+    assert cached_keys() == CACHED_KEYS
+    crud.create_sale(db, sale_on(date(YEAR, 5, 5)))
+    assert cached_keys() == [(YEAR, 1), (YEAR, 3), (YEAR - 1, 2), (YEAR - 1, 0)]
+
+    # recomputed on the next read, and the kept reports are still current
+    with not_checked():
+        for key in CACHED_KEYS:
+                assert commission_report.get_commission_report(db, *key)[0] == \
+                commission_report.generate_commission_report(db, *key)
+
+def test_moving_and_deleting_a_sale_evict_the_quarters_it_was_in(db, cache):
+    sale = crud.create_sale(db, sale_on(date(YEAR - 1, 5, 5)))
+    fill(db)
+    crud.update_sale(db, sale.id, sale_on(date(YEAR, 8, 8)))
+    assert cached_keys() == [(YEAR, 1), (YEAR, 2)]
+
+    fill(db)
+    crud.delete_sale(db, crud.get_sale(db, sale.id))
+    assert len(cached_keys()) == len(CACHED_KEYS)
+    # the caller commits a delete, like the routes
+    db.commit()
+    assert cached_keys() == [(YEAR, 1), (YEAR, 2), (YEAR - 1, 2), (YEAR - 1, 0)]
+
+def test_nothing_is_evicted_before_the_commit_or_on_rollback(db, cache):
+    fill(db)
+    invalidate_quarters_on_commit(db, [(YEAR, 1)])
+    assert cached_keys() == CACHED_KEYS
+    db.rollback()
+    db.commit()
+    assert cached_keys() == CACHED_KEYS
+
+def test_renaming_a_salesperson_evicts_every_report(db, cache):
+    fill(db)
+    salesperson = crud.get_salesperson(db, 1)
+    crud.update_salesperson(db, 1, schemas.SalespersonCreate(
+        first_name="Renamed", last_name=salesperson.last_name, address=salesperson.address,
+        phone=salesperson.phone, start_date=salesperson.start_date, manager=salesperson.manager
+    ))
+    assert cached_keys() == []
+
+def test_a_report_computed_during_a_write_is_not_stored(db, cache):
+    generation = cache.generation()
+    report = commission_report.generate_commission_report(db, YEAR, 1)
+    crud.create_sale(db, sale_on(date(YEAR, 2, 2)))
+    cache.set((YEAR, 1), report, generation)
+    assert cached_keys() == []
+
+def test_least_recently_used_reports_are_evicted(db, cache):
+    cache.max_size = 2
+    commission_report.get_commission_report(db, YEAR, 1)
+    commission_report.get_commission_report(db, YEAR, 2)
+    assert commission_report.get_commission_report(db, YEAR, 1)[1]
+    commission_report.get_commission_report(db, YEAR, 3)
+    assert cached_keys() == [(YEAR, 1), (YEAR, 3)]
@@ -0,0 +1,132 @@
+"""
+The report job queue: jobs run to the report, report progress, can be cancelled,
+are reused while current and never left queued by a stopped server.
+"""
+
+import os
+import threading
+import time
+from datetime import date
+import pytest
+import report_jobs, schemas, crud, commission_report
+from report_jobs import JobQueueFull, JobStore, ReportJobQueue
+
+LAST_YEAR = date.today().year - 1
+
+@pytest.fixture
+def queue(db, tmp_path):
+    queue = ReportJobQueue(JobStore(str(tmp_path / "report_jobs.db")), workers=1)
+    yield queue
+    queue.shutdown()
+
+@pytest.fixture
+def blocked(monkeypatch):
+    """
+    Jobs wait until release is set before computing, so others stay queued.
+    """
+    release = threading.Event()
+    compute_report = report_jobs.compute_report
+
+    def compute_when_released(*args, **kwargs):
+        release.wait(10)
+        return compute_report(*args, **kwargs)
+
+    monkeypatch.setattr(report_jobs, "compute_report", compute_when_released)
+    yield release
+    release.set()
+
+def wait_for(queue, job_id: str, statuses=report_jobs.FINISHED, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = queue.store.get(job_id)
+        if job["status"] in statuses or time.monotonic() > deadline:
+            return job
+        time.sleep(0.01)
+
+@pytest.mark.parametrize("source", report_jobs.SOURCES)
+def test_submitted_job_computes_the_report(db, queue, source):
+    job_id, created = queue.submit(LAST_YEAR, 2, source)
+    assert created
+
+    job = wait_for(queue, job_id)
+    assert (job["status"], job["progress"], job["error"]) == ("done", 1, None)
+    assert job["result"] == commission_report.compute_commission_report(db, LAST_YEAR, 2)
+
+def test_progress_moves_after_every_step(db, queue, monkeypatch):
+    progress = []
+    set_progress = queue.store.set_progress
+
+    def record(job_id, fraction):
+        progress.append(fraction)
+        return set_progress(job_id, fraction)
+
+    monkeypatch.setattr(queue.store, "set_progress", record)
+    job_id, _ = queue.submit(LAST_YEAR, 0, "live")
+    assert wait_for(queue, job_id)["status"] == "done"
+    assert len(progress) > 1
+    assert progress == sorted(progress) and progress[-1] == 1
+
+def test_cancel_queued_and_running_jobs(db, queue, blocked):
+    running, _ = queue.submit(LAST_YEAR, 1, "live")
+    queued, _ = queue.submit(LAST_YEAR, 2, "live")
+    assert wait_for(queue, running, ("running",))["status"] == "running"
+
+    # a queued job is cancelled at once, a running one at its next step
+    assert queue.store.cancel(queued)
+    assert queue.store.get(queued)["status"] == "cancelled"
+    assert queue.store.cancel(running)
+    blocked.set()
+    assert wait_for(queue, running)["status"] == "cancelled"
+    assert wait_for(queue, queued)["status"] == "cancelled"
+    # finished jobs can't be cancelled, and a new submit doesn't reuse them
+    assert not queue.store.cancel(running)
+    assert queue.submit(LAST_YEAR, 1, "live")[0] != running
+
+def test_submitting_is_refused_when_too_many_jobs_wait(db, queue, blocked, monkeypatch):
+    monkeypatch.setattr(report_jobs, "REPORT_JOB_MAX_PENDING", 2)
+    queue.submit(LAST_YEAR, 1, "live")
+    queue.submit(LAST_YEAR, 2, "live")
+    with pytest.raises(JobQueueFull):
+        queue.submit(LAST_YEAR, 3, "live")
+    # the same report is still answered by its unfinished job
+    assert not queue.submit(LAST_YEAR, 2, "live")[1]
+
+def test_jobs_are_reused_until_the_data_changes(db, queue):
+    job_id, created = queue.submit(LAST_YEAR, 2, "rollup")
+    assert queue.submit(LAST_YEAR, 2, "rollup") == (job_id, False)
+    assert wait_for(queue, job_id)["status"] == "done"
+    assert queue.submit(LAST_YEAR, 2, "rollup") == (job_id, False)
+
+    crud.create_sale(db, schemas.SaleCreate(
+        product_id=1, salesperson_id=1, customer_id=1, sales_date=date(LAST_YEAR, 5, 5)
+    ))
+    new_id, created = queue.submit(LAST_YEAR, 2, "rollup")
+    assert created and new_id != job_id
+    assert wait_for(queue, new_id)["result"] == commission_report.compute_commission_report(db, LAST_YEAR, 2)
+
+def test_shutdown_fails_the_jobs_it_will_not_run(db, queue, blocked):
+    running, _ = queue.submit(LAST_YEAR, 1, "live")
+    queued, _ = queue.submit(LAST_YEAR, 2, "live")
+    wait_for(queue, running, ("running",))
+
+    queue.shutdown()
+    job = queue.store.get(queued)
+    assert (job["status"], job["error"]) == ("failed", report_jobs.STOPPED_ERROR)
+    blocked.set()
+    assert wait_for(queue, running)["status"] == "cancelled"
+
+    # submitting again starts a new job instead of handing out the dead one
+    job_id, created = queue.submit(LAST_YEAR, 2, "live")
+    assert created and job_id != queued
+    assert wait_for(queue, job_id)["status"] == "done"
+
+def test_jobs_of_an_earlier_start_with_the_same_pid_are_failed(db, queue, monkeypatch):
+    # queued by a server that stopped without a shutdown, restarted under the same pid
+    monkeypatch.setattr(report_jobs, "RUN_ID", "earlier start")
+    job_id, _ = queue.store.find_or_add(LAST_YEAR, 2, "live", report_jobs.data_version())
+    monkeypatch.setattr(report_jobs, "RUN_ID", "this start")
+    assert queue.store.get(job_id)["owner_pid"] == os.getpid()
+
+    new_id, created = queue.submit(LAST_YEAR, 2, "live")
+    assert created and new_id != job_id
+    assert queue.store.get(job_id)["status"] == "failed"
@@ -0,0 +1,19 @@
+"""
+Errors of the report job endpoints, in the app and api_test.py.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from report_jobs import JobQueueFull, report_jobs
+import app, api_test
+
+@pytest.mark.parametrize("module", [app, api_test])
+@pytest.mark.parametrize("error, status", [(ValueError("bad report"), 400), (JobQueueFull("queue full"), 429)])
+def test_submit_errors(db, monkeypatch, module, error, status):
+    def submit(year, quarter, source):
+        raise error
+    monkeypatch.setattr(report_jobs, "submit", submit)
+
+    response = TestClient(module.app).post("/jobs/commission_report?year=2024&quarter=1")
+    assert response.status_code == status
+    assert str(error) in response.text
@@ -0,0 +1,81 @@
+"""
+The daily sales rollup crud keeps current, against a rebuild from the sales table.
+"""
+
+from datetime import date
+import pytest
+from n_plus_one import not_checked
+import models, schemas, crud, commission_report, sales_analytics
+
+LAST_YEAR = date.today().year - 1
+
+def rollup_rows(db):
+    return {
+        (row.dimension, row.group_key, row.sales_date): (
+            row.num_sales, row.list_amount, row.total_sales_amount, row.total_commission
+        )
+        for row in db.query(models.DailySalesRollup)
+    }
+
+def assert_rollup_current(db):
+    """
+    The rollup rows crud left behind are those a full rebuild computes.
+    """
+    kept = rollup_rows(db)
+    with not_checked():
+        sales_analytics.rebuild_daily_rollup(db)
+    rebuilt = rollup_rows(db)
+    assert kept == rebuilt
+
+def test_bulk_sales_on_one_day_over_several_chunks(db):
+    # more sales of the same products and salespersons on one day than one
+    # CHUNK_SIZE of ids, so several chunks add to the same new rollup rows
+    sales_date = date(date.today().year + 1, 3, 3)
+    sales = [
+        schemas.SaleCreate(product_id=1 + i % 3, salesperson_id=1 + i % 2, customer_id=1, sales_date=sales_date)
+        for i in range(sales_analytics.CHUNK_SIZE + 500)
+    ]
+    result = crud.create_sales_bulk(db, sales)
+    assert result == {"created": len(sales), "errors": []}
+
+    day = db.get(models.DailySalesRollup, ("all", "", sales_date))
+    assert day.num_sales == len(sales)
+    assert_rollup_current(db)
+
+def test_update_and_delete_move_sales_between_days(db):
+    sale = crud.create_sale(db, schemas.SaleCreate(
+        product_id=1, salesperson_id=1, customer_id=1, sales_date=date(date.today().year + 1, 1, 5)
+    ))
+    crud.update_sale(db, sale.id, schemas.SaleCreate(
+        product_id=2, salesperson_id=2, customer_id=1, sales_date=date(date.today().year + 1, 2, 6)
+    ))
+    crud.delete_sale(db, crud.get_sale(db, 1))
+    db.commit()
+    assert_rollup_current(db)
+
+@pytest.mark.parametrize("year, quarter", [(LAST_YEAR, 0), (LAST_YEAR, 2), (LAST_YEAR - 2, 4)])
+def test_commission_series_adds_up_to_the_commission_report(db, year, quarter):
+    # a few edits first, so the rollup rows were added to and taken from
+    with not_checked():
+        for day in range(1, 6):
+            crud.create_sale(db, schemas.SaleCreate(
+                product_id=day, salesperson_id=day, customer_id=1, sales_date=date(year, 3 * max(quarter, 1), day)
+            ))
+        crud.update_sale(db, 7, schemas.SaleCreate(
+            product_id=3, salesperson_id=2, customer_id=1, sales_date=date(year, 3 * max(quarter, 1), 9)
+        ))
+
+    start, end = commission_report.get_report_date_range(year, quarter)
+    series = sales_analytics.sales_series(
+        db, start, end, bucket="year", group_by="salesperson", limit=sales_analytics.MAX_SERIES_LIMIT
+    )["series"]
+    from_series = {
+        line["key"]: (line["points"][0]["num_sales"], line["points"][0]["total_sales_amount"],
+                      line["points"][0]["total_commission"])
+        for line in series
+    }
+    report = commission_report.compute_commission_report(db, year, quarter)
+    assert from_series == {
+        row["salesperson_id"]: (row["num_sales"], row["total_sales_amount"], row["total_commission"])
+        for row in report if row["num_sales"]
+    }
@@ -0,0 +1,65 @@
+"""
+Search ranking and the prefix lookup of short terms.
+"""
+
+from datetime import date
+import pytest
+from n_plus_one import not_checked
+import schemas, crud, search
+
+def add_product(db, name: str):
+    return crud.create_product(db, schemas.ProductCreate(
+        name=name, manufacturer="test", style="road", purchase_price=100.0,
+        sale_price=200.0, qty_on_hand=10, commission_percentage=10.0
+    ))
+
+def names(results):
+    return [result["name"] for result in results]
+
+@pytest.fixture(params=["fts", "like"])
+def index(request, monkeypatch):
+    if request.param == "like":
+        monkeypatch.setattr(search, "has_fts", lambda db, entity: False)
+    return request.param
+
+def test_best_matches_come_before_the_candidate_cap(db, index):
+    # many weaker matches with lower ids than the best ones
+    with not_checked():
+        for i in range(30):
+            add_product(db, f"alloy qwxbolt {i:02d}")
+        for i in range(5):
+            add_product(db, f"alloy qwxbolt{i} frame")
+        add_product(db, "qwxbolt frame long")
+        add_product(db, "qwxbolt")
+
+    results = search.search(db, "qwxbolt", ["products"], limit=4, candidates=4)
+    assert names(results) == ["qwxbolt", "qwxbolt frame long", "alloy qwxbolt 00", "alloy qwxbolt 01"]
+    # a short term filters the matches of the long one
+    assert names(search.search(db, "qwxbolt 3", ["products"], candidates=4)) == [
+        "alloy qwxbolt 03", "alloy qwxbolt 13", "alloy qwxbolt 23", "alloy qwxbolt3 frame"
+    ]
+
+@pytest.mark.parametrize("query, found", [
+    ("qs", True), ("QS", True), ("zo qs", True), ("98", True),
+    # inside a word, or not the start of every term
+    ("mi", False), ("zo mi", False), ("01", False)
+])
+def test_short_terms_match_the_start_of_names_and_phones(db, query, found):
+    customer = crud.create_customer(db, schemas.CustomerCreate(
+        first_name="Zoe", last_name="Qsmith", address="1 test st", phone="987-0001", start_date=date(2020, 1, 1)
+    ))
+    expected = [{"entity": "customers", "id": customer.id, "name": "Zoe Qsmith", "detail": "987-0001"}]
+    assert search.search(db, query, ["customers"]) == (expected if found else [])
+
+def test_broad_queries_still_rank_exact_and_prefix_matches_first(db, index, monkeypatch):
+    # more weaker matches than are scanned, all with lower ids
+    monkeypatch.setattr(search, "SEARCH_SCAN", 5)
+    with not_checked():
+        for i in range(12):
+            add_product(db, f"alloy qwxzap {i:02d}")
+        add_product(db, "qwxzap frame")
+        add_product(db, "qwxzap")
+
+    assert names(search.search(db, "qwxzap", ["products"], limit=3)) == [
+        "qwxzap", "qwxzap frame", "alloy qwxzap 00"
+    ]
@@ -0,0 +1,108 @@
+"""
+The Parquet snapshot: refreshes append only new sales, and a refresh stopped
+at any point is finished or redone by the next one without duplicating sales.
+"""
+
+import os
+from datetime import date
+import pytest
+import commission_report, crud, models, schemas
+
+pytest.importorskip("duckdb")
+pytest.importorskip("pyarrow")
+import snapshot
+from database import engine
+
+YEAR = date.today().year - 1
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / "snapshot")
+
+def exported_ids(directory):
+    con = snapshot.connect(directory)
+    try:
+        return [row_id for (row_id,) in con.execute("SELECT sale_id FROM sales ORDER BY sale_id").fetchall()]
+    finally:
+        con.close()
+
+def priced_ids(db):
+    return [row_id for (row_id,) in db.query(models.Sale.id).filter(
+        models.Sale.unit_price.is_not(None), models.Sale.sales_date.is_not(None)
+    ).order_by(models.Sale.id)]
+
+def add_sales(db, count):
+    for day in range(1, count + 1):
+        crud.create_sale(db, schemas.SaleCreate(
+            product_id=1, salesperson_id=1, customer_id=1, sales_date=date(YEAR, 4, day)
+        ))
+
+def assert_matches_the_database(db, directory):
+    assert exported_ids(directory) == priced_ids(db)
+    for year, quarter in ((0, 0), (YEAR, 0), (YEAR, 2)):
+        assert snapshot.snapshot_commission_report(year, quarter, directory) == \
+            commission_report.compute_commission_report(db, year, quarter)
+
+def test_refresh_appends_only_new_sales(db, directory):
+    assert snapshot.refresh_snapshot(engine, directory) == len(priced_ids(db))
+    files = set(snapshot.sales_files(os.path.join(directory, "sales")))
+    assert_matches_the_database(db, directory)
+
+    assert snapshot.refresh_snapshot(engine, directory) == 0
+    add_sales(db, 3)
+    assert snapshot.refresh_snapshot(engine, directory) == 3
+    new_files = set(snapshot.sales_files(os.path.join(directory, "sales"))) - files
+    assert [os.path.basename(os.path.dirname(path)) for path in new_files] == ["quarter=2"]
+    assert snapshot.read_state(directory)["last_sale_id"] == priced_ids(db)[-1]
+    assert not os.path.exists(os.path.join(directory, "staging"))
+    assert_matches_the_database(db, directory)
+
+def test_full_refresh_replaces_the_files(db, directory):
+    snapshot.refresh_snapshot(engine, directory)
+    add_sales(db, 2)
+    snapshot.refresh_snapshot(engine, directory)
+    crud.delete_sale(db, crud.get_sale(db, 1))
+    db.commit()
+    assert exported_ids(directory)[0] == 1
+
+    assert snapshot.refresh_snapshot(engine, directory, full=True) == len(priced_ids(db))
+    assert {os.path.basename(path) for path in snapshot.sales_files(os.path.join(directory, "sales"))} == \
+        {f"sales-{1:012d}-{priced_ids(db)[-1]:012d}.parquet"}
+    assert_matches_the_database(db, directory)
+
+@pytest.mark.parametrize("full", [False, True])
+def test_refresh_stopped_before_the_state_is_written_is_finished(db, directory, monkeypatch, full):
+    snapshot.refresh_snapshot(engine, directory)
+    add_sales(db, 2)
+    write_state = snapshot.write_state
+
+    def stop_before_the_state(path, state, name="state.json"):
+        if name == "state.json":
+            raise KeyboardInterrupt
+        return write_state(path, state, name)
+
+    monkeypatch.setattr(snapshot, "write_state", stop_before_the_state)
+    with pytest.raises(KeyboardInterrupt):
+        snapshot.refresh_snapshot(engine, directory, full=full)
+    monkeypatch.setattr(snapshot, "write_state", write_state)
+
+    # the next run completes the stopped one, then appends what came since
+    add_sales(db, 1)
+    assert snapshot.refresh_snapshot(engine, directory) == 1
+    assert_matches_the_database(db, directory)
+
+def test_refresh_stopped_while_exporting_is_redone(db, directory, monkeypatch):
+    snapshot.refresh_snapshot(engine, directory)
+    add_sales(db, 2)
+
+    def stop(*args):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(snapshot, "write_dimension", stop)
+    with pytest.raises(KeyboardInterrupt):
+        snapshot.refresh_snapshot(engine, directory)
+    monkeypatch.undo()
+    assert os.path.exists(os.path.join(directory, "staging"))
+
+    assert snapshot.refresh_snapshot(engine, directory) == 2
+    assert_matches_the_database(db, directory)
@@ -0,0 +1,26 @@
+"""
+The NumPy commission report against the SQL one.
+"""
+
+from datetime import date
+import pytest
+from sqlalchemy import update
+import models, commission_report
+
+pytest.importorskip("numpy")
+import vectorized_report
+
+LAST_YEAR = date.today().year - 1
+
+@pytest.mark.parametrize("year, quarter", [(0, 0), (LAST_YEAR, 0), (LAST_YEAR, 2), (LAST_YEAR - 3, 4)])
+def test_matches_the_sql_report(db, year, quarter):
+    # sales recorded with a NULL rate: the amount (discount) or the commission
+    # is NULL, left out of the sums, but the sale still counts
+    db.execute(update(models.Sale).where(models.Sale.id % 50 == 0).values(discount_percentage=None))
+    db.execute(update(models.Sale).where(models.Sale.id % 70 == 0).values(commission_percentage=None))
+    db.commit()
+
+    expected = commission_report.compute_commission_report(db, year, quarter)
+    assert vectorized_report.compute_commission_report(db, year, quarter) == expected
+    # over several chunks
+    assert vectorized_report.compute_commission_report(db, year, quarter, chunk_size=97) == expected
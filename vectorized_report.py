@@ -0,0 +1,116 @@
+"""
+Commission report computed with NumPy instead of an SQL GROUP BY.
+
+The salesperson and recorded pricing of every sale in the period are fetched in
+chunks of VECTOR_CHUNK_SIZE rows, turned into column arrays, priced with
+whole-array arithmetic (the same operations, in the same order, as
+commission_report.discounted_price and sale_commission), turned into whole
+millionths of a dollar like commission_report.in_micros and added up per
+salesperson with np.bincount. Those sums are exact (well below 2**53), so the
+totals are those of commission_report.compute_commission_report.
+
+Needs the optional numpy package: pip install numpy
+Compare it with the SQL report and a per-sale Python loop:
+    python -m benchmarks.vectorized_report --sizes 1M,10M
+"""
+
+from itertools import chain
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+import models, commission_report
+
+VECTOR_CHUNK_SIZE = 100_000
+
+def pricing_query(date_range=None):
+    """
+    (salesperson_id, unit_price, discount_percentage, commission_percentage) of
+    the sales the report counts.
+    """
+    query = select(
+        models.Sale.salesperson_id,
+        models.Sale.unit_price,
+        # NULL rates are read as NaN, see in_micros
+        models.Sale.discount_percentage,
+        models.Sale.commission_percentage
+    ).where(
+        commission_report.priced_sales(),
+        models.Sale.salesperson_id.is_not(None)
+    )
+    if date_range:
+        start, end = date_range
+        query = query.where(models.Sale.sales_date >= start, models.Sale.sales_date <= end)
+    return query
+
+def column_chunks(db: Session, query, chunk_size: int = VECTOR_CHUNK_SIZE):
+    """
+    Yields (salesperson_ids, unit_prices, discount_percentages, commission_percentages)
+    arrays of up to chunk_size sales.
+    """
+    # plain tuples from a DBAPI cursor on the session's connection: building a
+    # Row object per sale costs more than all the math. PostgreSQL needs a named
+    # (server-side) cursor to stream instead of loading every row at once.
+    conn = db.connection()
+    sql = str(query.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    cursor = conn.connection.cursor(**({"name": "vectorized_report"} if conn.dialect.name == "postgresql" else {}))
+    try:
+        cursor.execute(sql)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            # one flat pass over the rows instead of an array per column
+            values = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=len(rows) * 4)
+            columns = values.reshape(-1, 4).T
+            yield columns[0].astype(np.intp), columns[1], columns[2], columns[3]
+    finally:
+        cursor.close()
+
+def salesperson_totals(db: Session, date_range=None, chunk_size: int = VECTOR_CHUNK_SIZE):
+    """
+    (num_sales, total_sales_amount, total_commission) arrays indexed by salesperson
+    id, amounts in millionths of a dollar.
+    """
+    size = (db.scalar(select(func.max(models.Salesperson.id))) or 0) + 1
+    num_sales = np.zeros(size, dtype=np.int64)
+    amounts = np.zeros(size)
+    commissions = np.zeros(size)
+
+    for salesperson_ids, unit_prices, discounts, commission_rates in column_chunks(
+        db, pricing_query(date_range), chunk_size
+    ):
+        # sales of deleted salespersons are left out by the report anyway
+        known = salesperson_ids < size
+        if not known.all():
+            salesperson_ids, unit_prices, discounts, commission_rates = (
+                column[known] for column in (salesperson_ids, unit_prices, discounts, commission_rates)
+            )
+        prices = unit_prices * (1 - discounts / 100.0)
+        num_sales += np.bincount(salesperson_ids, minlength=size)
+        amounts += np.bincount(salesperson_ids, in_micros(prices), minlength=size)
+        commissions += np.bincount(salesperson_ids, in_micros(prices * (commission_rates / 100.0)), minlength=size)
+
+    return num_sales, amounts, commissions
+
+def in_micros(amounts):
+    """
+    Whole millionths of a dollar, rounded half up like commission_report.in_micros.
+    An amount priced with a NULL rate (NaN) adds nothing, like the NULL the SQL
+    sum skips (the sale is still counted).
+    """
+    return np.nan_to_num(np.floor(amounts * commission_report.MICROS + 0.5), nan=0.0)
+
+def compute_commission_report(db: Session, year: int, quarter: int, chunk_size: int = VECTOR_CHUNK_SIZE):
+    """
+    compute_commission_report with the totals added up by NumPy.
+    """
+    date_range = commission_report.get_report_date_range(year, quarter)
+    num_sales, amounts, commissions = salesperson_totals(db, date_range, chunk_size)
+    salespersons = db.execute(
+        select(models.Salesperson.id, models.Salesperson.first_name, models.Salesperson.last_name)
+        .order_by(models.Salesperson.id)
+    ).all()
+    return commission_report.format_report(
+        (sp_id, first_name, last_name, int(num_sales[sp_id]), int(amounts[sp_id]), int(commissions[sp_id]))
+        for sp_id, first_name, last_name in salespersons
+    )